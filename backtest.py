@@ -0,0 +1,281 @@
+# backtest.py
+# -*- coding: utf-8 -*-
+"""
+Backtest vectorisé d'une ligne PAIRS_CFG sur historique OHLCV.
+
+- Indicateurs calculés UNE fois sur toute la série (RSI, lissage, Supertrend, Donchian, volume $)
+  puis règles hybrid_signal vectorisées (signals.signal_rules_arrays).
+- Boucle d'état légère (tableaux Python) pour la partie dépendante du chemin :
+  hystérésis HYST_EPS_BY_TF, SL / trailing TP par TF, cooldown, plafond BUY/24h.
+- Exécution au close de la bougie de décision, frais FEE_TAKER_PCT à l'achat et à la vente.
+
+Approximations vs live : la bougie "en cours" est assimilée à la bougie close (pas d'intra-bougie),
+le circuit breaker (autre symbole) et la limite de 3 trades/bougie ne sont pas simulés.
+
+Usage :
+    python backtest.py --csv btc_5m.csv --pair "BTC/USDT@5m=100,avg=sma,avg_period=21,rsi=21,signal=closed"
+    python backtest.py --pair "BTC/USDT@5m=2%" --days 30      # historique public Bitget
+    python backtest.py --pair "BTC/USDT@5m=2%" --days 365 --store data/ohlcv   # + archive disque réutilisée
+"""
+import argparse
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    FEE_TAKER_PCT, COOLDOWN, MAX_BUYS_PER_24H, HYST_EPS_DEFAULT, HYST_EPS_BY_TF, DEFAULT_RISK_FRACTION, OHLCV_STORE_DIR
+)
+from ohlcv_store import OHLCVStore
+from signals import (
+    compute_rsi, smooth_rsi, compute_supertrend, pick_conf_for_tf, signal_rules_arrays,
+    sl_tp_params, position_pnl
+)
+from utils import tf_to_minutes, parse_pairs_cfg
+
+log = logging.getLogger("bot")
+
+OHLCV_COLS = ["ts", "open", "high", "low", "close", "vol"]
+MIN_BUY_USDT = 1.0
+
+
+# ---------- Données ----------
+def load_ohlcv_csv(path: str) -> pd.DataFrame:
+    """CSV avec colonnes ts (ms epoch), open, high, low, close, vol."""
+    df = pd.read_csv(path)
+    return df[OHLCV_COLS]
+
+def fetch_ohlcv_history(exchange, symbol: str, tf: str, since_ms: int, until_ms: Optional[int] = None,
+                        page: int = 1000) -> pd.DataFrame:
+    """Historique paginé via fetch_ohlcv (since croissant)."""
+    from execution import with_retry
+    tf_ms = tf_to_minutes(tf) * 60_000
+    until_ms = until_ms or exchange.milliseconds()
+    rows, cursor = [], int(since_ms)
+    while cursor < until_ms:
+        batch = with_retry(exchange.fetch_ohlcv, 3, 1, symbol, timeframe=tf, since=cursor, limit=page)
+        if not batch:
+            break
+        rows.extend(r for r in batch if r[0] >= cursor)
+        nxt = int(batch[-1][0]) + tf_ms
+        if nxt <= cursor:
+            break
+        cursor = nxt
+    df = pd.DataFrame(rows, columns=OHLCV_COLS).drop_duplicates("ts").sort_values("ts")
+    return df[df["ts"] < until_ms].reset_index(drop=True)
+
+def load_history(exchange, symbol: str, tf: str, since_ms: int, store=None) -> pd.DataFrame:
+    """Historique depuis since_ms. Avec un OHLCVStore : seules les bougies absentes du store
+    (avant la première / après la dernière stockée) sont téléchargées puis archivées ;
+    le DataFrame renvoyé est adossé au store. Le store peut être celui du bot live : les
+    écritures passent par le verrou de la série (SeriesStore.append / prepend)."""
+    if store is None:
+        return fetch_ohlcv_history(exchange, symbol, tf, since_ms)
+    tf_ms = tf_to_minutes(tf) * 60_000
+    now = exchange.milliseconds()
+    until = now - now % tf_ms
+    series = store.series(symbol, tf, writable=True)
+    first, last = series.first_ts, series.last_ts
+    if first is not None and since_ms + tf_ms <= first and last >= since_ms:
+        # Backfill [since_ms, first) : la série est réécrite (append-only sinon)
+        older = fetch_ohlcv_history(exchange, symbol, tf, since_ms, until_ms=first)
+        if len(older):
+            added = series.prepend(older[OHLCV_COLS].to_numpy(dtype=float))
+            log.info(f"[STORE] {symbol}@{tf} : {added} bougies antérieures ajoutées")
+    cursor = since_ms if last is None or last < since_ms else last + tf_ms
+    if cursor + tf_ms <= now:
+        new = fetch_ohlcv_history(exchange, symbol, tf, cursor, until_ms=until)
+        series.append(new[OHLCV_COLS].to_numpy(dtype=float))
+    df = store.frame(symbol, tf, start_ts=since_ms)
+    if len(df) and int(df["ts"].iloc[0]) >= since_ms + tf_ms:
+        log.warning(f"[STORE] {symbol}@{tf} : historique disponible à partir de "
+                    f"{pd.Timestamp(int(df['ts'].iloc[0]), unit='ms', tz='UTC')} seulement (demandé depuis "
+                    f"{pd.Timestamp(since_ms, unit='ms', tz='UTC')})")
+    return df
+
+
+# ---------- Indicateurs (vectorisés, une passe) ----------
+def indicator_arrays(df: pd.DataFrame, conf: dict, avg_type: str = "ema", avg_period: int = 21,
+                     rsi_period: int = 21) -> dict:
+    """Indicateurs hybrid_signal sur toute la série + action brute par bougie."""
+    close = df["close"].astype(float)
+    rsi = compute_rsi(close, period=int(rsi_period))
+    rsi_avg = smooth_rsi(rsi, (avg_type or "ema").lower(), int(avg_period))
+    st_line, _, _ = compute_supertrend(df, conf["supertrend"]["atr_period"], conf["supertrend"]["mult"])
+
+    don_len = int(conf["donchian"]["length"])
+    don_high = df["high"].rolling(don_len, min_periods=don_len).max()
+    don_low = df["low"].rolling(don_len, min_periods=don_len).min()
+
+    dollar = close * df["vol"].astype(float)
+    avg_vol = dollar.rolling(max(int(conf["volume"]["lookback"]), 1), min_periods=1).mean()
+
+    arr = {
+        "close": close.to_numpy(np.float64),
+        "rsi": rsi.to_numpy(np.float64),
+        "rsi_avg": rsi_avg.to_numpy(np.float64),
+        "st": st_line.to_numpy(np.float64),
+        "don_high": don_high.to_numpy(np.float64),
+        "don_low": don_low.to_numpy(np.float64),
+        "avg_vol_usd": avg_vol.to_numpy(np.float64),
+        "cur_vol_usd": dollar.to_numpy(np.float64),
+    }
+    arr["action"], arr["vol_ok"] = signal_rules_arrays(
+        conf, arr["rsi"], arr["rsi_avg"], arr["close"], arr["st"],
+        arr["don_high"], arr["don_low"], arr["avg_vol_usd"], arr["cur_vol_usd"],
+    )
+    arr["warmup"] = max(don_len, int(conf["volume"]["lookback"]), int(rsi_period) + 1,
+                        int(avg_period), int(conf["supertrend"]["atr_period"]) + 1)
+    return arr
+
+
+# ---------- Simulation ----------
+def run_backtest(df: pd.DataFrame, tf: str, *, alloc: str = "100", avg_type: str = "ema", avg_period: int = 21,
+                 rsi_period: int = 21, conf: dict = None, initial_usdt: float = 1000.0,
+                 fee_pct: float = FEE_TAKER_PCT, max_buys_24h: int = MAX_BUYS_PER_24H,
+                 arrays: dict = None) -> dict:
+    """
+    Rejoue df à travers les règles live. Retourne {"trades", "equity", "stats"}.
+    `arrays` permet de fournir des indicateurs déjà calculés (sweep).
+    """
+    conf = conf or pick_conf_for_tf(tf)
+    a = arrays or indicator_arrays(df, conf, avg_type, avg_period, rsi_period)
+    n = len(df)
+    ts_ms = df["ts"].to_numpy(np.int64).tolist()
+    close = a["close"].tolist()
+    action_raw = a["action"].tolist()
+    diff = (a["rsi"] - a["rsi_avg"]).tolist()
+
+    hyst = HYST_EPS_BY_TF.get(tf, HYST_EPS_DEFAULT)
+    sl_pct, tp_trigger, tp_trail = sl_tp_params(tf)
+    cool_ms = (COOLDOWN.get(tf, 0) or 0) * 1000
+    alloc = str(alloc).strip()
+    alloc_pct = float(alloc[:-1]) / 100.0 if alloc.endswith("%") else None
+    alloc_fix = None if alloc_pct is not None else float(alloc)
+
+    cash, qty, cost_basis, fees = float(initial_usdt), 0.0, 0.0, 0.0
+    last_side, entry, peak, tp_armed = None, 0.0, 0.0, False
+    last_trade = -10**18
+    buys_24h = []
+    trades = []
+    equity = np.empty(n, dtype=np.float64)
+
+    for i in range(n):
+        c = close[i]
+        act = action_raw[i] if i >= a["warmup"] else 0
+        reason = "signal"
+
+        # Hystérésis
+        if act == 1 and last_side == "sell" and diff[i] <= hyst:
+            act = 0
+        elif act == -1 and last_side == "buy" and -diff[i] <= hyst:
+            act = 0
+
+        # SL / trailing TP
+        if last_side == "buy":
+            peak = max(peak, c)
+            pnl_net, dd_net = position_pnl(entry, peak, c, fee_pct)
+            if not tp_armed and pnl_net >= tp_trigger:
+                tp_armed = True
+            if sl_pct and pnl_net <= -sl_pct:
+                act, reason = -1, "sl"
+            elif tp_armed and dd_net <= -tp_trail:
+                act, reason = -1, "tp"
+
+        # Cooldown / plafond 24h
+        if act and cool_ms > 0 and ts_ms[i] - last_trade < cool_ms:
+            act = 0
+        if act == 1 and max_buys_24h > 0:
+            buys_24h = [t for t in buys_24h if ts_ms[i] - t < 86_400_000]
+            if len(buys_24h) >= max_buys_24h:
+                act = 0
+
+        if act == 1:
+            usdt = alloc_pct * cash if alloc_pct is not None else alloc_fix
+            usdt = max(0.0, min(usdt, cash * DEFAULT_RISK_FRACTION))
+            if usdt > MIN_BUY_USDT and c > 0:
+                fee = usdt * fee_pct
+                bought = (usdt - fee) / c
+                cash -= usdt
+                qty += bought
+                cost_basis += usdt
+                fees += fee
+                entry, peak, tp_armed, last_side = c, c, False, "buy"
+                last_trade = ts_ms[i]
+                buys_24h.append(ts_ms[i])
+                trades.append({"ts": ts_ms[i], "side": "buy", "price": c, "qty": bought,
+                               "usdt": usdt, "fee": fee, "reason": reason, "pnl": 0.0})
+        elif act == -1 and qty > 0:
+            gross = qty * c
+            fee = gross * fee_pct
+            cash += gross - fee
+            fees += fee
+            trades.append({"ts": ts_ms[i], "side": "sell", "price": c, "qty": qty,
+                           "usdt": gross - fee, "fee": fee, "reason": reason, "pnl": gross - fee - cost_basis})
+            qty, cost_basis = 0.0, 0.0
+            entry, peak, tp_armed, last_side = 0.0, 0.0, False, "sell"
+            last_trade = ts_ms[i]
+
+        equity[i] = cash + qty * c
+
+    equity_s = pd.Series(equity, index=pd.to_datetime(df["ts"].to_numpy(np.int64), unit="ms", utc=True))
+    return {"trades": trades, "equity": equity_s, "stats": _stats(trades, equity, initial_usdt, fees)}
+
+def _stats(trades: list, equity: np.ndarray, initial_usdt: float, fees: float) -> dict:
+    sells = [t for t in trades if t["side"] == "sell"]
+    wins = [t for t in sells if t["pnl"] > 0]
+    final = float(equity[-1]) if len(equity) else float(initial_usdt)
+    if len(equity):
+        run_max = np.maximum.accumulate(equity)
+        max_dd = float(np.max((run_max - equity) / np.where(run_max > 0, run_max, 1.0)))
+    else:
+        max_dd = 0.0
+    return {
+        "buys": len(trades) - len(sells),
+        "sells": len(sells),
+        "win_rate": (len(wins) / len(sells)) if sells else 0.0,
+        "pnl_usdt": final - initial_usdt,
+        "pnl_pct": (final - initial_usdt) / initial_usdt * 100.0 if initial_usdt else 0.0,
+        "fees_usdt": fees,
+        "max_drawdown_pct": max_dd * 100.0,
+        "final_equity": final,
+    }
+
+
+# ---------- CLI ----------
+def main():
+    ap = argparse.ArgumentParser(description="Backtest d'une ligne PAIRS_CFG")
+    ap.add_argument("--pair", required=True, help='ex: "BTC/USDT@5m=100,avg=sma,avg_period=21,rsi=21"')
+    ap.add_argument("--csv", help="historique local (ts,open,high,low,close,vol)")
+    ap.add_argument("--days", type=float, default=30.0, help="jours d'historique si pas de CSV")
+    ap.add_argument("--store", default=OHLCV_STORE_DIR, help="dossier OHLCVStore (historique réutilisé entre runs)")
+    ap.add_argument("--initial", type=float, default=1000.0, help="capital USDT initial")
+    ap.add_argument("--trades-out", help="export CSV des trades")
+    args = ap.parse_args()
+
+    c = parse_pairs_cfg(args.pair)[0]
+    if args.csv:
+        df = load_ohlcv_csv(args.csv)
+    else:
+        import ccxt
+        ex = ccxt.bitget({"enableRateLimit": True, "options": {"defaultType": "spot"}})
+        since = ex.milliseconds() - int(args.days * 86_400_000)
+        store = OHLCVStore(args.store) if args.store else None
+        df = load_history(ex, c["symbol"], c["tf"], since, store)
+
+    t0 = time.perf_counter()
+    res = run_backtest(df, c["tf"], alloc=c["alloc"], avg_type=c["avg"], avg_period=c["avg_period"],
+                       rsi_period=c["rsi_period"], initial_usdt=args.initial)
+    el = time.perf_counter() - t0
+    print(f"[BACKTEST] {c['symbol']}@{c['tf']} | {len(df)} bougies en {el:.2f}s")
+    for k, v in res["stats"].items():
+        print(f" - {k}: {v:.4f}" if isinstance(v, float) else f" - {k}: {v}")
+    if args.trades_out:
+        pd.DataFrame(res["trades"]).to_csv(args.trades_out, index=False)
+        print(f"[BACKTEST] Trades -> {args.trades_out}")
+
+
+if __name__ == "__main__":
+    main()
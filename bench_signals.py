@@ -0,0 +1,178 @@
+# bench_signals.py
+# -*- coding: utf-8 -*-
+"""
+Benchmark hors-ligne du module signals.
+
+- Chronomètre compute_rsi, smooth_rsi, compute_atr_series, compute_supertrend, avg_dollar_volume
+  et hybrid_signal sur 300 / 5k / 100k bougies, puis hybrid_signal sur N paires (300 bougies).
+- Vérifie que les sorties sont identiques au baseline stocké (empreintes sha256, arrondi 1e-8).
+- Sortie JSON (machine-readable) pour comparer entre commits.
+
+Données : synthétiques déterministes (seed fixe) ou enregistrées via --csv (ts,open,high,low,close,vol).
+
+Usage :
+    python bench_signals.py --out bench.json
+    python bench_signals.py --update-baseline          # régénère bench_baseline.json
+    python bench_signals.py --csv btc_5m.csv --sizes 300,5000
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from config import SHORT_TF_CONF, LONG_TF_CONF
+from signals import (
+    compute_rsi, smooth_rsi, compute_atr_series, compute_supertrend, avg_dollar_volume, hybrid_signal
+)
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+DEFAULT_SIZES = (300, 5_000, 100_000)
+DEFAULT_PAIRS = (1, 20, 80)
+
+
+def synthetic_ohlcv(n: int, seed: int = 42) -> pd.DataFrame:
+    """Marche aléatoire log-normale reproductible (PCG64, un flux par colonne :
+    les n premières bougies ne dépendent pas de la longueur totale générée)."""
+    rng = [np.random.default_rng([seed, k]) for k in range(4)]
+    close = 100.0 * np.exp(np.cumsum(rng[0].normal(0.0, 0.004, n)))
+    high = close * (1.0 + rng[1].random(n) * 0.004)
+    low = close * (1.0 - rng[2].random(n) * 0.004)
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    vol = rng[3].lognormal(7.0, 1.0, n)
+    ts = 1_700_000_000_000 + np.arange(n, dtype=np.int64) * 60_000
+    return pd.DataFrame({"ts": ts, "open": open_, "high": high, "low": low, "close": close, "vol": vol})
+
+def _digest(obj) -> str:
+    """Empreinte stable d'une sortie (séries/tuples/scalaires), arrondie à 1e-8."""
+    h = hashlib.sha256()
+
+    def feed(x):
+        if isinstance(x, pd.Series):
+            feed(x.to_numpy())
+        elif isinstance(x, np.ndarray):
+            h.update(np.round(x.astype(np.float64), 8).tobytes())
+        elif isinstance(x, (tuple, list)):
+            for y in x:
+                feed(y)
+        elif isinstance(x, float):
+            h.update(repr(round(x, 8)).encode())
+        else:
+            h.update(repr(x).encode())
+
+    feed(obj)
+    return h.hexdigest()[:16]
+
+def _time(fn, repeat: int):
+    samples, out = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return out, min(samples), statistics.median(samples)
+
+def _cases(df: pd.DataFrame):
+    conf = SHORT_TF_CONF
+    rsi = compute_rsi(df["close"], 14)
+    return [
+        ("compute_rsi", lambda: compute_rsi(df["close"], 14)),
+        ("smooth_rsi_ema", lambda: smooth_rsi(rsi, "ema", 21)),
+        ("smooth_rsi_sma", lambda: smooth_rsi(rsi, "sma", 21)),
+        ("compute_atr_series", lambda: compute_atr_series(df, 14)),
+        ("compute_supertrend", lambda: compute_supertrend(df, conf["supertrend"]["atr_period"], conf["supertrend"]["mult"])),
+        ("avg_dollar_volume", lambda: avg_dollar_volume(df, 20)),
+        ("hybrid_signal_short", lambda: hybrid_signal(df, "5m", SHORT_TF_CONF, "closed", avg_type="ema", avg_period=7, rsi_period=7)),
+        ("hybrid_signal_long", lambda: hybrid_signal(df, "1h", LONG_TF_CONF, "closed", avg_type="sma", avg_period=21, rsi_period=14)),
+    ]
+
+def _repeat_for(n: int) -> int:
+    return 20 if n <= 1_000 else (5 if n <= 10_000 else 2)
+
+def run(sizes, pair_counts, datasets) -> dict:
+    results, digests = [], {}
+    for label, base in datasets:
+        for n in sizes:
+            if n > len(base):
+                continue
+            df = base.iloc[:n].reset_index(drop=True)
+            for name, fn in _cases(df):
+                out, best, med = _time(fn, _repeat_for(n))
+                key = f"{label}:{name}:{n}"
+                digests[key] = _digest(out)
+                results.append({"data": label, "name": name, "n": n, "pairs": 1,
+                                "best_ms": round(best, 4), "median_ms": round(med, 4)})
+        # Multi-paires : hybrid_signal sur P séries de 300 bougies
+        frames = [base.iloc[k:k + 300].reset_index(drop=True) for k in range(max(pair_counts))]
+        for p in pair_counts:
+            sub = frames[:p]
+            _, best, med = _time(lambda: [hybrid_signal(f, "5m", SHORT_TF_CONF, "closed") for f in sub], 3)
+            results.append({"data": label, "name": "hybrid_signal_pairs", "n": 300, "pairs": p,
+                            "best_ms": round(best, 4), "median_ms": round(med, 4)})
+    return {"results": results, "digests": digests}
+
+def _meta() -> dict:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                         cwd=os.path.dirname(BASELINE_FILE), stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        commit = None
+    return {"commit": commit, "python": sys.version.split()[0], "numpy": np.__version__,
+            "pandas": pd.__version__, "platform": platform.platform(), "ts": int(time.time())}
+
+def compare_baseline(digests: dict, baseline: dict) -> dict:
+    ref = baseline.get("digests", {})
+    mismatches = [k for k, v in digests.items() if k in ref and ref[k] != v]
+    missing = [k for k in digests if k not in ref]
+    return {"ok": not mismatches, "checked": len(digests) - len(missing), "mismatches": mismatches, "missing": missing}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark signals.py (hors-ligne)")
+    ap.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    ap.add_argument("--pairs", default=",".join(map(str, DEFAULT_PAIRS)))
+    ap.add_argument("--csv", action="append", default=[], help="historique enregistré (répétable)")
+    ap.add_argument("--out", help="fichier JSON de sortie (défaut: stdout)")
+    ap.add_argument("--baseline", default=BASELINE_FILE)
+    ap.add_argument("--update-baseline", action="store_true")
+    args = ap.parse_args()
+
+    warnings.filterwarnings("ignore", category=FutureWarning)
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+    pair_counts = [int(x) for x in args.pairs.split(",") if x]
+    datasets = [("synthetic", synthetic_ohlcv(max(sizes + [300 + max(pair_counts)])))]
+    for path in args.csv:
+        datasets.append((os.path.basename(path), pd.read_csv(path)[["ts", "open", "high", "low", "close", "vol"]]))
+
+    res = run(sizes, pair_counts, datasets)
+    report = {"meta": _meta(), "results": res["results"]}
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"meta": report["meta"], "digests": res["digests"]}, f, indent=2, sort_keys=True)
+        report["baseline"] = {"updated": args.baseline}
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["baseline"] = compare_baseline(res["digests"], json.load(f))
+    else:
+        report["baseline"] = {"ok": None, "error": f"baseline absent: {args.baseline}"}
+
+    payload = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+    ok = report["baseline"].get("ok", True)
+    sys.exit(1 if ok is False else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,102 +1,48 @@
 # -*- coding: utf-8 -*-
-import os, sys, time, logging, traceback
+import os, sys, time, logging, threading, traceback, datetime as dt
+import numpy as np
 import pandas as pd
 import ccxt
 from typing import Dict, Tuple
-from logging.handlers import RotatingFileHandler
 
 from config import (
     FEE_TAKER_PCT, COOLDOWN, SELL_SLIP_PCT, RISK_PER_TRADE_PCT, ATR_LOOKBACK, ATR_MULT_SL,
     MIN_AVG_DOLLAR_VOL, VOL_LOOKBACK, CB_SYMBOL, CB_TF, CB_WINDOW_MIN, CB_DROP_PCT,
     CB_COOLDOWN_MIN, MAX_BUYS_PER_24H, HYST_EPS_DEFAULT, HYST_EPS_BY_TF,
-    STOP_LOSS_PCT_FALLBACK, TP_TRIGGER_FALLBACK, TP_TRAIL_FALLBACK,
-    STOP_LOSS_BY_TF, TP_TRIGGER_BY_TF, TP_TRAIL_BY_TF, MAX_STALE_SEC_ENV,
-    DEFAULT_MAX_SLIPPAGE_PCT, DEFAULT_RISK_FRACTION
+    STOP_LOSS_PCT_FALLBACK, STOP_LOSS_BY_TF, MAX_STALE_SEC_ENV,
+    DEFAULT_MAX_SLIPPAGE_PCT, DEFAULT_RISK_FRACTION, RESAMPLE_TFS, CANDLE_SETTLE_SEC, HEARTBEAT_INTERVAL_SEC,
+    METRICS_PORT, METRICS_HOST, OHLCV_STORE_DIR, SHARD_ID, SHARD_COORDINATOR, SHARD_ARCHIVE_CB
 )
 from utils import (
-    utcnow, next_candle_time, minutes_between, touch_heartbeat, note_progress,
-    get_env_clean, tf_to_minutes, send_webhook, _last_progress
+    utcnow, touch_heartbeat, note_progress,
+    get_env_clean, tf_to_minutes, send_webhook, flush_webhooks, parse_pairs_cfg
 )
-from signals import hybrid_signal, pick_conf_for_tf, avg_dollar_volume, compute_atr
+from signals import (
+    hybrid_signal_array, pick_conf_for_tf, avg_dollar_volume_array, compute_atr_array, sl_tp_params, position_pnl
+)
+from indicators import get_engine
+from ohlcv_cache import OHLCVCache
+from ohlcv_store import OHLCVStore
+from markets_cache import MarketsCache
+from resample import plan_fetches, apply_derived
+from scheduler import CandleScheduler
+from warm_state import WarmSnapshot
+from exit_monitor import start_exit_monitor
+from shard_runner import connect_coordinator
+from profiler import CycleProfiler
+import utils
+import metrics
+from logging_setup import setup_logging, flush_logging
 from state import load_state, save_state
-from execution import build_exchange, with_retry, place_market_buy, place_market_sell_all
-
-# -------- LOGGING --------
-LOG_FMT = "%(asctime)s | %(levelname)s | %(message)s"
-logging.basicConfig(level=logging.INFO, format=LOG_FMT, stream=sys.stdout)
-fh = RotatingFileHandler("bot.log", maxBytes=2_000_000, backupCount=3, encoding="utf-8")
-fh.setFormatter(logging.Formatter(LOG_FMT))
-logging.getLogger().addHandler(fh)
-log = logging.getLogger("bot")
+from execution import build_exchange, with_retry, place_market_buy, place_market_sell_all, BalanceSnapshot
 
-ALLOC_RE = __import__("re").compile(r"^\d+(\.\d+)?%?$")
-
-
-def parse_pairs_cfg(raw: str):
-    """PAIRE@TF=ALLOC,avg=(sma|ema),avg_period=<int>,rsi=<int>,signal=(live|closed)[,slip=<pct>]; ..."""
-    out = []
-    if not raw:
-        return out
-    entries = [e.strip() for e in raw.split(";") if e.strip()]
-    for entry in entries:
-        left, *attrs = [frag.strip() for frag in entry.split(",")]
-        pair_tf, alloc = [frag.strip() for frag in left.split("=", 1)]
-        pair, tf = [frag.strip() for frag in pair_tf.split("@", 1)]
-
-        if not ALLOC_RE.match(alloc):
-            raise ValueError(f"Allocation invalide '{alloc}'")
-        _ = tf_to_minutes(tf)  # validation TF
-
-        avg, avg_period, rsi_per, signal, slip = "ema", 21, 21, "closed", None
-        for frag in attrs:
-            if "=" not in frag:
-                continue
-            k, v = frag.split("=", 1)
-            k = k.strip().lower()
-            v = v.strip().lower()
-
-            if k == "avg":
-                if v not in ("ema", "sma"):
-                    raise ValueError("avg doit être 'ema' ou 'sma'")
-                avg = v
-            elif k == "avg_period":
-                ap = int(v)
-                if ap <= 0:
-                    raise ValueError("avg_period doit être > 0")
-                avg_period = ap
-            elif k == "rsi":
-                rp = int(v)
-                if rp <= 0:
-                    raise ValueError("rsi doit être > 0")
-                rsi_per = rp
-            elif k == "signal":
-                if v not in ("live", "closed"):
-                    raise ValueError("signal doit être 'live' ou 'closed'")
-                signal = v
-            elif k == "slip":
-                try:
-                    sv = float(v)
-                except Exception:
-                    raise ValueError("slip doit être un nombre (en %)")
-                slip = sv
-
-        out.append({
-            "symbol": pair,
-            "tf": tf.lower(),
-            "alloc": alloc,
-            "avg": avg,
-            "avg_period": avg_period,
-            "rsi_period": rsi_per,
-            "signal": signal,
-            "slip": slip,
-        })
-    return out
+# -------- LOGGING (file asynchrone, texte ou JSON lines) --------
+setup_logging()
+log = logging.getLogger("bot")
 
 
-def get_base_balance(exchange, market):
-    base_ccy = market.get("base")
-    bal = with_retry(exchange.fetch_balance, 3, 1)
-    return float((bal.get(base_ccy) or {}).get("free", 0.0))
+def get_base_balance(balances: BalanceSnapshot, market):
+    return balances.free(market.get("base"))
 
 
 def compute_vwap_from_trades(trades):
@@ -153,9 +99,13 @@ def bot_loop():
         MAX_STALE_SEC = int(min_tf_min * 3 * 60 + 60)
     log.info(f"[WATCHDOG] MAX_STALE_SEC = {MAX_STALE_SEC}s")
 
+    metrics.start_metrics_server(METRICS_PORT, METRICS_HOST)
     exchange = build_exchange()
     note_progress()
-    markets = exchange.load_markets()
+    markets_cache = MarketsCache()
+    markets = markets_cache.load(exchange)
+    if any(c["symbol"] not in markets for c in cfg_list):
+        markets = markets_cache.reload(exchange)  # cache antérieur à un nouveau listing
     note_progress()
     for c in cfg_list:
         if c["symbol"] not in markets:
@@ -169,14 +119,26 @@ def bot_loop():
         )
     log.info(f"Mode = {'TEST' if DRY_RUN else 'LIVE'}")
 
-    tf_minutes_map = {c["tf"]: tf_to_minutes(c["tf"]) for c in cfg_list}
-    next_run = {}
-    now = utcnow()
-    for tf, mins in tf_minutes_map.items():
-        next_run[tf] = next_candle_time(now, mins)
+    # Ordonnanceur : 1 job par paire (frontière TF + délai de stabilisation) + heartbeat / watchdog
+    sched = CandleScheduler(settle_sec=CANDLE_SETTLE_SEC)
+    for i, c in enumerate(cfg_list):
+        sched.add_candle(i, c["tf"], label=c["symbol"])
+    sched.add_periodic("heartbeat", HEARTBEAT_INTERVAL_SEC)
+    sched.add_periodic("watchdog", min(30.0, max(1.0, MAX_STALE_SEC / 4)))
+
+    profiler = CycleProfiler()
+    profiler.install_signal()
 
     trades_per_candle: Dict[Tuple[str, str, object], int] = {}
     MIN_BUY_USDT = 1.0
+    ohlcv_cache = OHLCVCache()
+    ohlcv_store = OHLCVStore(OHLCV_STORE_DIR) if OHLCV_STORE_DIR else None
+    warm = WarmSnapshot(exchange.id, cfg_list)
+    trades_per_candle = warm.restore(ohlcv_cache, sched)  # {} si démarrage à froid
+    balances = BalanceSnapshot(exchange)
+    coord = connect_coordinator()  # budget / caps / CB partagés (None hors shard_runner)
+    if coord is not None:
+        log.info(f"[SHARD] Worker {SHARD_ID} relié au coordinateur {SHARD_COORDINATOR}")
 
     _state = load_state()
     last_side = _state["last_side"]
@@ -188,16 +150,54 @@ def bot_loop():
     buy_timestamps = _state.get("buy_timestamps", {})
     cb_block_until_ts = float(_state.get("cb_block_until_ts", 0.0))
 
+    # Moniteur SL/TP intra-bougie (thread) : partage les dicts d'état sous state_lock
+    # (tenu pour les seules lectures / écritures des dicts, jamais pendant un appel réseau)
+    state_lock = threading.RLock()
+    closing = set()  # positions dont la vente est en cours (bot_loop ou moniteur)
+    start_exit_monitor(
+        exchange, balances,
+        {"last_side": last_side, "entry_price": entry_price, "peak_price": peak_price, "tp_armed": tp_armed,
+         "base_qty_at_entry": base_qty_at_entry, "last_trade_ts": last_trade_ts, "closing": closing},
+        state_lock,
+        lambda: save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
+                           last_trade_ts, buy_timestamps, cb_block_until_ts),
+        [(c["symbol"], c["tf"]) for c in cfg_list],
+        dry_run=DRY_RUN,
+    )
+
     touch_heartbeat(force=True)
 
+    def close_position(side_key):
+        """Position soldée : reset de l'état de la paire + sauvegarde (appelant sous state_lock)."""
+        for d in (entry_price, peak_price, tp_armed, base_qty_at_entry):
+            d.pop(side_key, None)
+        last_side[side_key] = "sell"
+        last_trade_ts[side_key] = time.time()
+        save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
+                   last_trade_ts, buy_timestamps, cb_block_until_ts)
+
     def circuit_breaker_active() -> bool:
         return time.time() < cb_block_until_ts
 
+    def ohlcv_in_hand(market_data: dict, sym: str, tf: str, limit: int):
+        """Bougies préchargées pour (sym, tf) ; fetch direct si absentes."""
+        res = market_data.get((sym, tf))
+        if isinstance(res, Exception):
+            raise res
+        if res is None:
+            return ohlcv_cache.get(exchange, sym, tf, limit=limit)
+        return res[-limit:]
+
     while True:
-        # Heartbeat / anti-stale
-        touch_heartbeat()
-        if (time.time() - _last_progress) > MAX_STALE_SEC:
-            delay = int(time.time() - _last_progress)
+        jobs = sched.next_batch()
+
+        if any(j["kind"] == "heartbeat" for j in jobs):
+            touch_heartbeat(force=True)
+
+        # Watchdog anti-stale
+        # (lecture via le module : un `from utils import _last_progress` figerait la valeur)
+        if any(j["kind"] == "watchdog" for j in jobs) and (time.time() - utils._last_progress) > MAX_STALE_SEC:
+            delay = int(time.time() - utils._last_progress)
             log.error(f"[STALE] Pas de progrès > {MAX_STALE_SEC}s (delay={delay}). Exit(42).")
             # ✅ Notification watchdog (stale)
             try:
@@ -211,44 +211,79 @@ def bot_loop():
                 })
             except Exception:
                 pass
+            flush_webhooks()
+            flush_logging()
             sys.exit(42)
 
-        now = utcnow()
-        due_tfs = [tf for tf, t in next_run.items() if now >= t]
-        if not due_tfs:
-            wake_at = min(next_run.values())
-            delta = max(1, int((wake_at - now).total_seconds()))
-            log.info(f"[SLEEP] Aucun TF dû. Réveil dans {delta}s (à {wake_at:%Y-%m-%d %H:%M:%S} UTC)")
-            time.sleep(min(delta, 30))
+        candle_jobs = [j for j in jobs if j["kind"] == "candle"]
+        if not candle_jobs:
             continue
+        due_pairs = [cfg_list[j["key"]] for j in candle_jobs]
+        due_tfs = sorted({c["tf"] for c in due_pairs}, key=tf_to_minutes)
 
-        log.info(f"[CYCLE] TF dû: {', '.join(due_tfs)} | now={now:%Y-%m-%d %H:%M:%S} UTC")
+        now = utcnow()
+        late = max(j["late_sec"] for j in candle_jobs)
+        log.info("[CYCLE] TF dû: %s | now=%s UTC | retard=%.2fs", ", ".join(due_tfs),
+                 now.strftime("%Y-%m-%d %H:%M:%S"), late,
+                 extra={"event": "cycle_start", "tfs": due_tfs, "pairs": len(due_pairs), "late_sec": late})
+        cycle_t0 = time.perf_counter()
+        profiler.begin()
+        note_progress()
+
+        # --- Préchargement OHLCV parallèle (paires dues + circuit breaker) ---
+        fetch_keys = [(c["symbol"], c["tf"], 300) for c in due_pairs]
+        if CB_DROP_PCT > 0 and CB_COOLDOWN_MIN > 0:
+            fetch_keys.append((CB_SYMBOL, CB_TF, 200))
+        derived = {}
+        if RESAMPLE_TFS:
+            fetch_keys, derived = plan_fetches(fetch_keys, getattr(exchange, "timeframes", None))
+        market_data = apply_derived(ohlcv_cache.prefetch(exchange, fetch_keys), derived)
+        if ohlcv_store is not None:
+            try:
+                # shard_runner : CB_SYMBOL (préchargé par tous les workers) n'a qu'un écrivain
+                archived = market_data if SHARD_ARCHIVE_CB else \
+                    {k: v for k, v in market_data.items() if k[0] != CB_SYMBOL}
+                ohlcv_store.record_closed(archived, int(time.time() * 1000))
+            except Exception as e:
+                log.warning(f"[STORE] Archivage OHLCV impossible: {e}")
         note_progress()
 
         # --- Circuit breaker global (refresh par cycle) ---
         try:
             if CB_DROP_PCT > 0 and CB_COOLDOWN_MIN > 0:
-                cb_raw = with_retry(exchange.fetch_ohlcv, 3, 1, CB_SYMBOL, timeframe=CB_TF, limit=200)
-                cb_df = pd.DataFrame(cb_raw, columns=["ts", "open", "high", "low", "close", "vol"])
+                cb_raw = ohlcv_in_hand(market_data, CB_SYMBOL, CB_TF, 200)
                 tfm = tf_to_minutes(CB_TF)
                 bars = max(1, int(CB_WINDOW_MIN / max(tfm, 1)))
-                if len(cb_df) > bars:
-                    p0 = float(cb_df["close"].iloc[-bars - 1])
-                    p1 = float(cb_df["close"].iloc[-1])
+                if len(cb_raw) > bars:
+                    p0 = float(cb_raw[-bars - 1][4])
+                    p1 = float(cb_raw[-1][4])
                     change = (p1 - p0) / p0 * 100.0
                     if change <= -abs(CB_DROP_PCT):
                         cb_block_until_ts = time.time() + CB_COOLDOWN_MIN * 60
                         log.warning(f"[CB] Actif ({CB_SYMBOL} {change:.2f}% <= -{CB_DROP_PCT}%). BUY off {CB_COOLDOWN_MIN} min")
+                        if coord is not None:
+                            coord.trip_circuit_breaker(cb_block_until_ts)
+            if coord is not None:
+                cb_block_until_ts = max(cb_block_until_ts, coord.circuit_breaker_until())
         except Exception as e:
             log.warning(f"[CB] Echec: {e}")
 
-        # Solde USDT
+        markets_cache.maybe_refresh(exchange)
+
+        # Solde USDT (snapshot partagé pour tout le cycle)
         try:
-            balance = with_retry(exchange.fetch_balance, 3, 1)
-            usdt_free = float((balance.get("USDT") or {}).get("free", 0.0))
+            bal_ts = time.time()
+            balances.refresh()
+            usdt_free = balances.free("USDT")
             note_progress()
+            if coord is not None:
+                try:
+                    coord.report_balance(usdt_free, bal_ts)
+                except Exception as e:
+                    log.warning(f"[COORD] Remontée du solde KO: {e}")
         except Exception as e:
             log.warning(f"[WARN] fetch_balance KO: {e}")
+            balances.invalidate()  # pas de soldes du cycle précédent : refetch ou repli base_qty_at_entry
             usdt_free = 0.0
         log.info(f"[BALANCE] USDT dispo: {usdt_free:.2f}")
         usdt_free_local = usdt_free
@@ -256,9 +291,7 @@ def bot_loop():
         # Contrôle d’alloc indicatif
         try:
             alloc_sum = 0.0
-            for c in cfg_list:
-                if c["tf"] not in due_tfs:
-                    continue
+            for c in due_pairs:
                 a = c["alloc"].strip()
                 alloc_sum += (float(a[:-1]) * usdt_free / 100.0) if a.endswith("%") else float(a)
             if alloc_sum > usdt_free:
@@ -268,25 +301,20 @@ def bot_loop():
 
         current_keys = set()
 
-        for c in cfg_list:
-            if c["tf"] not in due_tfs:
-                continue
-
+        for c in due_pairs:
             sym, tf, alloc = c["symbol"], c["tf"], c["alloc"]
             avg, avg_period, rsi_period = c["avg"], c["avg_period"], c["rsi_period"]
             signal_mode, slip_pct = c["signal"], c.get("slip")
 
             try:
-                # OHLCV
-                ohlcv = with_retry(exchange.fetch_ohlcv, 3, 1, sym, timeframe=tf, limit=300)
-                df = pd.DataFrame(ohlcv, columns=["ts", "open", "high", "low", "close", "vol"])
-                df["ts"] = pd.to_datetime(df["ts"], unit="ms", utc=True)
+                # OHLCV : tableau float64 (n, 6) [ts, open, high, low, close, vol], sans DataFrame
+                ohlcv = ohlcv_in_hand(market_data, sym, tf, 300)
+                arr = np.asarray(ohlcv, dtype=np.float64)
 
                 # MAX_STALE par TF
-                last_ts = df["ts"].iloc[-1]
                 MAX_STALE_BY_TF = {"1m": 3, "2m": 5, "5m": 10, "15m": 30, "30m": 60, "1h": 90, "2h": 150, "4h": 360,
                                    "1d": 2880, "1w": 4320}
-                staleness_min = minutes_between(utcnow(), last_ts)
+                staleness_min = abs(time.time() - arr[-1, 0] / 1000.0) / 60.0
                 max_stale = MAX_STALE_BY_TF.get(tf, 120)
                 if staleness_min > max_stale:
                     log.warning(f"[STALE/TF] {sym}@{tf} données trop anciennes ({staleness_min:.1f} > {max_stale}). Skip.")
@@ -294,125 +322,126 @@ def bot_loop():
 
                 # Filtre de volume global (optionnel)
                 if MIN_AVG_DOLLAR_VOL > 0:
-                    avg_vol_usd_glob = avg_dollar_volume(df, VOL_LOOKBACK)
+                    avg_vol_usd_glob = avg_dollar_volume_array(arr, VOL_LOOKBACK)
                     if avg_vol_usd_glob < MIN_AVG_DOLLAR_VOL:
                         log.info(f"[LIQ] {sym}@{tf} avg$vol={avg_vol_usd_glob:.0f} < {MIN_AVG_DOLLAR_VOL:.0f} → skip")
                         continue
 
-                # --- Signal hybride ---
+                # --- Signal hybride (moteur incrémental par paire/params) ---
                 conf = pick_conf_for_tf(tf)
-                rsi_last, rsi_avg_last, st_trend, don_high_last, don_low_last, vol_ok, action = hybrid_signal(
-                    df, tf, conf,
-                    signal_mode=signal_mode,
-                    avg_type=avg,
-                    avg_period=avg_period,
-                    rsi_period=rsi_period
-                )
-
-                close = float(df["close"].iloc[-1])
-                ts = df["ts"].iloc[-1 if signal_mode == "live" else -2]
+                try:
+                    engine = get_engine(sym, tf, conf, avg_type=avg, avg_period=avg_period, rsi_period=rsi_period)
+                    engine.update(ohlcv)
+                except Exception as e:
+                    log.warning(f"[IND] Moteur incrémental KO {sym}@{tf}: {e} → calcul complet")
+                    engine = None
+                with metrics.timed("bot_signal_seconds", symbol=sym, tf=tf):
+                    rsi_last, rsi_avg_last, st_trend, don_high_last, don_low_last, vol_ok, action = hybrid_signal_array(
+                        arr, tf, conf,
+                        signal_mode=signal_mode,
+                        avg_type=avg,
+                        avg_period=avg_period,
+                        rsi_period=rsi_period,
+                        engine=engine
+                    )
+
+                close = float(arr[-1, 4])
+                ts = pd.Timestamp(int(arr[-1 if signal_mode == "live" or len(arr) < 2 else -2, 0]), unit="ms", tz="UTC")
                 current_keys.add((sym, tf, ts))
 
                 side_key = (sym, tf)
                 mkt = exchange.market(sym)
                 try:
-                    cur_base = get_base_balance(exchange, mkt)
+                    cur_base = get_base_balance(balances, mkt)
                 except Exception as e:
                     log.warning(f"[MANUAL BAL] fetch_balance {sym} KO: {e}")
                     cur_base = base_qty_at_entry.get(side_key, 0.0)
 
-                prev_base = base_qty_at_entry.get(side_key)
-
-                # Vente manuelle ?
-                if last_side.get(side_key) == "buy" and cur_base <= float(os.getenv("MANUAL_SELL_EMPTY_THRESH", "1e-9")):
-                    log.info(f"[MANUAL SELL] {sym}@{tf} détectée. Reset état.")
-                    entry_price.pop(side_key, None)
-                    peak_price.pop(side_key, None)
-                    tp_armed.pop(side_key, None)
-                    base_qty_at_entry.pop(side_key, None)
-                    last_side[side_key] = "sell"
-                    save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
-                               last_trade_ts, buy_timestamps, cb_block_until_ts)
-
-                # Renfort manuel ?
+                # Renfort manuel : VWAP des achats récupéré hors verrou (réseau), appliqué sous verrou
                 from config import MANUAL_ADD_TOL, USE_VWAP_ON_MANUAL_ADD, VWAP_LOOKBACK_MIN
-                if last_side.get(side_key) == "buy" and prev_base not in (None, 0.0) and cur_base > prev_base:
-                    growth = (cur_base - prev_base) / prev_base
-                    if growth >= MANUAL_ADD_TOL:
-                        if USE_VWAP_ON_MANUAL_ADD:
-                            since = int((utcnow() - __import__("datetime").timedelta(days=VWAP_LOOKBACK_MIN)).timestamp() * 1000)
-                            try:
-                                my_trades = with_retry(exchange.fetch_my_trades, 3, 1, sym, since)
-                                vwap = compute_vwap_from_trades([t for t in my_trades if (str(t.get("side")).lower() == "buy")])
-                            except Exception:
-                                vwap = None
-                            new_entry = vwap if vwap else close
-                            entry_price[side_key] = new_entry
-                            peak_price[side_key] = max(new_entry, close)
-                        else:
-                            entry_price[side_key] = close
-                            peak_price[side_key] = close
-                        tp_armed[side_key] = False
-                        base_qty_at_entry[side_key] = cur_base
-                        log.info(f"[MANUALADD] Recalage {sym}: entry={entry_price[side_key]:.8f}, base={cur_base:.8f} (+{growth*100:.2f}%)")
+                prev_base, vwap = base_qty_at_entry.get(side_key), None
+                if (USE_VWAP_ON_MANUAL_ADD and last_side.get(side_key) == "buy" and prev_base not in (None, 0.0)
+                        and (cur_base - prev_base) / prev_base >= MANUAL_ADD_TOL):
+                    since = int((utcnow() - __import__("datetime").timedelta(days=VWAP_LOOKBACK_MIN)).timestamp() * 1000)
+                    try:
+                        my_trades = with_retry(exchange.fetch_my_trades, 3, 1, sym, since)
+                        vwap = compute_vwap_from_trades([t for t in my_trades if (str(t.get("side")).lower() == "buy")])
+                    except Exception:
+                        vwap = None
+
+                # État partagé avec le moniteur SL/TP intra-bougie : verrou limité aux lectures / écritures
+                # des dicts (aucun appel réseau dessous)
+                with state_lock:
+                    prev_base = base_qty_at_entry.get(side_key)
+
+                    # Vente manuelle ?
+                    if last_side.get(side_key) == "buy" and cur_base <= float(os.getenv("MANUAL_SELL_EMPTY_THRESH", "1e-9")):
+                        log.info(f"[MANUAL SELL] {sym}@{tf} détectée. Reset état.")
+                        entry_price.pop(side_key, None)
+                        peak_price.pop(side_key, None)
+                        tp_armed.pop(side_key, None)
+                        base_qty_at_entry.pop(side_key, None)
+                        last_side[side_key] = "sell"
                         save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
                                    last_trade_ts, buy_timestamps, cb_block_until_ts)
-                elif prev_base is None and cur_base > 0:
-                    base_qty_at_entry[side_key] = cur_base
-                    save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
-                               last_trade_ts, buy_timestamps, cb_block_until_ts)
-
-                # Hystérésis
-                prev_side = last_side.get(side_key)
-                diff_val = float(rsi_last - rsi_avg_last)
-                HYST_EPS = HYST_EPS_BY_TF.get(tf, HYST_EPS_DEFAULT)
-                if action == "buy" and prev_side == "sell" and diff_val <= HYST_EPS:
-                    log.info(f"[HYST] Flip SELL->BUY bloqué (diff={diff_val:.2f} <= {HYST_EPS}) {sym}")
-                    action = None
-                elif action == "sell" and prev_side == "buy" and -diff_val <= HYST_EPS:
-                    log.info(f"[HYST] Flip BUY->SELL bloqué (diff={-diff_val:.2f} <= {HYST_EPS}) {sym}")
-                    action = None
 
-                # SL / TP si en position
-                if last_side.get(side_key) == "buy":
-                    if side_key not in entry_price:
-                        entry_price[side_key] = close
-                        peak_price[side_key] = close
-                        tp_armed[side_key] = False
-                    peak_price[side_key] = max(peak_price.get(side_key, close), close)
-
-                    fee = max(0.0, FEE_TAKER_PCT)
-                    entry_eff = entry_price[side_key] * (1.0 + fee)
-                    close_eff = close * (1.0 - fee)
-                    pnl_net = (close_eff - entry_eff) / entry_eff
-                    peak_eff = peak_price[side_key] * (1.0 - fee)
-                    drawdown_net = (close_eff - peak_eff) / peak_eff
-
-                    sl_pct = STOP_LOSS_BY_TF.get(tf, STOP_LOSS_PCT_FALLBACK)
-                    tp_trigger = TP_TRIGGER_BY_TF.get(tf, TP_TRIGGER_FALLBACK)
-                    tp_trail = TP_TRAIL_BY_TF.get(tf, TP_TRAIL_FALLBACK)
-
-                    if tp_trigger <= tp_trail:
-                        tp_trigger = tp_trail + 0.01
-                    MIN_LOCK = 0.02
-                    if (tp_trigger - tp_trail) < MIN_LOCK:
-                        tp_trigger = tp_trail + MIN_LOCK
-                    MIN_RR = 1.5
-                    if sl_pct > 0 and (tp_trigger / sl_pct) < MIN_RR:
-                        tp_trigger = sl_pct * MIN_RR
-
-                    if not tp_armed.get(side_key, False) and pnl_net >= tp_trigger:
-                        tp_armed[side_key] = True
-                        log.info(f"[TP] Trailing armé {sym} @ gain_net={pnl_net*100:.2f}%")
+                    # Renfort manuel ?
+                    if last_side.get(side_key) == "buy" and prev_base not in (None, 0.0) and cur_base > prev_base:
+                        growth = (cur_base - prev_base) / prev_base
+                        if growth >= MANUAL_ADD_TOL:
+                            if USE_VWAP_ON_MANUAL_ADD:
+                                new_entry = vwap if vwap else close
+                                entry_price[side_key] = new_entry
+                                peak_price[side_key] = max(new_entry, close)
+                            else:
+                                entry_price[side_key] = close
+                                peak_price[side_key] = close
+                            tp_armed[side_key] = False
+                            base_qty_at_entry[side_key] = cur_base
+                            log.info(f"[MANUALADD] Recalage {sym}: entry={entry_price[side_key]:.8f}, base={cur_base:.8f} (+{growth*100:.2f}%)")
+                            save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
+                                       last_trade_ts, buy_timestamps, cb_block_until_ts)
+                    elif prev_base is None and cur_base > 0:
+                        base_qty_at_entry[side_key] = cur_base
                         save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
                                    last_trade_ts, buy_timestamps, cb_block_until_ts)
 
-                    if sl_pct and pnl_net <= -sl_pct:
-                        log.info(f"[SL] Stop-loss SELL {sym}: {pnl_net*100:.2f}%")
-                        action = "sell"
-                    elif tp_armed.get(side_key, False) and drawdown_net <= -tp_trail:
-                        log.info(f"[TP] Trailing SELL {sym}: drawdown={drawdown_net*100:.2f}%")
-                        action = "sell"
+                    # Hystérésis
+                    prev_side = last_side.get(side_key)
+                    diff_val = float(rsi_last - rsi_avg_last)
+                    HYST_EPS = HYST_EPS_BY_TF.get(tf, HYST_EPS_DEFAULT)
+                    if action == "buy" and prev_side == "sell" and diff_val <= HYST_EPS:
+                        log.info("[HYST] Flip SELL->BUY bloqué (diff=%.2f <= %s) %s", diff_val, HYST_EPS, sym,
+                                 extra={"event": "hyst", "symbol": sym, "tf": tf, "diff": diff_val})
+                        action = None
+                    elif action == "sell" and prev_side == "buy" and -diff_val <= HYST_EPS:
+                        log.info("[HYST] Flip BUY->SELL bloqué (diff=%.2f <= %s) %s", -diff_val, HYST_EPS, sym,
+                                 extra={"event": "hyst", "symbol": sym, "tf": tf, "diff": -diff_val})
+                        action = None
+
+                    # SL / TP si en position
+                    if last_side.get(side_key) == "buy":
+                        if side_key not in entry_price:
+                            entry_price[side_key] = close
+                            peak_price[side_key] = close
+                            tp_armed[side_key] = False
+                        peak_price[side_key] = max(peak_price.get(side_key, close), close)
+
+                        pnl_net, drawdown_net = position_pnl(entry_price[side_key], peak_price[side_key], close, FEE_TAKER_PCT)
+                        sl_pct, tp_trigger, tp_trail = sl_tp_params(tf)
+
+                        if not tp_armed.get(side_key, False) and pnl_net >= tp_trigger:
+                            tp_armed[side_key] = True
+                            log.info(f"[TP] Trailing armé {sym} @ gain_net={pnl_net*100:.2f}%")
+                            save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
+                                       last_trade_ts, buy_timestamps, cb_block_until_ts)
+
+                        if sl_pct and pnl_net <= -sl_pct:
+                            log.info(f"[SL] Stop-loss SELL {sym}: {pnl_net*100:.2f}%")
+                            action = "sell"
+                        elif tp_armed.get(side_key, False) and drawdown_net <= -tp_trail:
+                            log.info(f"[TP] Trailing SELL {sym}: drawdown={drawdown_net*100:.2f}%")
+                            action = "sell"
 
                 # -------- LOG "raison du refus" + état --------
                 reasons = []
@@ -425,10 +454,14 @@ def bot_loop():
                 if st_trend != "bull":
                     reasons.append("ST!=bull")
 
+                reason = "OK" if not reasons else ",".join(reasons)
                 log.info(
-                    f"[DATA] {sym} | Close={close:.8f} | RSI={rsi_last:.2f}/{rsi_avg_last:.2f} | "
-                    f"ST={st_trend} | Don(H/L)={don_high_last}/{don_low_last} | VolOK={vol_ok} | "
-                    f"can_buy={action=='buy'} | reason={'OK' if not reasons else ','.join(reasons)}"
+                    "[DATA] %s | Close=%.8f | RSI=%.2f/%.2f | ST=%s | Don(H/L)=%s/%s | VolOK=%s | can_buy=%s | reason=%s",
+                    sym, close, rsi_last, rsi_avg_last, st_trend, don_high_last, don_low_last, vol_ok,
+                    action == "buy", reason,
+                    extra={"event": "data", "symbol": sym, "tf": tf, "close": close, "rsi": rsi_last,
+                           "rsi_avg": rsi_avg_last, "st_trend": st_trend, "don_high": don_high_last,
+                           "don_low": don_low_last, "vol_ok": vol_ok, "action": action, "reason": reason},
                 )
 
                 # Limite par bougie
@@ -443,7 +476,8 @@ def bot_loop():
                 if cool > 0:
                     lt = float(last_trade_ts.get(side_key, 0.0))
                     if time.time() - lt < cool:
-                        log.info(f"[COOLDOWN] {sym}@{tf} {int(time.time()-lt)}s < {cool}s")
+                        log.info("[COOLDOWN] %s@%s %ds < %ss", sym, tf, int(time.time() - lt), cool,
+                                 extra={"event": "cooldown", "symbol": sym, "tf": tf})
                         action = None
 
                 # Cap BUY / 24h
@@ -454,7 +488,8 @@ def bot_loop():
                     if len(lst) >= MAX_BUYS_PER_24H:
                         log.info(f"[CAP] {sym}@{tf} plafond BUY atteint")
                         action = None
-                    buy_timestamps[side_key] = lst
+                    with state_lock:  # buy_timestamps est sérialisé par save_state (moniteur compris)
+                        buy_timestamps[side_key] = lst
 
                 # Circuit breaker
                 if action == "buy" and circuit_breaker_active():
@@ -475,7 +510,7 @@ def bot_loop():
                     # --- Risk sizing optionnel (ATR/SL) ---
                     if RISK_PER_TRADE_PCT > 0:
                         try:
-                            atr = compute_atr(df, ATR_LOOKBACK)
+                            atr = compute_atr_array(arr, ATR_LOOKBACK)
                             sl_pct_est = STOP_LOSS_BY_TF.get(tf, STOP_LOSS_PCT_FALLBACK)
                             if ATR_MULT_SL > 0 and close > 0:
                                 sl_pct_est = max(sl_pct_est, (ATR_MULT_SL * atr) / close)
@@ -488,87 +523,116 @@ def bot_loop():
                     # --- Risk fraction global ---
                     usdt_amt = max(0.0, min(usdt_amt, usdt_free_local * DEFAULT_RISK_FRACTION))
 
-                    if usdt_amt <= MIN_BUY_USDT:
-                        log.info(f"[BUY-SKIP] Montant insuffisant (<= {MIN_BUY_USDT} USDT)")
-                    else:
-                        # --- Anti-slippage universel (manuel par paire > sinon défaut global) ---
-                        slip_limit = (slip_pct if (slip_pct is not None) else DEFAULT_MAX_SLIPPAGE_PCT)
-                        log.info(f"[BUY] {sym} usdt={usdt_amt:.2f} (slip≤{slip_limit}%)")
-                        if not DRY_RUN:
-                            try:
-                                order = place_market_buy(exchange, sym, usdt_amt, slip_limit_pct=slip_limit)
-                                if isinstance(order, dict) and order.get("skipped"):
-                                    log.info(f"[BUY-SKIP] {sym} (reason={order.get('reason')})")
-                                else:
-                                    trades_per_candle[key] = count + 1
+                    # Budget partagé (mode multi-process) : réservation auprès du coordinateur
+                    rid, spent = None, 0.0
+                    if coord is not None and usdt_amt > MIN_BUY_USDT:
+                        try:
+                            grant = coord.reserve(SHARD_ID, f"{sym}@{tf}", usdt_amt)
+                        except Exception as e:
+                            grant = {"rid": None, "amount": 0.0, "reason": f"coordinateur injoignable ({e})"}
+                        rid = grant["rid"]
+                        if grant["reason"]:
+                            log.info(f"[COORD] BUY {sym}@{tf} refusé : {grant['reason']}")
+                        elif grant["amount"] < usdt_amt:
+                            log.info(f"[COORD] BUY {sym}@{tf} réduit {usdt_amt:.2f} -> {grant['amount']:.2f} USDT")
+                        usdt_amt = grant["amount"]
+
+                    try:
+                        if usdt_amt <= MIN_BUY_USDT:
+                            log.info(f"[BUY-SKIP] Montant insuffisant (<= {MIN_BUY_USDT} USDT)")
+                        else:
+                            # --- Anti-slippage universel (manuel par paire > sinon défaut global) ---
+                            slip_limit = (slip_pct if (slip_pct is not None) else DEFAULT_MAX_SLIPPAGE_PCT)
+                            log.info("[BUY] %s usdt=%.2f (slip≤%s%%)", sym, usdt_amt, slip_limit,
+                                     extra={"event": "buy", "symbol": sym, "tf": tf, "usdt": usdt_amt,
+                                            "price": close, "dry_run": DRY_RUN})
+                            if not DRY_RUN:
+                                try:
+                                    order = place_market_buy(exchange, sym, usdt_amt, slip_limit_pct=slip_limit,
+                                                             balances=balances)
+                                    if isinstance(order, dict) and order.get("skipped"):
+                                        log.info(f"[BUY-SKIP] {sym} (reason={order.get('reason')})")
+                                    else:
+                                        spent = usdt_amt
+                                        trades_per_candle[key] = count + 1
+                                        try:
+                                            base_now = get_base_balance(balances, mkt)
+                                        except Exception:
+                                            base_now = None
+                                        usdt_free_local = max(0.0, usdt_free_local - usdt_amt)
+                                        with state_lock:
+                                            entry_price[side_key] = close
+                                            peak_price[side_key] = close
+                                            tp_armed[side_key] = False
+                                            last_side[side_key] = "buy"
+                                            base_qty_at_entry[side_key] = base_now if base_now is not None else \
+                                                base_qty_at_entry.get(side_key, 0.0)
+                                            last_trade_ts[side_key] = time.time()
+                                            lst = buy_timestamps.get(side_key, [])
+                                            lst.append(time.time())
+                                            buy_timestamps[side_key] = lst
+                                            save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
+                                                       last_trade_ts, buy_timestamps, cb_block_until_ts)
+                                        send_webhook("buy", {"symbol": sym, "tf": tf, "price": close, "usdt": usdt_amt})
+                                except Exception as e:
+                                    log.error(f"[ERROR] BUY échec ({sym}) -> {e}")
+                            else:
+                                spent = usdt_amt
+                                trades_per_candle[key] = count + 1
+                                usdt_free_local = max(0.0, usdt_free_local - usdt_amt)
+                                with state_lock:
                                     entry_price[side_key] = close
                                     peak_price[side_key] = close
                                     tp_armed[side_key] = False
                                     last_side[side_key] = "buy"
-                                    try:
-                                        base_qty_at_entry[side_key] = get_base_balance(exchange, mkt)
-                                    except Exception:
-                                        base_qty_at_entry[side_key] = base_qty_at_entry.get(side_key, 0.0)
-                                    usdt_free_local = max(0.0, usdt_free_local - usdt_amt)
                                     last_trade_ts[side_key] = time.time()
                                     lst = buy_timestamps.get(side_key, [])
                                     lst.append(time.time())
                                     buy_timestamps[side_key] = lst
                                     save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
                                                last_trade_ts, buy_timestamps, cb_block_until_ts)
-                                    send_webhook("buy", {"symbol": sym, "tf": tf, "price": close, "usdt": usdt_amt})
+                                send_webhook("buy_dry", {"symbol": sym, "tf": tf, "price": close, "usdt": usdt_amt})
+                    finally:
+                        if rid is not None:
+                            try:
+                                coord.settle(rid, spent)
                             except Exception as e:
-                                log.error(f"[ERROR] BUY échec ({sym}) -> {e}")
-                        else:
-                            trades_per_candle[key] = count + 1
-                            entry_price[side_key] = close
-                            peak_price[side_key] = close
-                            tp_armed[side_key] = False
-                            last_side[side_key] = "buy"
-                            usdt_free_local = max(0.0, usdt_free_local - usdt_amt)
-                            last_trade_ts[side_key] = time.time()
-                            lst = buy_timestamps.get(side_key, [])
-                            lst.append(time.time())
-                            buy_timestamps[side_key] = lst
-                            save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
-                                       last_trade_ts, buy_timestamps, cb_block_until_ts)
-                            send_webhook("buy_dry", {"symbol": sym, "tf": tf, "price": close, "usdt": usdt_amt})
+                                log.warning(f"[COORD] settle {rid} KO: {e}")
 
                 elif action == "sell":
-                    log.info(f"[SELL] {sym} (liquidation)")
-                    if not DRY_RUN:
+                    # Réservation de la sortie : le moniteur intra-bougie ne vend pas la même position en parallèle
+                    with state_lock:
+                        selling = side_key not in closing
+                        closing.add(side_key)
+                    if not selling:
+                        log.info(f"[SELL-SKIP] {sym}@{tf} (sortie déjà en cours côté moniteur intra-bougie)")
+                    else:
                         try:
-                            order = place_market_sell_all(exchange, sym, slip_limit_pct=SELL_SLIP_PCT)
-                            if isinstance(order, dict) and order.get("skipped"):
-                                log.info(f"[SELL-SKIP] {sym} (reason={order.get('reason')})")
+                            log.info("[SELL] %s (liquidation)", sym,
+                                     extra={"event": "sell", "symbol": sym, "tf": tf, "price": close, "dry_run": DRY_RUN})
+                            if not DRY_RUN:
+                                try:
+                                    order = place_market_sell_all(exchange, sym, slip_limit_pct=SELL_SLIP_PCT,
+                                                                  balances=balances)
+                                    if isinstance(order, dict) and order.get("skipped"):
+                                        log.info(f"[SELL-SKIP] {sym} (reason={order.get('reason')})")
+                                    else:
+                                        trades_per_candle[key] = count + 1
+                                        with state_lock:
+                                            close_position(side_key)
+                                        send_webhook("sell", {"symbol": sym, "tf": tf, "price": close})
+                                except Exception as e:
+                                    log.error(f"[ERROR] SELL échec ({sym}) -> {e}")
                             else:
                                 trades_per_candle[key] = count + 1
-                                entry_price.pop(side_key, None)
-                                peak_price.pop(side_key, None)
-                                tp_armed.pop(side_key, None)
-                                base_qty_at_entry.pop(side_key, None)
-                                last_side[side_key] = "sell"
-                                last_trade_ts[side_key] = time.time()
-                                save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
-                                           last_trade_ts, buy_timestamps, cb_block_until_ts)
-                                send_webhook("sell", {"symbol": sym, "tf": tf, "price": close})
-                        except Exception as e:
-                            log.error(f"[ERROR] SELL échec ({sym}) -> {e}")
-                    else:
-                        trades_per_candle[key] = count + 1
-                        entry_price.pop(side_key, None)
-                        peak_price.pop(side_key, None)
-                        tp_armed.pop(side_key, None)
-                        base_qty_at_entry.pop(side_key, None)
-                        last_side[side_key] = "sell"
-                        last_trade_ts[side_key] = time.time()
-                        save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
-                                   last_trade_ts, buy_timestamps, cb_block_until_ts)
-                        send_webhook("sell_dry", {"symbol": sym, "tf": tf, "price": close})
+                                with state_lock:
+                                    close_position(side_key)
+                                send_webhook("sell_dry", {"symbol": sym, "tf": tf, "price": close})
+                        finally:
+                            with state_lock:
+                                closing.discard(side_key)
                 else:
-                    log.info(f"[INFO] Aucun signal {sym}")
-
-                time.sleep(0.25)
+                    log.info("[INFO] Aucun signal %s", sym, extra={"event": "no_signal", "symbol": sym, "tf": tf})
 
             except ccxt.BaseError as e:
                 log.warning(f"[WARN] Exchange {sym}: {e}")
@@ -579,13 +643,19 @@ def bot_loop():
         if trades_per_candle:
             trades_per_candle = {k: v for k, v in trades_per_candle.items() if k in current_keys}
 
-        save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
-                   last_trade_ts, buy_timestamps, cb_block_until_ts)
+        with state_lock:
+            save_state(last_side, entry_price, peak_price, tp_armed, base_qty_at_entry,
+                       last_trade_ts, buy_timestamps, cb_block_until_ts)
+        warm.maybe_save(ohlcv_cache, sched, trades_per_candle)
 
-        now2 = utcnow()
-        for tf in due_tfs:
-            mins = tf_minutes_map[tf]
-            next_run[tf] = next_candle_time(now2, mins)
+        profiler.end(f"{','.join(due_tfs)} x{len(due_pairs)}")
+        cycle_sec = time.perf_counter() - cycle_t0
+        metrics.observe("bot_cycle_seconds", cycle_sec, tfs=",".join(due_tfs))
+        log.info("[CYCLE] Terminé en %.2fs (%d paires)", cycle_sec, len(due_pairs),
+                 extra={"event": "cycle_end", "duration_sec": cycle_sec, "pairs": len(due_pairs)})
+        wake_at = sched.next_candle_wake()
+        log.info(f"[SLEEP] Prochaine bougie dans {max(0, int(wake_at - time.time()))}s "
+                 f"(à {dt.datetime.fromtimestamp(wake_at, dt.timezone.utc):%Y-%m-%d %H:%M:%S} UTC)")
 
 
 # -------- Redémarrage auto (watchdog) --------
@@ -614,6 +684,7 @@ def main():
                 })
             except Exception:
                 pass
+            flush_webhooks()
             log.error(f"[CRASH] Bot crashe: {e}\n{traceback.format_exc()}")
             log.info("[RESTART] Redemarrage dans 10s...")
             time.sleep(10)
@@ -0,0 +1,353 @@
+# cassette.py
+# -*- coding: utf-8 -*-
+"""
+Enregistrement / rejeu du trafic exchange (post-mortem, régressions de performance hors ligne).
+
+- CASSETTE_MODE=record : build_exchange enveloppe les méthodes ccxt du bot (RECORDED) ; chaque
+  appel (méthode, arguments, réponse ou exception, heure de début, durée, thread) est ajouté à
+  CASSETTE_FILE (enregistrements pickle compressés zlib, préfixés par leur taille, flush à chaque
+  appel : une cassette coupée par un crash reste lisible). L'en-tête contient l'environnement
+  (hors secrets), l'état STATE_FILE de départ et les marchés.
+- CASSETTE_MODE=replay : build_exchange renvoie un exchange de même classe dont les méthodes
+  réseau servent les réponses enregistrées (appariement par méthode + arguments, sinon ordre
+  d'arrivée), et installe une horloge virtuelle (time.time / time.sleep) calée sur l'enregistrement :
+  les attentes de bougie sont instantanées. Latences d'origine rejouées si CASSETTE_REAL_LATENCY=true,
+  sinon pleine vitesse. Fin de cassette → CassetteEnd (SystemExit 0) + bilan dans les logs.
+
+Usage :
+    CASSETTE_MODE=record python bot.py                       # production, enregistre cassette.bin
+    python cassette.py info cassette.bin                     # appels, latences, appels les plus lents
+    python cassette.py replay cassette.bin [--real-latency]  # rejoue bot.py dans un répertoire temporaire
+"""
+import argparse
+import atexit
+import logging
+import os
+import pickle
+import re
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+import ccxt
+
+from config import CASSETTE_FILE, CASSETTE_REAL_LATENCY, STATE_FILE
+
+log = logging.getLogger("bot")
+
+VERSION = 1
+RECORDED = ("load_markets", "fetch_ohlcv", "fetch_ticker", "fetch_tickers", "fetch_balance",
+            "create_order", "fetch_my_trades")
+_SECRET_ENV = re.compile(r"KEY|SECRET|PASSWORD|TOKEN|WEBHOOK", re.I)
+_HEADER = struct.Struct("<I")
+
+
+class CassetteEnd(SystemExit):
+    """Fin de la cassette : arrêt propre de bot_loop (main() relaie les SystemExit)."""
+
+
+def _call_key(args: tuple, kwargs: dict) -> str:
+    return repr((args, sorted(kwargs.items())))
+
+
+def read_cassette(path: str) -> List[dict]:
+    out = []
+    with open(path, "rb") as f:
+        while True:
+            head = f.read(_HEADER.size)
+            if len(head) < _HEADER.size:
+                break
+            blob = f.read(_HEADER.unpack(head)[0])
+            try:
+                out.append(pickle.loads(zlib.decompress(blob)))
+            except Exception:
+                log.warning(f"[CASSETTE] Enregistrement tronqué en fin de {path} (ignoré)")
+                break
+    return out
+
+
+# ---------- Enregistrement ----------
+class CassetteRecorder:
+    def __init__(self, path: str = CASSETTE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = open(path, "ab")
+        self._markets_saved = False
+        self.calls = 0
+
+    def write(self, rec: dict):
+        blob = zlib.compress(pickle.dumps(rec, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            if self._f.closed:
+                return
+            self._f.write(_HEADER.pack(len(blob)) + blob)
+            self._f.flush()
+
+    def header(self, exchange):
+        state = {}
+        for p in (STATE_FILE, STATE_FILE + ".journal"):
+            if os.path.exists(p):
+                with open(p, "rb") as f:
+                    state[os.path.basename(p)[len(os.path.basename(STATE_FILE)):]] = f.read()
+        env = {k: v for k, v in os.environ.items() if not _SECRET_ENV.search(k)}
+        self.write({"kind": "header", "version": VERSION, "t": time.time(), "exchange": exchange.id,
+                    "env": env, "state": state})
+
+    def markets(self, exchange):
+        if self._markets_saved or not exchange.markets:
+            return
+        self._markets_saved = True
+        self.write({"kind": "markets", "t": time.time(), "markets": exchange.markets,
+                    "currencies": getattr(exchange, "currencies", None) or None})
+
+    def close(self):
+        self.write({"kind": "end", "t": time.time(), "calls": self.calls})
+        with self._lock:
+            self._f.close()
+
+    def install(self, exchange):
+        """Enveloppe les méthodes RECORDED de `exchange` (à faire AVANT l'ordonnanceur de requêtes)."""
+        def wrap(name, fn):
+            def call(*a, **kw):
+                t, t0 = time.time(), time.perf_counter()
+                rec = {"kind": "call", "m": name, "k": _call_key(a, kw), "t": t,
+                       "th": threading.current_thread().name}
+                try:
+                    rec["r"] = out = fn(*a, **kw)
+                    return out
+                except Exception as e:
+                    rec["e"] = (type(e).__name__, str(e))
+                    raise
+                finally:
+                    rec["d"] = time.perf_counter() - t0
+                    self.calls += 1
+                    self.write(rec)
+                    self.markets(exchange)
+            return call
+
+        for name in RECORDED:
+            fn = getattr(exchange, name, None)
+            if fn is not None:
+                setattr(exchange, name, wrap(name, fn))
+        self.markets(exchange)
+        return exchange
+
+
+# ---------- Rejeu ----------
+class VirtualClock:
+    """Horloge calée sur l'enregistrement : time.time() virtuel, time.sleep() instantané."""
+
+    def __init__(self, start: float, end: float, on_end):
+        self.now = float(start)
+        self.end = float(end)
+        self.on_end = on_end
+        self._lock = threading.Lock()
+        self.real_sleep = time.sleep
+
+    def time(self) -> float:
+        return self.now
+
+    def advance_to(self, t: float):
+        with self._lock:
+            self.now = max(self.now, t)
+
+    def sleep(self, sec: float):
+        if self.now + max(0.0, sec) > self.end:
+            self.on_end()
+        self.advance_to(self.now + max(0.0, sec))
+
+    def install(self):
+        time.time, time.sleep = self.time, self.sleep
+
+
+class CassettePlayer:
+    def __init__(self, path: str = CASSETTE_FILE, real_latency: bool = CASSETTE_REAL_LATENCY):
+        self.path = path
+        self.real_latency = real_latency
+        recs = read_cassette(path)
+        if not recs or recs[0].get("kind") != "header" or recs[0].get("version") != VERSION:
+            raise ValueError(f"[CASSETTE] {path} : en-tête absent ou version incompatible")
+        self.header = recs[0]
+        calls = [r for r in recs if r["kind"] == "call"]
+        self.snapshot = next((r for r in recs if r["kind"] == "markets"), None)
+        end = max([r["t"] for r in recs if r["kind"] == "end"] + [r["t"] + r["d"] for r in calls] + [self.header["t"]])
+        self.by_key: Dict[tuple, deque] = defaultdict(deque)
+        self.by_method: Dict[str, deque] = defaultdict(deque)
+        for r in calls:
+            self.by_key[(r["m"], r["k"])].append(r)
+            self.by_method[r["m"]].append(r)
+        self.total = len(calls)
+        self.served = 0
+        self.diverged = 0
+        self.missing = 0
+        self._used = set()
+        self._lock = threading.Lock()
+        self._real_t0 = time.perf_counter()
+        self.clock = VirtualClock(self.header["t"], end, self.finish)
+
+    def _next(self, name: str, key: str) -> Optional[dict]:
+        with self._lock:
+            for q, exact in ((self.by_key[(name, key)], True), (self.by_method[name], False)):
+                while q:
+                    r = q.popleft()
+                    if id(r) not in self._used:
+                        self._used.add(id(r))
+                        self.served += 1
+                        if not exact:
+                            self.diverged += 1
+                            log.warning(f"[CASSETTE] Divergence {name} : arguments non enregistrés, "
+                                        f"réponse suivante servie ({key[:120]})")
+                        return r
+            self.missing += 1
+            return None
+
+    def play(self, exchange, name: str, *a, **kw):
+        r = self._next(name, _call_key(a, kw))
+        if r is None:
+            if name == "load_markets" and exchange.markets:
+                return exchange.markets
+            raise ccxt.NetworkError(f"[CASSETTE] Aucune réponse enregistrée pour {name}")
+        if self.real_latency:
+            self.clock.real_sleep(r["d"])
+        self.clock.advance_to(r["t"] + r["d"])
+        if "e" in r:
+            cls = getattr(ccxt, r["e"][0], None)
+            raise (cls if isinstance(cls, type) and issubclass(cls, Exception) else ccxt.ExchangeError)(r["e"][1])
+        if name == "load_markets":
+            self._set_markets(r["r"], (self.snapshot or {}).get("currencies"))
+        return r["r"]
+
+    def build(self):
+        """Exchange de même classe que l'enregistrement, méthodes réseau servies par la cassette."""
+        ex_id = self.header["exchange"]
+        if ex_id in ccxt.exchanges:
+            exchange = getattr(ccxt, ex_id)({"options": {"defaultType": "spot"}, "enableRateLimit": False})
+        else:
+            from sim_exchange import SimExchange
+            symbols = list((self.snapshot or {}).get("markets") or {})
+            exchange = SimExchange(symbols, latency_ms=0, jitter_ms=0, error_rate=0)
+        self._set_markets = type(exchange).set_markets.__get__(exchange)
+        if self.snapshot:
+            self._set_markets(self.snapshot["markets"], self.snapshot.get("currencies"))
+            # les marchés de la cassette priment sur le cache disque (MarketsCache)
+            exchange.set_markets = lambda markets, currencies=None: exchange.markets
+        for name in RECORDED:
+            setattr(exchange, name, (lambda n: lambda *a, **kw: self.play(exchange, n, *a, **kw))(name))
+        return exchange
+
+    def report(self) -> dict:
+        return {"served": self.served, "total": self.total, "diverged": self.diverged, "missing": self.missing,
+                "virtual_sec": self.clock.now - self.header["t"], "real_sec": time.perf_counter() - self._real_t0}
+
+    def finish(self):
+        rep = self.report()
+        log.info(f"[CASSETTE] Fin du rejeu : {rep['served']}/{rep['total']} réponses servies, "
+                 f"{rep['diverged']} divergence(s), {rep['missing']} appel(s) sans réponse | "
+                 f"{rep['virtual_sec']:.0f}s enregistrées rejouées en {rep['real_sec']:.1f}s",
+                 extra={"event": "cassette_end", **rep})
+        raise CassetteEnd(0)
+
+
+_recorder: Optional[CassetteRecorder] = None
+_player: Optional[CassettePlayer] = None
+
+def record_exchange(exchange, path: str = CASSETTE_FILE):
+    """Enregistre le trafic de `exchange` (un seul enregistreur par process : bot_loop relancé → même cassette)."""
+    global _recorder
+    if _recorder is None:
+        _recorder = CassetteRecorder(path)
+        _recorder.header(exchange)
+        atexit.register(_recorder.close)
+        log.info(f"[CASSETTE] Enregistrement du trafic exchange -> {path}")
+    return _recorder.install(exchange)
+
+def replay_exchange(path: str = CASSETTE_FILE, real_latency: bool = CASSETTE_REAL_LATENCY):
+    """Exchange rejoué + horloge virtuelle (le lecteur est conservé entre relances de bot_loop)."""
+    global _player
+    if _player is None:
+        _player = CassettePlayer(path, real_latency)
+        _player.clock.install()
+        speed = "latences d'origine" if real_latency else "pleine vitesse"
+        log.info(f"[CASSETTE] Rejeu de {path} : {_player.total} appels ({speed})")
+    return _player.build()
+
+
+# ---------- CLI ----------
+def info(path: str, top: int = 10):
+    recs = read_cassette(path)
+    head = recs[0] if recs and recs[0].get("kind") == "header" else {}
+    calls = [r for r in recs if r["kind"] == "call"]
+    if not calls:
+        print(f"{path} : aucun appel enregistré")
+        return
+    span = max(r["t"] + r["d"] for r in calls) - min(r["t"] for r in calls)
+    print(f"{path} : exchange={head.get('exchange')} | {len(calls)} appels sur {span:.0f}s | "
+          f"{os.path.getsize(path) / 1024:.0f} Ko")
+    by_m = defaultdict(list)
+    for r in calls:
+        by_m[r["m"]].append(r)
+    for m, rs in sorted(by_m.items()):
+        d = sorted(r["d"] * 1000 for r in rs)
+        print(f"  {m:<16} n={len(rs):<6} err={sum(1 for r in rs if 'e' in r):<4} "
+              f"p50={d[len(d) // 2]:7.1f}ms p95={d[int(len(d) * 0.95)]:7.1f}ms max={d[-1]:7.1f}ms")
+    print("Appels les plus lents :")
+    for r in sorted(calls, key=lambda r: -r["d"])[:top]:
+        print(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(r['t']))} {r['d'] * 1000:8.1f}ms "
+              f"{r['m']} {r['k'][:80]}{' -> ' + r['e'][0] if 'e' in r else ''}")
+
+
+def replay(path: str, real_latency: bool = False) -> int:
+    """Rejoue bot.py dans un répertoire temporaire : environnement et état de départ de la cassette,
+    sorties (état, logs, webhooks, métriques, snapshots) neutralisées."""
+    head = read_cassette(path)[0]
+    work = tempfile.mkdtemp(prefix="cassette_")
+    state_file = os.path.join(work, "state.json")
+    for suffix, data in head.get("state", {}).items():
+        with open(state_file + suffix, "wb") as f:
+            f.write(data)
+    env = dict(os.environ)
+    env.update(head.get("env", {}))
+    env.update({
+        "CASSETTE_MODE": "replay",
+        "CASSETTE_FILE": os.path.abspath(path),
+        "CASSETTE_REAL_LATENCY": "true" if real_latency else "false",
+        "STATE_FILE": state_file,
+        "STATE_BACKUP_DIR": os.path.join(work, "backups"),
+        "MARKETS_CACHE_FILE": os.path.join(work, "markets.json"),
+        "HEARTBEAT_FILE": os.path.join(work, "heartbeat.txt"),
+        "LOG_FILE": os.path.join(work, "bot.log"),
+        "WARM_SNAPSHOT_FILE": "",
+        "OHLCV_STORE_DIR": "",
+        "SHARD_COORDINATOR": "",
+        "METRICS_PORT": "0",
+        "WEBHOOK_URL": "",
+    })
+    print(f"[CASSETTE] Rejeu de {path} dans {work}")
+    bot_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+    return subprocess.call([sys.executable, bot_py], env=env, cwd=work)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Cassettes de trafic exchange (enregistrement : CASSETTE_MODE=record)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("info", help="statistiques d'une cassette")
+    p.add_argument("path", nargs="?", default=CASSETTE_FILE)
+    p.add_argument("--top", type=int, default=10)
+    p = sub.add_parser("replay", help="rejoue bot.py sur une cassette")
+    p.add_argument("path", nargs="?", default=CASSETTE_FILE)
+    p.add_argument("--real-latency", action="store_true", help="rejoue les latences d'origine")
+    args = ap.parse_args()
+    if args.cmd == "info":
+        info(args.path, args.top)
+    else:
+        sys.exit(replay(args.path, args.real_latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -43,6 +43,9 @@ CB_COOLDOWN_MIN = int(os.getenv("CB_COOLDOWN_MIN", "30"))
 
 MAX_BUYS_PER_24H = int(os.getenv("MAX_BUYS_PER_24H", "0"))
 WEBHOOK_URL      = os.getenv("WEBHOOK_URL", "").strip()
+WEBHOOK_QUEUE_MAX    = int(os.getenv("WEBHOOK_QUEUE_MAX", "500"))       # file bornée (jamais bloquante)
+WEBHOOK_COALESCE_SEC = float(os.getenv("WEBHOOK_COALESCE_SEC", "3"))    # fenêtre de regroupement *_dry
+WEBHOOK_RETRIES      = int(os.getenv("WEBHOOK_RETRIES", "3"))
 
 # ----------- Profils indicateurs (universels) -----------
 # Petits TF → Donchian obligatoire + volume mini plus bas
@@ -64,6 +67,10 @@ LONG_TF_CONF = {
 HEARTBEAT_FILE         = os.getenv("HEARTBEAT_FILE", "/tmp/bot_heartbeat.txt")
 HEARTBEAT_INTERVAL_SEC = int(os.getenv("HEARTBEAT_INTERVAL_SEC", "30"))
 MAX_STALE_SEC_ENV      = os.getenv("MAX_STALE_SEC", "").strip()
+CANDLE_SETTLE_SEC      = float(os.getenv("CANDLE_SETTLE_SEC", "2"))  # délai après la frontière TF avant traitement
+WARM_SNAPSHOT_FILE        = os.getenv("WARM_SNAPSHOT_FILE", STATE_FILE + ".warm")  # vide = pas de redémarrage à chaud
+WARM_SNAPSHOT_SEC         = float(os.getenv("WARM_SNAPSHOT_SEC", "60"))        # écriture au plus 1 fois par période
+WARM_SNAPSHOT_MAX_AGE_SEC = float(os.getenv("WARM_SNAPSHOT_MAX_AGE_SEC", "3600"))  # au-delà : démarrage à froid
 # -> MAX_STALE_SEC sera recalculé dynamiquement dans bot.py selon min TF
 
 # ----------- Hystérésis / SL/TP / Stale par TF -----------
@@ -77,6 +84,7 @@ TP_TRAIL_FALLBACK      = float(os.getenv("TP_TRAIL", "0.02"))
 STOP_LOSS_BY_TF  = {"1m":0.015,"2m":0.018,"5m":0.020,"15m":0.030,"30m":0.040,"1h":0.050,"2h":0.055,"4h":0.060,"1d":0.090,"1w":0.150}
 TP_TRIGGER_BY_TF = {"1m":0.030,"2m":0.035,"5m":0.040,"15m":0.050,"30m":0.060,"1h":0.060,"2h":0.070,"4h":0.080,"1d":0.100,"1w":0.120}
 TP_TRAIL_BY_TF   = {"1m":0.015,"2m":0.020,"5m":0.020,"15m":0.030,"30m":0.030,"1h":0.040,"2h":0.040,"4h":0.050,"1d":0.060,"1w":0.080}
+EXIT_MONITOR_SEC = float(os.getenv("EXIT_MONITOR_SEC", "5"))  # SL/TP intra-bougie : période de polling tickers (0 = off)
 
 # ----------- Détection manuelle -----------
 MANUAL_ADD_TOL           = float(os.getenv("MANUAL_ADD_TOL", "0.03"))
@@ -87,3 +95,74 @@ MANUAL_SELL_EMPTY_THRESH = float(os.getenv("MANUAL_SELL_EMPTY_THRESH", "1e-9"))
 # ----------- Anti-slippage / risk fraction globaux -----------
 DEFAULT_MAX_SLIPPAGE_PCT = float(os.getenv("DEFAULT_MAX_SLIPPAGE_PCT", "2.0"))
 DEFAULT_RISK_FRACTION    = float(os.getenv("DEFAULT_RISK_FRACTION", "0.99"))  # max 99% de l’USDT libre
+
+# ----------- Cache OHLCV local -----------
+OHLCV_CACHE_MAX_BARS   = int(os.getenv("OHLCV_CACHE_MAX_BARS", "1000"))   # bougies max par série
+OHLCV_CACHE_MAX_SERIES = int(os.getenv("OHLCV_CACHE_MAX_SERIES", "256"))  # séries max (éviction LRU)
+PREFETCH_WORKERS       = int(os.getenv("PREFETCH_WORKERS", "8"))          # threads de préchargement OHLCV
+RESAMPLE_TFS           = (os.getenv("RESAMPLE_TFS", "true").lower() == "true")  # TF dérivés du plus petit TF du symbole
+
+# ----------- Ordonnanceur de requêtes (token buckets, cf. ratelimit.py) -----------
+RL_SCHEDULER   = (os.getenv("RL_SCHEDULER", "true").lower() == "true")
+RL_PUBLIC_RPS  = float(os.getenv("RL_PUBLIC_RPS", "20"))    # données de marché (par IP)
+RL_PRIVATE_RPS = float(os.getenv("RL_PRIVATE_RPS", "10"))   # solde / fills (par UID)
+RL_ORDER_RPS   = float(os.getenv("RL_ORDER_RPS", "10"))     # passage d'ordres (par UID)
+RL_GLOBAL_RPS  = float(os.getenv("RL_GLOBAL_RPS", "30"))    # plafond global (0 = désactivé)
+
+# ----------- Logs (cf. logging_setup.py) -----------
+LOG_FORMAT    = os.getenv("LOG_FORMAT", "text")            # text | json (JSON lines)
+LOG_LEVEL     = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE      = os.getenv("LOG_FILE", "bot.log")           # vide = pas de fichier
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", "2000000"))
+LOG_BACKUPS   = int(os.getenv("LOG_BACKUPS", "3"))
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "50000"))   # lignes en attente max (au-delà : abandon)
+
+# ----------- Métriques (endpoint texte Prometheus local) -----------
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))           # 0 = serveur désactivé
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# ----------- Profilage à la demande (cf. profiler.py) -----------
+PROFILE_ENABLED      = (os.getenv("PROFILE_ENABLED", "false").lower() == "true")
+PROFILE_CONTROL_FILE = os.getenv("PROFILE_CONTROL_FILE", "/tmp/bot_profile")  # présent = profilage actif
+PROFILE_DIR          = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_EVERY_N      = int(os.getenv("PROFILE_EVERY_N", "10"))     # 1 rapport tous les N cycles
+PROFILE_SLOW_SEC     = float(os.getenv("PROFILE_SLOW_SEC", "5"))   # + tout cycle plus lent
+PROFILE_KEEP         = int(os.getenv("PROFILE_KEEP", "20"))        # rapports conservés
+
+# ----------- Cache disque des marchés -----------
+MARKETS_CACHE_FILE    = os.getenv("MARKETS_CACHE_FILE", "markets_cache.json")
+MARKETS_CACHE_TTL_SEC = float(os.getenv("MARKETS_CACHE_TTL_SEC", "21600"))  # 6h, rafraîchi en tâche de fond
+
+# ----------- Historique OHLCV sur disque (cf. ohlcv_store.py) -----------
+OHLCV_STORE_DIR = os.getenv("OHLCV_STORE_DIR", "")  # vide = désactivé ; sinon bougies clôturées archivées
+
+# ----------- Exécution multi-process (cf. shard_runner.py) -----------
+SHARD_WORKERS         = int(os.getenv("SHARD_WORKERS", "0"))           # superviseur : 0 = nb de cœurs
+SHARD_ID              = int(os.getenv("SHARD_ID", "0"))                # fixé par le superviseur
+SHARD_COORDINATOR     = os.getenv("SHARD_COORDINATOR", "").strip()     # socket du coordinateur (vide = process unique)
+SHARD_AUTHKEY         = os.getenv("SHARD_AUTHKEY", "")
+SHARD_RESERVE_TTL_SEC = float(os.getenv("SHARD_RESERVE_TTL_SEC", "120"))  # réservation non soldée → libérée
+SHARD_ARCHIVE_CB      = (os.getenv("SHARD_ARCHIVE_CB", "true").lower() == "true")  # seul le shard propriétaire archive CB_SYMBOL
+
+# ----------- Scanner de marché (cf. scanner.py) -----------
+SCAN_QUOTE          = os.getenv("SCAN_QUOTE", "USDT")
+SCAN_TF             = os.getenv("SCAN_TF", "5m")
+SCAN_MIN_QUOTE_VOL  = float(os.getenv("SCAN_MIN_QUOTE_VOL", "1000000"))  # volume 24h min (en devise de cotation)
+SCAN_MAX_SPREAD_PCT = float(os.getenv("SCAN_MAX_SPREAD_PCT", "0.3"))      # spread bid/ask max (%)
+SCAN_MAX_CANDIDATES = int(os.getenv("SCAN_MAX_CANDIDATES", "600"))       # survivants max (par volume décroissant)
+SCAN_EXCLUDE_BASES  = [b.strip().upper() for b in os.getenv("SCAN_EXCLUDE_BASES", "USDC,DAI,TUSD,FDUSD,USDE,EUR").split(",") if b.strip()]
+
+# ----------- Exchange simulé (paper trading / tests de charge) -----------
+SIM_EXCHANGE   = (os.getenv("SIM_EXCHANGE", "false").lower() == "true")
+SIM_LATENCY_MS = float(os.getenv("SIM_LATENCY_MS", "0"))      # latence moyenne injectée par appel
+SIM_JITTER_MS  = float(os.getenv("SIM_JITTER_MS", "0"))       # +/- aléatoire autour de la latence
+SIM_ERROR_RATE = float(os.getenv("SIM_ERROR_RATE", "0"))      # probabilité d'erreur réseau par appel
+SIM_USDT       = float(os.getenv("SIM_USDT", "10000"))        # solde USDT initial
+SIM_SPREAD_BPS = float(os.getenv("SIM_SPREAD_BPS", "5"))      # spread du carnet simulé
+SIM_CSV_DIR    = os.getenv("SIM_CSV_DIR", "").strip()         # bougies enregistrées {SYM_QUOTE}_{tf}.csv
+SIM_UNIVERSE   = int(os.getenv("SIM_UNIVERSE", "0"))          # marchés synthétiques SIMnnn/USDT en plus (scanner)
+
+# ----------- Cassettes (enregistrement / rejeu du trafic exchange) -----------
+CASSETTE_MODE         = os.getenv("CASSETTE_MODE", "").strip().lower()  # "" | record | replay
+CASSETTE_FILE         = os.getenv("CASSETTE_FILE", "cassette.bin")
+CASSETTE_REAL_LATENCY = (os.getenv("CASSETTE_REAL_LATENCY", "false").lower() == "true")  # rejeu : latences d'origine
@@ -2,9 +2,13 @@
 # -*- coding: utf-8 -*-
 from typing import Optional
 import time
+import functools
 import logging
+import threading
 import ccxt
 
+import metrics
+
 log = logging.getLogger("bot")
 
 # Erreurs réseau/charge à retenter
@@ -22,21 +26,50 @@ def with_retry(fn, retries: int = 3, base_sleep: float = 1.0, *a, **kw):
         try:
             return fn(*a, **kw)
         except NETWORK_EXCEPTIONS as e:
-            wait = base_sleep * (2 ** i)
+            metrics.inc("bot_retries_total", fn=getattr(fn, "__name__", "?"), error=type(e).__name__)
+            # 429 déjà traité par l'ordonnanceur (bucket bloqué le temps voulu) → pas de pause aveugle
+            wait = 0.0 if getattr(e, "rate_scheduled", False) else base_sleep * (2 ** i)
             log.warning(f"[RETRY] Tentative {i+1}/{retries} après erreur réseau: {e} (pause {wait}s)")
             time.sleep(wait)
     # Dernière tentative sans capture pour surfacer l'erreur
     return fn(*a, **kw)
 
+def make_throttle_thread_safe(exchange):
+    """Rend le rate limiter ccxt (sync) sûr entre threads : chaque requête réserve
+    son créneau sous verrou, l'I/O réseau reste concurrente."""
+    if getattr(exchange, "_throttle_locked", False):
+        return exchange
+    lock = threading.Lock()
+    orig_throttle = exchange.throttle
+
+    def throttle(cost=None):
+        with lock:
+            orig_throttle(cost)
+            exchange.lastRestRequestTimestamp = exchange.milliseconds()
+
+    exchange.throttle = throttle
+    exchange._throttle_locked = True
+    return exchange
+
 def build_exchange():
-    """Construit l'instance Bitget Spot depuis les variables d'environnement."""
+    """Construit l'instance Bitget Spot depuis les variables d'environnement
+    (SIM_EXCHANGE=true → exchange simulé local, sans clés ni réseau ;
+    CASSETTE_MODE=record|replay → trafic enregistré / rejoué, cf. cassette.py)."""
     import os
+    from config import SIM_EXCHANGE, CASSETTE_MODE
+    if CASSETTE_MODE == "replay":
+        from cassette import replay_exchange
+        return replay_exchange()
+    if SIM_EXCHANGE:
+        from sim_exchange import build_sim_exchange
+        log.info("[SIM] Exchange simulé actif (aucun ordre réel)")
+        return _pace(_record(build_sim_exchange()))
     api_key = os.getenv("API_KEY")
     api_secret = os.getenv("API_SECRET")
     password = os.getenv("PASSWORD")
     if not api_key or not api_secret or not password:
         raise ValueError("[ERROR] API_KEY, API_SECRET ou PASSWORD manquants")
-    return ccxt.bitget({
+    exchange = ccxt.bitget({
         "apiKey": api_key,
         "secret": api_secret,
         "password": password,
@@ -44,6 +77,56 @@ def build_exchange():
         "options": {"defaultType": "spot"},
         "timeout": 20000,
     })
+    return _pace(_record(exchange))
+
+def _record(exchange):
+    """CASSETTE_MODE=record : trafic enregistré sous l'ordonnanceur (latences réseau seules)."""
+    from config import CASSETTE_MODE
+    if CASSETTE_MODE == "record":
+        from cassette import record_exchange
+        return record_exchange(exchange)
+    return exchange
+
+def _pace(exchange):
+    """Ordonnanceur token-bucket (RL_SCHEDULER) sinon throttle ccxt rendu thread-safe."""
+    from config import RL_SCHEDULER
+    if RL_SCHEDULER:
+        from ratelimit import install_scheduler
+        return install_scheduler(exchange)
+    return make_throttle_thread_safe(exchange)
+
+class BalanceSnapshot:
+    """
+    Solde du compte partagé par tous les consommateurs d'un cycle.
+    - refresh() : 1 seul fetch_balance par cycle
+    - invalidate() après chaque ordre : la lecture suivante refetch une fois
+    """
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self._bal = None
+        self._lock = threading.Lock()
+        self.fetched_at = 0.0
+
+    def refresh(self) -> dict:
+        with metrics.timed("bot_balance_fetch_seconds"):
+            bal = with_retry(self.exchange.fetch_balance, 3, 1)
+        with self._lock:
+            self._bal = bal
+            self.fetched_at = time.time()
+        return bal
+
+    def invalidate(self):
+        with self._lock:
+            self._bal = None
+
+    def get(self) -> dict:
+        with self._lock:
+            bal = self._bal
+        return bal if bal is not None else self.refresh()
+
+    def free(self, ccy: str) -> float:
+        return float((self.get().get(ccy) or {}).get("free", 0.0))
 
 def best_last_from_ticker(t: dict) -> float:
     """Retourne un 'last' exploitable en priorisant last/close/bid/ask puis mid(bid,ask)."""
@@ -62,11 +145,30 @@ def best_last_from_ticker(t: dict) -> float:
         pass
     raise ValueError("Ticker sans prix exploitable")
 
-def place_market_buy(exchange, symbol: str, usdt_amount: float, slip_limit_pct: Optional[float] = None):
+def _order_metrics(side: str):
+    """Durée + issue (placed / skipped / error) des ordres, étiquetées par symbole."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(exchange, symbol, *a, **kw):
+            t0 = time.perf_counter()
+            outcome = "error"
+            try:
+                out = fn(exchange, symbol, *a, **kw)
+                outcome = "skipped" if isinstance(out, dict) and out.get("skipped") else "placed"
+                return out
+            finally:
+                metrics.observe("bot_order_seconds", time.perf_counter() - t0, symbol=symbol, side=side)
+                metrics.inc("bot_orders_total", symbol=symbol, side=side, outcome=outcome)
+        return wrapper
+    return deco
+
+@_order_metrics("buy")
+def place_market_buy(exchange, symbol: str, usdt_amount: float, slip_limit_pct: Optional[float] = None,
+                     balances: Optional[BalanceSnapshot] = None):
     """
     Achat market pour un budget en USDT.
     - Anti-slippage : check (ask - last)/last vs slip_limit_pct
-    - Capé au solde USDT 'free'
+    - Capé au solde USDT 'free' (snapshot `balances` si fourni)
     - Respecte min_amount / min_cost du marché
     """
     market = exchange.market(symbol)
@@ -87,8 +189,11 @@ def place_market_buy(exchange, symbol: str, usdt_amount: float, slip_limit_pct:
             return {"skipped": True, "reason": "anti_slippage", "pre_slip_pct": round(pre_slip, 4), "limit_pct": slip_limit_pct}
 
     # Solde USDT et clamp du montant
-    bal = with_retry(exchange.fetch_balance, 3, 1)
-    usdt_free = float((bal.get("USDT") or {}).get("free", 0.0))
+    if balances is not None:
+        usdt_free = balances.free("USDT")
+    else:
+        bal = with_retry(exchange.fetch_balance, 3, 1)
+        usdt_free = float((bal.get("USDT") or {}).get("free", 0.0))
     usdt_amount = max(0.0, min(usdt_amount, usdt_free * 0.99))
     if usdt_amount <= 0:
         return {"skipped": True, "reason": "no_budget"}
@@ -110,11 +215,17 @@ def place_market_buy(exchange, symbol: str, usdt_amount: float, slip_limit_pct:
         return {"skipped": True, "reason": "cost_too_small", "est_cost": est_cost, "min_cost": min_cost}
 
     log.info(f"[ORDER] BUY {symbol} amount={amount_prec} usdt~={usdt_amount:.4f} (slip_limit={slip_limit_pct})")
-    return with_retry(exchange.create_order, 3, 1, symbol, "market", "buy", amount_prec)
+    try:
+        return with_retry(exchange.create_order, 3, 1, symbol, "market", "buy", amount_prec)
+    finally:
+        if balances is not None:
+            balances.invalidate()
 
-def place_market_sell_all(exchange, symbol: str, slip_limit_pct: Optional[float] = None):
+@_order_metrics("sell")
+def place_market_sell_all(exchange, symbol: str, slip_limit_pct: Optional[float] = None,
+                          balances: Optional[BalanceSnapshot] = None):
     """
-    Vente market de TOUT le solde base disponible.
+    Vente market de TOUT le solde base disponible (snapshot `balances` si fourni).
     - Anti-slippage : check (last - bid)/last vs slip_limit_pct
     - Respecte min_amount / min_cost
     """
@@ -135,8 +246,11 @@ def place_market_sell_all(exchange, symbol: str, slip_limit_pct: Optional[float]
             return {"skipped": True, "reason": "anti_slippage_sell", "pre_slip_pct": round(pre_slip, 4), "limit_pct": slip_limit_pct}
 
     base_ccy = market.get("base")
-    bal = with_retry(exchange.fetch_balance, 3, 1)
-    free_base = float((bal.get(base_ccy) or {}).get("free", 0.0))
+    if balances is not None:
+        free_base = balances.free(base_ccy)
+    else:
+        bal = with_retry(exchange.fetch_balance, 3, 1)
+        free_base = float((bal.get(base_ccy) or {}).get("free", 0.0))
     if free_base <= 0:
         return {"skipped": True, "reason": "no_base_balance", "symbol": symbol, "base": base_ccy}
 
@@ -153,4 +267,8 @@ def place_market_sell_all(exchange, symbol: str, slip_limit_pct: Optional[float]
         return {"skipped": True, "reason": "cost_too_small", "symbol": symbol}
 
     log.info(f"[ORDER] SELL {symbol} amount={amount_prec} (liquidation)")
-    return with_retry(exchange.create_order, 3, 1, symbol, "market", "sell", amount_prec)
+    try:
+        return with_retry(exchange.create_order, 3, 1, symbol, "market", "sell", amount_prec)
+    finally:
+        if balances is not None:
+            balances.invalidate()
@@ -0,0 +1,161 @@
+# exit_monitor.py
+# -*- coding: utf-8 -*-
+"""
+Surveillance SL / TP intra-bougie des positions ouvertes.
+
+- Thread daemon : toutes les EXIT_MONITOR_SEC secondes, UN appel fetch_tickers pour tous les
+  symboles en position (coût ≈ 1 requête publique par tick, quel que soit le nombre de positions).
+- Mêmes règles que la boucle principale (sl_tp_params / position_pnl) évaluées au bid :
+  mise à jour du pic, armement du trailing TP, sortie via place_market_sell_all (ou simulée en DRY_RUN).
+- État partagé avec bot_loop (dicts last_side / entry_price / peak_price / tp_armed / ...) :
+  lectures-écritures sous le verrou partagé, jamais tenu pendant un appel réseau. Une sortie
+  est réservée dans state["closing"] (bot_loop ou moniteur, un seul vendeur par position)
+  avant l'ordre, passé hors verrou.
+- Prix plus vieux que EXIT_MONITOR_SEC au moment de l'évaluation (attente du verrou, sorties
+  précédentes du même tick) : position ignorée jusqu'au tick suivant, qui refetch les tickers.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from config import FEE_TAKER_PCT, SELL_SLIP_PCT, EXIT_MONITOR_SEC
+from execution import place_market_sell_all, BalanceSnapshot
+from signals import sl_tp_params, position_pnl
+from utils import send_webhook
+import metrics
+
+log = logging.getLogger("bot")
+
+metrics.REGISTRY.counter("bot_exit_monitor_total", "Sorties / armements TP déclenchés par le moniteur intra-bougie")
+
+
+class ExitMonitor:
+    def __init__(self, exchange, balances: Optional[BalanceSnapshot], state: Dict[str, dict], lock,
+                 save: Callable[[], None], keys: Iterable[tuple], dry_run: bool = True,
+                 interval_sec: float = EXIT_MONITOR_SEC):
+        self.exchange = exchange
+        self.balances = balances
+        self.state = state          # last_side, entry_price, peak_price, tp_armed, base_qty_at_entry, last_trade_ts,
+                                    # closing (positions en cours de vente)
+        self.lock = lock            # verrou partagé avec bot_loop
+        self.save = save            # save_state(...) avec les dicts de bot_loop
+        self.keys = set(keys)       # (symbol, tf) configurés : les autres positions sont ignorées
+        self.dry_run = dry_run
+        self.interval_sec = float(interval_sec)
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- Cycle de vie ----------
+    def start(self):
+        if self.interval_sec <= 0:
+            return self
+        self._thread = threading.Thread(target=self._run, name="exit-monitor", daemon=True)
+        self._thread.start()
+        log.info(f"[EXITMON] Surveillance SL/TP intra-bougie toutes les {self.interval_sec:g}s")
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            try:
+                self.tick()
+            except Exception as e:
+                log.warning(f"[EXITMON] Tick KO: {e}")
+
+    # ---------- Tick ----------
+    def open_positions(self):
+        with self.lock:
+            return [k for k, side in self.state["last_side"].items() if side == "buy" and k in self.keys]
+
+    def tick(self):
+        positions = self.open_positions()
+        if not positions:
+            return
+        symbols = sorted({sym for sym, _ in positions})
+        tickers = self.exchange.fetch_tickers(symbols)
+        fetched_at = time.monotonic()
+        for key in positions:
+            t = tickers.get(key[0]) or {}
+            price = t.get("bid") or t.get("last")
+            if price:
+                self.check(key, float(price), fetched_at)
+
+    def check(self, key: tuple, price: float, fetched_at: Optional[float] = None):
+        """Applique SL / trailing TP à la position `key` au prix `price` (relevé à `fetched_at`, monotonic)."""
+        sym, tf = key
+        st = self.state
+        with self.lock:
+            if fetched_at is not None and time.monotonic() - fetched_at > self.interval_sec:
+                log.debug(f"[EXITMON] Prix {sym}@{tf} périmé ({time.monotonic() - fetched_at:.1f}s) : tick suivant")
+                return
+            if st["last_side"].get(key) != "buy" or key not in st["entry_price"] or key in st["closing"]:
+                return  # vendue / en cours de vente, ou pas encore initialisée par bot_loop
+            peak = st["peak_price"][key] = max(st["peak_price"].get(key, price), price)
+            pnl_net, drawdown_net = position_pnl(st["entry_price"][key], peak, price, FEE_TAKER_PCT)
+            sl_pct, tp_trigger, tp_trail = sl_tp_params(tf)
+
+            if not st["tp_armed"].get(key, False) and pnl_net >= tp_trigger:
+                st["tp_armed"][key] = True
+                metrics.inc("bot_exit_monitor_total", event="tp_armed")
+                log.info(f"[EXITMON] Trailing armé {sym}@{tf} @ gain_net={pnl_net*100:.2f}%")
+                self.save()
+
+            if sl_pct and pnl_net <= -sl_pct:
+                reason = "sl"
+                log.info(f"[EXITMON] Stop-loss SELL {sym}@{tf}: {pnl_net*100:.2f}% (bid={price:.8f})")
+            elif st["tp_armed"].get(key, False) and drawdown_net <= -tp_trail:
+                reason = "tp_trail"
+                log.info(f"[EXITMON] Trailing SELL {sym}@{tf}: drawdown={drawdown_net*100:.2f}% (bid={price:.8f})")
+            else:
+                return
+            st["closing"].add(key)
+        try:
+            self._exit(key, price, reason)
+        finally:
+            with self.lock:
+                st["closing"].discard(key)
+
+    def _exit(self, key: tuple, price: float, reason: str):
+        """Vente hors verrou (réservée dans state["closing"] par check), puis reset de l'état sous verrou."""
+        sym, tf = key
+        st = self.state
+        t0 = time.perf_counter()
+        if not self.dry_run:
+            if self.balances is not None:
+                # Snapshot de bot_loop potentiellement vieux de plusieurs heures (TF 1h/4h, vente manuelle)
+                self.balances.invalidate()
+            try:
+                order = place_market_sell_all(self.exchange, sym, slip_limit_pct=SELL_SLIP_PCT,
+                                              balances=self.balances)
+            except Exception as e:
+                log.error(f"[EXITMON] SELL échec ({sym}) -> {e}")
+                return
+            if isinstance(order, dict) and order.get("skipped"):
+                log.info(f"[EXITMON] SELL-SKIP {sym} (reason={order.get('reason')})")
+                return
+        with self.lock:
+            for d in ("entry_price", "peak_price", "tp_armed", "base_qty_at_entry"):
+                st[d].pop(key, None)
+            st["last_side"][key] = "sell"
+            st["last_trade_ts"][key] = time.time()
+            self.save()
+        metrics.inc("bot_exit_monitor_total", event=reason)
+        log.info("[EXITMON] Sortie %s %s@%s en %.2fs", reason, sym, tf, time.perf_counter() - t0,
+                 extra={"event": "exit_monitor", "symbol": sym, "tf": tf, "reason": reason, "price": price,
+                        "dry_run": self.dry_run})
+        send_webhook("sell_dry" if self.dry_run else "sell",
+                     {"symbol": sym, "tf": tf, "price": price, "reason": reason, "source": "intra-bougie"})
+
+
+_current: Optional[ExitMonitor] = None
+
+def start_exit_monitor(*args, **kwargs) -> ExitMonitor:
+    """Démarre le moniteur (un seul par process : un bot_loop relancé remplace le précédent)."""
+    global _current
+    if _current is not None:
+        _current.stop()
+    _current = ExitMonitor(*args, **kwargs).start()
+    return _current
@@ -0,0 +1,297 @@
+# indicators.py
+# -*- coding: utf-8 -*-
+"""
+Moteur d'indicateurs incrémental (streaming) pour hybrid_signal.
+
+Un moteur par (symbole, TF, paramètres) : amorcé une fois sur l'historique,
+puis mis à jour en O(1) par bougie nouvelle ou révisée.
+- Bougies clôturées : état "committé" (EMA/RSI/ATR/Supertrend, deques Donchian, sommes volume).
+- Bougie en cours : calcul provisoire à partir de l'état committé, sans le modifier.
+
+Les EMA démarrent au début de l'amorçage (et non au début de la fenêtre de 300 bougies),
+l'écart avec le calcul batch décroît en (1-alpha)^n et devient négligeable après warmup.
+"""
+import math
+import logging
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+log = logging.getLogger("bot")
+
+NAN = float("nan")
+
+
+def _ewm_step(w: float, x: float, alpha: float) -> float:
+    """Une étape d'EWM adjust=False (même arithmétique que pandas)."""
+    if x != x:
+        return w
+    if w != w:
+        return x
+    if w != x:
+        old_wt = 1.0 - alpha
+        w = (old_wt * w + alpha * x) / (old_wt + alpha)
+    return w
+
+
+class _RollingSum:
+    """Somme glissante sur `window` valeurs committées (+ valeur provisoire en lecture)."""
+
+    def __init__(self, window: int):
+        self.window = max(int(window), 1)
+        self.buf = deque()
+        self.total = 0.0
+        self._pushes = 0
+
+    def push(self, x: float):
+        self.buf.append(x)
+        self.total += x
+        if len(self.buf) > self.window:
+            self.total -= self.buf.popleft()
+        self._pushes += 1
+        if self._pushes % 1000 == 0:  # recalage anti-dérive flottante (amorti O(1))
+            self.total = math.fsum(self.buf)
+
+    def mean_with(self, x: Optional[float]) -> Tuple[float, int]:
+        """Moyenne des `window` dernières valeurs en ajoutant x (si fourni)."""
+        if x is None:
+            n = len(self.buf)
+            return (self.total / n if n else 0.0), n
+        total, n = self.total + x, len(self.buf) + 1
+        if n > self.window:
+            total -= self.buf[0]
+            n = self.window
+        return total / n, n
+
+
+class _MonoDeque:
+    """Max (ou min) glissant via deque monotone sur les valeurs committées."""
+
+    def __init__(self, window: int, is_max: bool):
+        self.window = max(int(window), 1)
+        self.is_max = is_max
+        self.dq = deque()  # (index, valeur), valeurs monotones
+        self.count = 0
+
+    def _better(self, a: float, b: float) -> bool:
+        return a >= b if self.is_max else a <= b
+
+    def push(self, x: float):
+        i = self.count
+        while self.dq and self._better(x, self.dq[-1][1]):
+            self.dq.pop()
+        self.dq.append((i, x))
+        self.count += 1
+        if self.dq[0][0] <= i - self.window:
+            self.dq.popleft()
+
+    def value(self) -> Optional[float]:
+        """Extrême sur les `window` dernières valeurs committées (None si historique trop court)."""
+        if self.count < self.window or not self.dq:
+            return None
+        return self.dq[0][1]
+
+    def value_with(self, x: float) -> Optional[float]:
+        """Extrême sur la fenêtre se terminant par la valeur provisoire x."""
+        if self.count + 1 < self.window:
+            return None
+        start = self.count + 1 - self.window
+        best = x
+        for i, v in self.dq:
+            if i >= start:
+                if self._better(v, best):
+                    best = v
+                break  # le premier élément dans la fenêtre est l'extrême committé
+        return best
+
+
+class IndicatorEngine:
+    """État incrémental RSI / RSI lissé / ATR / Supertrend / Donchian / volume $ pour une paire."""
+
+    def __init__(self, conf: dict, rsi_period: int, avg_type: str, avg_period: int):
+        self.rsi_period = int(rsi_period)
+        self.avg_type = (avg_type or "ema").lower()
+        self.avg_period = int(avg_period)
+        self.atr_period = int(conf["supertrend"]["atr_period"])
+        self.mult = float(conf["supertrend"]["mult"])
+        self.don_len = int(conf["donchian"]["length"])
+        self.v_look = int(conf["volume"]["lookback"])
+        # Warmup : fenêtres pleines + convergence des EMA
+        self.min_bars = max(self.don_len, self.v_look, self.avg_period,
+                            5 * max(self.rsi_period, self.atr_period, self.avg_period))
+        self.reset()
+
+    def reset(self):
+        self.n = 0                # nb de bougies committées
+        self.last_ts = None       # ts de la dernière bougie committée
+        self.last_row = None
+        self.forming = None       # bougie en cours (non committée)
+        # Scalaires committés (voir _advance)
+        self.sc = {
+            "prev_close": NAN, "gain_w": NAN, "loss_w": NAN, "rsi_n": 0,
+            "rsi": NAN, "rsi_ema": NAN, "atr_w": NAN,
+            "st": NAN, "dir": 0, "close": NAN,
+        }
+        self.rsi_sma = _RollingSum(self.avg_period)
+        self.dollar_vol = _RollingSum(self.v_look)
+        self.don_high = _MonoDeque(self.don_len, is_max=True)
+        self.don_low = _MonoDeque(self.don_len, is_max=False)
+
+    @property
+    def ready(self) -> bool:
+        return self.n >= self.min_bars
+
+    # ---------- Étape pure (sans mutation) ----------
+    def _advance(self, sc: dict, row) -> dict:
+        _, _, h, l, c, _ = row
+        h, l, c = float(h), float(l), float(c)
+        pc = sc["prev_close"]
+        out = dict(sc)
+
+        # RSI (EWM gains/pertes, alpha=1/période)
+        a_rsi = 1.0 / self.rsi_period
+        if pc == pc:
+            delta = c - pc
+            out["gain_w"] = _ewm_step(sc["gain_w"], max(delta, 0.0), a_rsi)
+            out["loss_w"] = _ewm_step(sc["loss_w"], max(-delta, 0.0), a_rsi)
+            out["rsi_n"] = sc["rsi_n"] + 1
+        rsi = NAN
+        if out["rsi_n"] >= self.rsi_period and out["loss_w"] != 0:
+            rsi = 100.0 - 100.0 / (1.0 + out["gain_w"] / out["loss_w"])
+            rsi = min(max(rsi, 0.0), 100.0)
+        if rsi != rsi:
+            rsi = sc["rsi"]  # ffill
+        out["rsi"] = rsi
+        if rsi == rsi:
+            out["rsi_ema"] = _ewm_step(sc["rsi_ema"], rsi, 2.0 / (self.avg_period + 1.0))
+
+        # ATR (EWM du True Range)
+        tr = h - l if pc != pc else max(abs(h - l), abs(h - pc), abs(l - pc))
+        out["atr_w"] = atr = _ewm_step(sc["atr_w"], tr, 1.0 / self.atr_period)
+
+        # Supertrend (report des bandes)
+        hl2 = (h + l) / 2.0
+        upper = hl2 + self.mult * atr
+        lower = hl2 - self.mult * atr
+        if sc["dir"] == 0:
+            st_i = upper
+        elif sc["dir"] == 1:
+            st_i = lower if c < lower else max(lower, sc["st"])
+        else:
+            st_i = upper if c > upper else min(upper, sc["st"])
+        out["st"] = st_i
+        out["dir"] = 1 if c >= st_i else -1
+
+        out["prev_close"] = c
+        out["close"] = c
+        return out
+
+    def _commit(self, row):
+        self.sc = self._advance(self.sc, row)
+        if self.sc["rsi"] == self.sc["rsi"]:
+            self.rsi_sma.push(self.sc["rsi"])
+        self.dollar_vol.push(float(row[4]) * float(row[5]))
+        self.don_high.push(float(row[2]))
+        self.don_low.push(float(row[3]))
+        self.n += 1
+        self.last_ts = row[0]
+        self.last_row = tuple(row)
+
+    # ---------- Alimentation ----------
+    def seed(self, ohlcv):
+        """Amorçage complet : toutes les bougies sauf la dernière sont committées."""
+        self.reset()
+        for row in ohlcv[:-1]:
+            self._commit(row)
+        self.forming = tuple(ohlcv[-1]) if ohlcv else None
+
+    def update(self, ohlcv):
+        """Intègre le dernier payload ccxt : commit des bougies nouvellement clôturées,
+        remplacement de la bougie en cours. Ré-amorce si trou ou bougie clôturée révisée."""
+        if not ohlcv:
+            return
+        if self.last_ts is None:
+            self.seed(ohlcv)
+            return
+        pos = None
+        for i in range(len(ohlcv) - 1, -1, -1):
+            ts = ohlcv[i][0]
+            if ts == self.last_ts:
+                pos = i
+                break
+            if ts < self.last_ts:
+                break
+        if pos is None or tuple(ohlcv[pos]) != self.last_row:
+            log.info("[IND] Historique discontinu ou bougie révisée → ré-amorçage")
+            self.seed(ohlcv)
+            return
+        for row in ohlcv[pos + 1:-1]:
+            self._commit(row)
+        self.forming = tuple(ohlcv[-1]) if pos < len(ohlcv) - 1 else None
+
+    # ---------- Lecture ----------
+    def values(self, signal_mode: str = "closed") -> dict:
+        """Valeurs à l'index du signal (-2 closed / -1 live) + volumes sur la dernière bougie."""
+        live = (signal_mode != "closed") or self.forming is None
+        f = self.forming
+        if live and f is not None:
+            sc = self._advance(self.sc, f)
+            rsi_avg = self._rsi_avg(sc, sc["rsi"])
+            don_high = self.don_high.value_with(float(f[2]))
+            don_low = self.don_low.value_with(float(f[3]))
+        else:
+            sc = self.sc
+            rsi_avg = self._rsi_avg(sc, None)
+            don_high = self.don_high.value()
+            don_low = self.don_low.value()
+
+        cur_vol_usd = float(f[4]) * float(f[5]) if f is not None else 0.0
+        avg_vol_usd, _ = self.dollar_vol.mean_with(cur_vol_usd if f is not None else None)
+        return {
+            "rsi": float(sc["rsi"]),
+            "rsi_avg": float(rsi_avg),
+            "close": float(sc["close"]),
+            "st": float(sc["st"]),
+            "don_high": don_high,
+            "don_low": don_low,
+            "avg_vol_usd": float(avg_vol_usd),
+            "cur_vol_usd": cur_vol_usd,
+        }
+
+    def _rsi_avg(self, sc: dict, rsi_tentative: Optional[float]) -> float:
+        if self.avg_type == "sma":
+            mean, _ = self.rsi_sma.mean_with(rsi_tentative)
+            return mean
+        return sc["rsi_ema"]
+
+
+# ---------- Registre par (symbole, TF, paramètres) ----------
+_ENGINES: Dict[tuple, IndicatorEngine] = {}
+
+
+def get_engine(symbol: str, tf: str, conf: dict, avg_type: str = None,
+               avg_period: int = None, rsi_period: int = None) -> IndicatorEngine:
+    """Retourne (ou crée) le moteur associé à la paire et à ses paramètres."""
+    rsi_per = int(rsi_period or conf["rsi"]["period"])
+    smooth_per = int(avg_period or conf["rsi"]["smooth"])
+    avg_kind = (avg_type or "ema").lower()
+    key = (
+        symbol, tf, rsi_per, avg_kind, smooth_per,
+        int(conf["supertrend"]["atr_period"]), float(conf["supertrend"]["mult"]),
+        int(conf["donchian"]["length"]), int(conf["volume"]["lookback"]),
+    )
+    eng = _ENGINES.get(key)
+    if eng is None:
+        eng = IndicatorEngine(conf, rsi_per, avg_kind, smooth_per)
+        _ENGINES[key] = eng
+    return eng
+
+
+def export_engines() -> Dict[tuple, IndicatorEngine]:
+    """Moteurs amorcés (pour le snapshot de redémarrage à chaud)."""
+    return {k: e for k, e in _ENGINES.items() if e.last_ts is not None}
+
+
+def load_engines(engines: Dict[tuple, IndicatorEngine]):
+    """Réinjecte des moteurs restaurés ; update() se recale ensuite sur le payload courant."""
+    for k, e in engines.items():
+        _ENGINES.setdefault(k, e)
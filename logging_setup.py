@@ -0,0 +1,101 @@
+# logging_setup.py
+# -*- coding: utf-8 -*-
+"""
+Pipeline de logs asynchrone.
+
+- Les appels log.* ne font qu'empiler le LogRecord (QueueHandler sans mise en forme) ;
+  un thread QueueListener formate et écrit (stdout + fichier rotatif) hors du chemin critique.
+- Format LOG_FORMAT=text (historique) ou json (1 objet JSON par ligne) ; en JSON les champs
+  passés via `extra={...}` (symbol, tf, rsi, st_trend, action, ...) sont des clés de premier niveau.
+- Mise en forme paresseuse : utiliser log.info("... %s", x) ; un niveau filtré ne coûte
+  qu'un test isEnabledFor, et le % n'est appliqué que dans le thread d'écriture.
+- File bornée (LOG_QUEUE_MAX) : en cas de saturation les lignes sont abandonnées, jamais bloquantes.
+"""
+import atexit
+import datetime as dt
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+from config import LOG_FORMAT, LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUPS, LOG_QUEUE_MAX
+import metrics
+
+TEXT_FMT = "%(asctime)s | %(levelname)s | %(message)s"
+
+# Attributs standard d'un LogRecord (tout le reste vient de `extra`)
+_STD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+metrics.REGISTRY.counter("bot_log_dropped_total", "Lignes de log abandonnées (file pleine)")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": dt.datetime.fromtimestamp(record.created, dt.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in record.__dict__.items():
+            if k not in _STD_ATTRS and not k.startswith("_"):
+                out[k] = v
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record  # mise en forme différée au thread d'écriture
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("bot_log_dropped_total")
+
+
+_listener = None
+_sinks = []
+
+def setup_logging(fmt: str = LOG_FORMAT, level: str = LOG_LEVEL, log_file: str = LOG_FILE):
+    """Installe le pipeline (idempotent) sur le logger racine."""
+    global _listener, _sinks
+    if _listener is not None:
+        return
+    formatter = JsonFormatter() if fmt.lower() == "json" else logging.Formatter(TEXT_FMT)
+    sinks = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        sinks.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"))
+    for h in sinks:
+        h.setFormatter(formatter)
+
+    q = queue.Queue(maxsize=max(LOG_QUEUE_MAX, 1))
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(_NonBlockingQueueHandler(q))
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+
+    _sinks = sinks
+    _listener = logging.handlers.QueueListener(q, *sinks, respect_handler_level=True)
+    _listener.start()
+    atexit.register(flush_logging)
+
+def flush_logging():
+    """Vide la file et arrête le writer (sortie du process) ; les logs suivants
+    (autres handlers atexit) sont écrits directement."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        if isinstance(h, _NonBlockingQueueHandler):
+            root.removeHandler(h)
+    for h in _sinks:
+        root.addHandler(h)
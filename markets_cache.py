@@ -0,0 +1,99 @@
+# markets_cache.py
+# -*- coding: utf-8 -*-
+"""
+Cache disque des métadonnées de marchés (précision, limites, base/quote).
+- load() : au démarrage, le cache disque est injecté via set_markets() → aucun appel réseau.
+  Sans cache (ou cache d'un autre exchange) : load_markets() synchrone puis écriture.
+- Cache plus vieux que le TTL : utilisé tel quel, rafraîchi en tâche de fond (thread daemon).
+- maybe_refresh() à chaque cycle : relance le rafraîchissement quand le TTL expire.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from config import MARKETS_CACHE_FILE, MARKETS_CACHE_TTL_SEC
+from execution import with_retry
+
+log = logging.getLogger("bot")
+
+
+class MarketsCache:
+    def __init__(self, path: str = MARKETS_CACHE_FILE, ttl_sec: float = MARKETS_CACHE_TTL_SEC):
+        self.path = path
+        self.ttl_sec = float(ttl_sec)
+        self.fetched_at = 0.0
+        self._refreshing = threading.Lock()
+
+    def _read(self, exchange_id: str):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning(f"[MARKETS] Cache illisible ({self.path}): {e}")
+            return None
+        if data.get("exchange") != exchange_id or not data.get("markets"):
+            return None
+        return data
+
+    def _write(self, exchange):
+        payload = {
+            "exchange": exchange.id,
+            "fetched_at": self.fetched_at,
+            "markets": exchange.markets,
+            "currencies": getattr(exchange, "currencies", None) or None,
+        }
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"  # workers shard_runner : même fichier, tmp distincts
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, default=str)
+        os.replace(tmp, self.path)
+
+    def _fetch(self, exchange):
+        markets = with_retry(exchange.load_markets, 3, 1.0, True)
+        self.fetched_at = time.time()
+        try:
+            self._write(exchange)
+        except Exception as e:
+            log.warning(f"[MARKETS] Echec écriture cache: {e}")
+        return markets
+
+    def load(self, exchange) -> dict:
+        data = self._read(exchange.id)
+        if data is None:
+            t0 = time.perf_counter()
+            markets = self._fetch(exchange)
+            log.info(f"[MARKETS] {len(markets)} marchés téléchargés en {time.perf_counter() - t0:.2f}s")
+            return markets
+        markets = exchange.set_markets(data["markets"], data.get("currencies"))
+        self.fetched_at = float(data.get("fetched_at", 0.0))
+        age = time.time() - self.fetched_at
+        log.info(f"[MARKETS] {len(markets)} marchés depuis le cache (âge {age / 60:.0f} min)")
+        self.maybe_refresh(exchange)
+        return markets
+
+    def reload(self, exchange) -> dict:
+        """Rechargement synchrone (ex: symbole absent du cache = nouveau listing)."""
+        return self._fetch(exchange)
+
+    def maybe_refresh(self, exchange):
+        if time.time() - self.fetched_at < self.ttl_sec:
+            return
+        if not self._refreshing.acquire(blocking=False):
+            return  # rafraîchissement déjà en cours
+
+        def run():
+            try:
+                self._fetch(exchange)
+                log.info(f"[MARKETS] Cache rafraîchi ({len(exchange.markets)} marchés)")
+            except Exception as e:
+                log.warning(f"[MARKETS] Echec rafraîchissement: {e}")
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, name="markets-refresh", daemon=True).start()
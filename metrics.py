@@ -0,0 +1,156 @@
+# metrics.py
+# -*- coding: utf-8 -*-
+"""
+Registre de métriques en mémoire (compteurs + histogrammes étiquetés) et endpoint HTTP local
+au format texte Prometheus (GET /metrics).
+
+- observe()/inc()/timed() : un lock + quelques additions → assez léger pour rester actif en prod.
+- Étiquettes courtes (symbol, tf, side, ...) : cardinalité bornée par PAIRS_CFG.
+- METRICS_PORT=0 désactive le serveur (le registre reste alimenté).
+"""
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+log = logging.getLogger("bot")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, tuple] = {}    # name -> (type, help, buckets)
+        self._series: Dict[str, dict] = {}   # name -> {labels_tuple: valeur | [counts, sum, count]}
+
+    def counter(self, name: str, help_: str):
+        self._meta[name] = ("counter", help_, None)
+        self._series.setdefault(name, {})
+
+    def histogram(self, name: str, help_: str, buckets=DEFAULT_BUCKETS):
+        self._meta[name] = ("histogram", help_, tuple(sorted(buckets)))
+        self._series.setdefault(name, {})
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self._meta[name][2]
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(buckets, value)
+        with self._lock:
+            h = self._series[name].get(key)
+            if h is None:
+                h = self._series[name][key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            h[0][i] += 1
+            h[1] += value
+            h[2] += 1
+
+    def snapshot(self, name: str) -> dict:
+        with self._lock:
+            return {k: (v if not isinstance(v, list) else (list(v[0]), v[1], v[2]))
+                    for k, v in self._series.get(name, {}).items()}
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_, buckets) in sorted(self._meta.items()):
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, v in sorted(self.snapshot(name).items()):
+                if kind == "counter":
+                    lines.append(f"{name}{_fmt_labels(key)} {_num(v)}")
+                    continue
+                counts, total, count = v
+                acc = 0
+                for le, c in zip(buckets + (float("inf"),), counts):
+                    acc += c
+                    lines.append(f"{name}_bucket{_fmt_labels(key + (('le', '+Inf' if le == float('inf') else _num(le)),))} {acc}")
+                lines.append(f"{name}_sum{_fmt_labels(key)} {_num(total)}")
+                lines.append(f"{name}_count{_fmt_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _num(x: float) -> str:
+    return repr(float(x)) if not float(x).is_integer() else str(int(x))
+
+def _fmt_labels(key: Tuple[tuple, ...]) -> str:
+    if not key:
+        return ""
+    esc = lambda s: str(s).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in key) + "}"
+
+
+REGISTRY = Registry()
+REGISTRY.histogram("bot_cycle_seconds", "Durée d'un cycle complet (paires dues)")
+REGISTRY.histogram("bot_ohlcv_fetch_seconds", "Durée d'un fetch OHLCV (réseau)")
+REGISTRY.histogram("bot_signal_seconds", "Durée de hybrid_signal")
+REGISTRY.histogram("bot_balance_fetch_seconds", "Durée de fetch_balance")
+REGISTRY.histogram("bot_order_seconds", "Durée de place_market_buy / place_market_sell_all")
+REGISTRY.histogram("bot_state_save_seconds", "Durée de save_state (journal + compaction)")
+REGISTRY.histogram("bot_webhook_seconds", "Durée d'envoi HTTP d'un webhook (dispatcher)")
+REGISTRY.counter("bot_webhook_events_total", "Webhooks soumis / envoyés / abandonnés")
+REGISTRY.counter("bot_retries_total", "Nouvelles tentatives de with_retry après erreur réseau")
+REGISTRY.counter("bot_orders_total", "Ordres par issue (placed / skipped / error)")
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+def observe(name: str, value: float, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+class timed:
+    """with timed("bot_signal_seconds", symbol=..., tf=...): ..."""
+    __slots__ = ("name", "labels", "t0")
+
+    def __init__(self, name: str, **labels):
+        self.name, self.labels = name, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRY.observe(self.name, time.perf_counter() - self.t0, **self.labels)
+        return False
+
+
+# ---------- Endpoint HTTP ----------
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *a):
+        pass  # pas de log par requête de scrape
+
+
+_server = None
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """Démarre (une seule fois par process) le serveur /metrics dans un thread daemon."""
+    global _server
+    if _server is not None or not port:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((host, int(port)), _Handler)
+    except OSError as e:
+        log.warning(f"[METRICS] Port {host}:{port} indisponible: {e}")
+        return None
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info(f"[METRICS] Endpoint http://{host}:{port}/metrics")
+    return _server
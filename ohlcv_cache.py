@@ -0,0 +1,122 @@
+# ohlcv_cache.py
+# -*- coding: utf-8 -*-
+"""
+Cache OHLCV en mémoire par (symbole, TF).
+- 1er appel : fetch complet (limit).
+- Ensuite : fetch `since` = ts de la dernière bougie en cache → seules les bougies
+  nouvelles sont téléchargées, la bougie en cours (dernière) est remplacée.
+- Mémoire bornée par série (max_bars) et éviction LRU entre séries (max_series).
+"""
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+from config import OHLCV_CACHE_MAX_BARS, OHLCV_CACHE_MAX_SERIES, PREFETCH_WORKERS
+from execution import with_retry
+import metrics
+from utils import tf_to_minutes
+
+log = logging.getLogger("bot")
+
+
+def _fetch(exchange, symbol: str, tf: str, mode: str, **kw):
+    with metrics.timed("bot_ohlcv_fetch_seconds", symbol=symbol, tf=tf, mode=mode):
+        return with_retry(exchange.fetch_ohlcv, 3, 1, symbol, timeframe=tf, **kw)
+
+
+class OHLCVCache:
+    def __init__(self, max_bars: int = OHLCV_CACHE_MAX_BARS, max_series: int = OHLCV_CACHE_MAX_SERIES):
+        self.max_bars = max(int(max_bars), 2)
+        self.max_series = max(int(max_series), 1)
+        self._series: "OrderedDict[tuple, List[list]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._series)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def export(self) -> Dict[tuple, List[list]]:
+        """Copie des séries (ordre LRU conservé) pour le snapshot de redémarrage à chaud."""
+        with self._lock:
+            return {k: list(v) for k, v in self._series.items()}
+
+    def load(self, series: Dict[tuple, List[list]]):
+        for key, rows in series.items():
+            self._store(key, [list(r) for r in rows])
+
+    def _store(self, key, rows: List[list]):
+        with self._lock:
+            self._series[key] = rows[-self.max_bars:]
+            self._series.move_to_end(key)
+            while len(self._series) > self.max_series:
+                old, _ = self._series.popitem(last=False)
+                log.info(f"[CACHE] Eviction LRU {old[0]}@{old[1]}")
+
+    def _cached(self, key):
+        with self._lock:
+            rows = self._series.get(key)
+            if rows is not None:
+                self._series.move_to_end(key)
+            return rows
+
+    def get(self, exchange, symbol: str, tf: str, limit: int = 300) -> List[list]:
+        """Retourne les `limit` dernières bougies ccxt [ts, o, h, l, c, v] pour (symbol, tf)."""
+        key = (symbol, tf)
+        rows = self._cached(key)
+
+        if not rows or len(rows) < min(limit, self.max_bars):
+            fresh = _fetch(exchange, symbol, tf, "full", limit=limit)
+            self._store(key, [list(r) for r in fresh])
+            return self._cached(key)[-limit:]
+
+        # Fetch incrémental : bougies >= dernière bougie en cache (qui peut être encore en formation)
+        last_ts = rows[-1][0]
+        tf_ms = tf_to_minutes(tf) * 60_000
+        now_ms = int(exchange.milliseconds()) if hasattr(exchange, "milliseconds") else last_ts
+        needed = max(2, int((now_ms - last_ts) // tf_ms) + 2)
+        if needed >= limit:
+            # Trou trop grand (reprise après coupure) → rechargement complet
+            fresh = _fetch(exchange, symbol, tf, "full", limit=limit)
+            self._store(key, [list(r) for r in fresh])
+            return self._cached(key)[-limit:]
+
+        delta = _fetch(exchange, symbol, tf, "incr", since=last_ts, limit=needed)
+        delta = [list(r) for r in (delta or []) if r[0] >= last_ts]
+        if delta:
+            first_new = delta[0][0]
+            # Conserve les bougies antérieures, remplace celles à partir de first_new
+            keep = len(rows)
+            while keep > 0 and rows[keep - 1][0] >= first_new:
+                keep -= 1
+            rows = rows[:keep] + delta
+            self._store(key, rows)
+        return self._cached(key)[-limit:]
+
+    def prefetch(self, exchange, keys: Iterable[Tuple[str, str, int]],
+                 max_workers: int = PREFETCH_WORKERS) -> Dict[tuple, object]:
+        """Charge en parallèle (pool borné) les séries (symbol, tf, limit).
+        Retourne {(symbol, tf): bougies | Exception}. Le rate limiter ccxt reste
+        respecté (cf. execution.make_throttle_thread_safe)."""
+        uniq: Dict[tuple, int] = {}
+        for sym, tf, limit in keys:
+            uniq[(sym, tf)] = max(limit, uniq.get((sym, tf), 0))
+        if not uniq:
+            return {}
+
+        def _one(item):
+            (sym, tf), limit = item
+            try:
+                return (sym, tf), self.get(exchange, sym, tf, limit=limit)
+            except Exception as e:
+                return (sym, tf), e
+
+        workers = max(1, min(int(max_workers), len(uniq)))
+        if workers == 1:
+            return dict(_one(it) for it in uniq.items())
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ohlcv") as pool:
+            return dict(pool.map(_one, uniq.items()))
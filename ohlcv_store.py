@@ -0,0 +1,273 @@
+# ohlcv_store.py
+# -*- coding: utf-8 -*-
+"""
+Stockage disque colonnaire de l'historique OHLCV (bougies clôturées), par (symbole, TF).
+
+Arborescence : {root}/{BASE_QUOTE}/{tf}/
+    [gen/]ts.i8, open.f8, high.f8, low.f8, close.f8, vol.f8   (1 tableau NumPy mappé en mémoire par champ)
+    meta.json   {"n": lignes valides, "capacity": lignes allouées, "ranges": [[ts_debut, ts_fin, i0, i1], ...],
+                 "gen": sous-dossier des colonnes ("" = racine de la série)}
+    .lock       verrou fcntl.flock exclusif des écrivains
+
+- Append-only : seules les bougies de ts > dernier ts stocké sont ajoutées ; capacité doublée
+  à la demande ; meta.json (n) est réécrit atomiquement APRÈS le flush des données.
+- Index des plages de temps contiguës (un trou dans les données ouvre une nouvelle plage).
+- Lecture : vues zéro-copie (np.memmap en lecture seule) sur une fenêtre [start_ts, end_ts) ou
+  les `last` dernières bougies ; frame() les enveloppe dans un DataFrame sans copie.
+  Ouverture instantanée, RSS plat : seules les pages lues sont chargées.
+- Lecteurs : backtest / sweep (load_history). Le bot n'y fait qu'archiver : hybrid_signal et le
+  circuit breaker lisent OHLCVCache (300 bougies en mémoire, bougie en formation incluse).
+- Historique antérieur à la première bougie stockée : prepend() réécrit la série complète dans
+  une nouvelle génération (sous-dossier), publiée par le remplacement atomique de meta.json ;
+  un crash en cours de réécriture laisse la série précédente intacte.
+- Plusieurs écrivains possibles (bot live + backtest / sweep sur le même OHLCV_STORE_DIR) :
+  append() et prepend() prennent le verrou de la série et relisent meta.json avant d'écrire.
+"""
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import OHLCV_STORE_DIR
+from utils import tf_to_minutes
+
+FIELDS = (("ts", np.int64, "i8"), ("open", np.float64, "f8"), ("high", np.float64, "f8"),
+          ("low", np.float64, "f8"), ("close", np.float64, "f8"), ("vol", np.float64, "f8"))
+INITIAL_CAPACITY = 4096
+
+
+class SeriesStore:
+    def __init__(self, path: str, tf: str, writable: bool = False):
+        self.path = path
+        self.tf = tf
+        self.tf_ms = tf_to_minutes(tf) * 60_000
+        self.writable = writable
+        self.meta = {"n": 0, "capacity": 0, "ranges": []}
+        self.cols: Dict[str, np.ndarray] = {}
+        if writable:
+            os.makedirs(path, exist_ok=True)
+        self.refresh()
+
+    # ---------- Mapping ----------
+    def _file(self, name: str, ext: str) -> str:
+        return os.path.join(self.path, self.meta.get("gen", ""), f"{name}.{ext}")
+
+    def _map(self, capacity: int):
+        self.cols = {}
+        if capacity <= 0:
+            return
+        mode = "r+" if self.writable else "r"
+        for name, dtype, ext in FIELDS:
+            self.cols[name] = np.memmap(self._file(name, ext), dtype=dtype, mode=mode, shape=(capacity,))
+
+    def refresh(self):
+        """(Re)lit meta.json ; remappe si la capacité a changé (écrivain concurrent)."""
+        try:
+            with open(os.path.join(self.path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = {"n": 0, "capacity": 0, "ranges": []}
+        remap = (meta["capacity"] != self.meta.get("capacity") or meta.get("gen", "") != self.meta.get("gen", "")
+                 or not self.cols)
+        self.meta = meta
+        if remap:
+            self._map(meta["capacity"])
+
+    def __len__(self):
+        return int(self.meta["n"])
+
+    @property
+    def ranges(self) -> List[list]:
+        return self.meta["ranges"]
+
+    @property
+    def first_ts(self) -> Optional[int]:
+        return int(self.cols["ts"][0]) if len(self) else None
+
+    @property
+    def last_ts(self) -> Optional[int]:
+        return int(self.cols["ts"][len(self) - 1]) if len(self) else None
+
+    # ---------- Écriture ----------
+    @contextmanager
+    def _locked(self):
+        """Verrou exclusif inter-process de la série ; meta.json relu (autre écrivain)."""
+        if not self.writable:
+            raise PermissionError(f"{self.path} ouvert en lecture seule")
+        with open(os.path.join(self.path, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_meta(self):
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def _grow(self, need: int):
+        cap = max(INITIAL_CAPACITY, int(self.meta["capacity"]))
+        while cap < need:
+            cap *= 2
+        if cap == self.meta["capacity"]:
+            return
+        for name, dtype, ext in FIELDS:
+            with open(self._file(name, ext), "ab") as f:
+                f.truncate(cap * np.dtype(dtype).itemsize)
+        self.meta["capacity"] = cap
+        self._map(cap)
+
+    def append(self, rows) -> int:
+        """Ajoute des bougies ccxt [ts, o, h, l, c, v] triées ; ignore ts <= dernier ts. Retourne le nb ajouté."""
+        with self._locked():
+            return self._append(rows)
+
+    def _append(self, rows) -> int:
+        arr = np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+        last = self.last_ts
+        if last is not None:
+            arr = arr[arr[:, 0] > last]
+        if not len(arr):
+            return 0
+        n0, k = len(self), len(arr)
+        self._grow(n0 + k)
+        ts = arr[:, 0].astype(np.int64)
+        self.cols["ts"][n0:n0 + k] = ts
+        for j, (name, _, _) in enumerate(FIELDS[1:], start=1):
+            self.cols[name][n0:n0 + k] = arr[:, j]
+        for m in self.cols.values():
+            m.flush()
+
+        # Index des plages contiguës
+        ranges = self.meta["ranges"]
+        breaks = np.flatnonzero(np.diff(ts) != self.tf_ms) + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.concatenate((breaks, [k]))
+        for s, e in zip(starts, ends):
+            if ranges and s == 0 and int(ts[0]) == ranges[-1][1] + self.tf_ms:
+                ranges[-1][1], ranges[-1][3] = int(ts[e - 1]), n0 + int(e)
+            else:
+                ranges.append([int(ts[s]), int(ts[e - 1]), n0 + int(s), n0 + int(e)])
+        self.meta["n"] = n0 + k
+        self._write_meta()
+        return k
+
+    def prepend(self, rows) -> int:
+        """Ajoute des bougies triées antérieures à la première stockée (backfill). Retourne le nb ajouté.
+
+        La série complète est réécrite dans une nouvelle génération ; meta.json ne pointe dessus
+        qu'une fois les colonnes écrites, l'ancienne génération est supprimée ensuite."""
+        with self._locked():
+            arr = np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+            first = self.first_ts
+            if first is None:
+                return self._append(arr)
+            v = self.view()
+            arr = np.vstack([arr[arr[:, 0] < first],
+                             np.column_stack([v[name].astype(np.float64) for name, _, _ in FIELDS])])
+            added = len(arr) - len(self)
+            if added <= 0:
+                return 0
+            old = self.meta.get("gen", "")
+            gen = f"g{int(old[1:] or 0) + 1}"
+            shutil.rmtree(os.path.join(self.path, gen), ignore_errors=True)  # reste d'un crash
+            os.makedirs(os.path.join(self.path, gen))
+            self.meta = {"n": 0, "capacity": 0, "ranges": [], "gen": gen}
+            self.cols = {}
+            try:
+                self._append(arr)
+            except Exception:
+                self.refresh()  # meta.json pointe toujours sur l'ancienne génération
+                raise
+            if old:
+                shutil.rmtree(os.path.join(self.path, old), ignore_errors=True)
+            else:
+                for name, _, ext in FIELDS:
+                    os.remove(os.path.join(self.path, f"{name}.{ext}"))
+            return added
+
+    # ---------- Lecture ----------
+    def bounds(self, start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+               last: Optional[int] = None) -> tuple:
+        n = len(self)
+        if not n:
+            return 0, 0
+        ts = self.cols["ts"][:n]
+        i0 = 0 if start_ts is None else int(np.searchsorted(ts, start_ts, "left"))
+        i1 = n if end_ts is None else int(np.searchsorted(ts, end_ts, "left"))
+        if last is not None:
+            i0 = max(i0, i1 - int(last))
+        return i0, i1
+
+    def view(self, start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+             last: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Vues zéro-copie {champ: ndarray} sur [start_ts, end_ts) (ou les `last` dernières)."""
+        i0, i1 = self.bounds(start_ts, end_ts, last)
+        return {name: (self.cols[name][i0:i1] if self.cols else np.empty(0, dtype))
+                for name, dtype, _ in FIELDS}
+
+    def frame(self, start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+              last: Optional[int] = None) -> pd.DataFrame:
+        """DataFrame (ts, open, high, low, close, vol) adossé aux vues, sans copie."""
+        v = self.view(start_ts, end_ts, last)
+        return pd.DataFrame({k: np.asarray(a) for k, a in v.items()}, copy=False)
+
+
+class OHLCVStore:
+    def __init__(self, root: str = OHLCV_STORE_DIR):
+        self.root = root
+        self._open: Dict[tuple, SeriesStore] = {}
+
+    def _path(self, symbol: str, tf: str) -> str:
+        return os.path.join(self.root, symbol.replace("/", "_"), tf)
+
+    def series(self, symbol: str, tf: str, writable: bool = False) -> SeriesStore:
+        key = (symbol, tf, writable)
+        s = self._open.get(key)
+        if s is None:
+            s = self._open[key] = SeriesStore(self._path(symbol, tf), tf, writable=writable)
+        return s
+
+    def exists(self, symbol: str, tf: str) -> bool:
+        return os.path.exists(os.path.join(self._path(symbol, tf), "meta.json"))
+
+    def append(self, symbol: str, tf: str, rows) -> int:
+        return self.series(symbol, tf, writable=True).append(rows)
+
+    def frame(self, symbol: str, tf: str, start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+              last: Optional[int] = None) -> pd.DataFrame:
+        s = self.series(symbol, tf)
+        s.refresh()
+        return s.frame(start_ts, end_ts, last)
+
+    def record_closed(self, market_data: Dict[tuple, object], now_ms: int) -> int:
+        """Ajoute les bougies clôturées des séries préchargées ({(symbol, tf): bougies | Exception})."""
+        added = 0
+        for (sym, tf), rows in market_data.items():
+            if not rows or isinstance(rows, Exception):
+                continue
+            tf_ms = tf_to_minutes(tf) * 60_000
+            closed = [r for r in rows if int(r[0]) + tf_ms <= now_ms]
+            if closed:
+                added += self.append(sym, tf, closed)
+        return added
+
+    def list_series(self) -> List[tuple]:
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for sym_dir in sorted(os.listdir(self.root)):
+            for tf in sorted(os.listdir(os.path.join(self.root, sym_dir))):
+                if os.path.exists(os.path.join(self.root, sym_dir, tf, "meta.json")):
+                    out.append((sym_dir.replace("_", "/", 1), tf))
+        return out
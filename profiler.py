@@ -0,0 +1,142 @@
+# profiler.py
+# -*- coding: utf-8 -*-
+"""
+Profilage de cycles à la demande (cProfile + tracemalloc).
+
+- Activation à chaud, sans redémarrage :
+    * fichier de contrôle présent (PROFILE_CONTROL_FILE, ex: `touch /tmp/bot_profile`) ;
+    * ou signal SIGUSR2 (bascule on/off) ;
+    * ou PROFILE_ENABLED=true au démarrage.
+- Actif : chaque cycle est profilé ; le rapport n'est écrit que pour 1 cycle sur
+  PROFILE_EVERY_N ou si le cycle dépasse PROFILE_SLOW_SEC (surcoût cProfile ~x1.5 : à couper après usage).
+- Rapport texte (top fonctions cumul/self + top sites d'allocation et croissance depuis le
+  rapport précédent) + .prof binaire (snakeviz / pstats) dans PROFILE_DIR, rotation PROFILE_KEEP.
+"""
+import cProfile
+import datetime as dt
+import glob
+import io
+import logging
+import os
+import pstats
+import signal
+import time
+import tracemalloc
+
+from config import (
+    PROFILE_ENABLED, PROFILE_DIR, PROFILE_EVERY_N, PROFILE_SLOW_SEC, PROFILE_KEEP, PROFILE_CONTROL_FILE
+)
+
+log = logging.getLogger("bot")
+
+
+class CycleProfiler:
+    def __init__(self, out_dir: str = PROFILE_DIR, every_n: int = PROFILE_EVERY_N, slow_sec: float = PROFILE_SLOW_SEC,
+                 keep: int = PROFILE_KEEP, control_file: str = PROFILE_CONTROL_FILE, enabled: bool = PROFILE_ENABLED):
+        self.out_dir = out_dir
+        self.every_n = max(0, int(every_n))
+        self.slow_sec = float(slow_sec)
+        self.keep = max(1, int(keep))
+        self.control_file = control_file
+        self.forced = bool(enabled)   # PROFILE_ENABLED / SIGUSR2
+        self.cycles = 0
+        self._prof = None
+        self._t0 = 0.0
+        self._last_snap = None
+
+    # ---------- Activation ----------
+    def install_signal(self, signum=getattr(signal, "SIGUSR2", None)):
+        if signum is None:
+            return
+        try:
+            signal.signal(signum, self._on_signal)
+        except ValueError:
+            pass  # hors thread principal
+
+    def _on_signal(self, *_):
+        self.forced = not self.forced
+        log.info(f"[PROFILE] Profilage {'activé' if self.forced else 'désactivé'} (signal)")
+
+    @property
+    def enabled(self) -> bool:
+        return self.forced or bool(self.control_file and os.path.exists(self.control_file))
+
+    # ---------- Cycle ----------
+    def begin(self):
+        if self._prof is not None:
+            self._prof.disable()  # cycle précédent interrompu par une exception
+            self._prof = None
+        if not self.enabled:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                self._last_snap = None
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._prof = cProfile.Profile()
+        self._t0 = time.perf_counter()
+        self._prof.enable()
+
+    def end(self, label: str = ""):
+        prof, self._prof = self._prof, None
+        if prof is None:
+            return
+        prof.disable()
+        dur = time.perf_counter() - self._t0
+        peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+        self.cycles += 1
+        nth = self.every_n > 0 and self.cycles % self.every_n == 0
+        slow = self.slow_sec > 0 and dur >= self.slow_sec
+        if not (nth or slow or (self.every_n == 0 and self.slow_sec <= 0)):
+            return
+        try:
+            # Snapshot avant la mise en forme du rapport (sinon pstats apparaît en tête)
+            snap = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            path = self._write(prof, snap, dur, peak, label, "lent" if slow else "échantillon")
+            log.info(f"[PROFILE] Cycle {dur:.2f}s profilé -> {path}")
+        except Exception as e:
+            log.warning(f"[PROFILE] Echec écriture rapport: {e}")
+
+    # ---------- Rapport ----------
+    def _write(self, prof: cProfile.Profile, snap, dur: float, peak: int, label: str, reason: str) -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = dt.datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S.%fZ")
+        base = os.path.join(self.out_dir, f"cycle_{stamp}")
+        prof.dump_stats(base + ".prof")
+
+        buf = io.StringIO()
+        buf.write(f"# Cycle {label} | durée={dur:.3f}s | pic mémoire tracée={peak / 1e6:.1f} Mo | "
+                  f"raison={reason} | {stamp}\n\n")
+        st = pstats.Stats(prof, stream=buf).strip_dirs()
+        buf.write("## Top fonctions (cumul)\n")
+        st.sort_stats("cumulative").print_stats(40)
+        buf.write("## Top fonctions (self)\n")
+        st.sort_stats("tottime").print_stats(20)
+
+        buf.write("## Top sites d'allocation (mémoire vivante)\n")
+        for s in snap.statistics("lineno")[:25]:
+            buf.write(f"{s}\n")
+        if self._last_snap is not None:
+            buf.write("\n## Croissance depuis le rapport précédent\n")
+            for s in snap.compare_to(self._last_snap, "lineno")[:15]:
+                buf.write(f"{s}\n")
+        self._last_snap = snap
+
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(buf.getvalue())
+        self._rotate()
+        return base + ".txt"
+
+    def _rotate(self):
+        for ext in (".txt", ".prof"):
+            files = sorted(glob.glob(os.path.join(self.out_dir, f"cycle_*{ext}")))
+            for old in files[:-self.keep]:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
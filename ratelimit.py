@@ -0,0 +1,195 @@
+# ratelimit.py
+# -*- coding: utf-8 -*-
+"""
+Ordonnanceur central des requêtes exchange (token buckets).
+
+- Un bucket par famille d'endpoints Bitget (public marché / privé compte / ordres)
+  + un bucket global (IP). Chaque appel consomme son poids dans les deux.
+- Priorité : ordres > compte > données. Un appel moins prioritaire cède le bucket global
+  tant qu'un appel plus prioritaire n'attend que lui.
+- En-têtes de quota (remaining / Retry-After) et erreurs 429 → bucket bloqué le temps
+  indiqué (pas de sleep aveugle), puis nouvelle tentative.
+- install_scheduler(exchange) enveloppe les méthodes ccxt utilisées par le bot : tous les
+  appels (bot, execution, caches) passent par l'ordonnanceur ; le throttle ccxt est désactivé.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Dict
+
+import ccxt
+
+from config import RL_PUBLIC_RPS, RL_PRIVATE_RPS, RL_ORDER_RPS, RL_GLOBAL_RPS
+
+log = logging.getLogger("bot")
+
+PRIO_ORDER, PRIO_ACCOUNT, PRIO_DATA = 0, 1, 2
+
+# méthode ccxt -> (bucket, poids, priorité)
+ENDPOINTS = {
+    "create_order":    ("order",   1, PRIO_ORDER),
+    "fetch_balance":   ("private", 1, PRIO_ACCOUNT),
+    "fetch_my_trades": ("private", 1, PRIO_ACCOUNT),
+    "fetch_ohlcv":     ("public",  1, PRIO_DATA),
+    "fetch_ticker":    ("public",  1, PRIO_DATA),
+    "fetch_tickers":   ("public",  1, PRIO_DATA),
+    "load_markets":    ("public",  2, PRIO_DATA),  # markets + currencies
+}
+
+RATE_LIMIT_EXCEPTIONS = (ccxt.RateLimitExceeded, ccxt.DDoSProtection)
+_REMAINING_HEADERS = ("x-mbx-used-remain-limit", "x-ratelimit-remaining")
+
+
+class _Bucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = max(float(rate), 1e-6)
+        self.capacity = float(capacity or max(rate, 1.0))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+        self.penalty = 0.0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_for(self, weight: float, now: float) -> float:
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return max(0.0, (weight - self.tokens) / self.rate)
+
+
+class RateScheduler:
+    def __init__(self, rates: Dict[str, float] = None, global_rps: float = RL_GLOBAL_RPS):
+        rates = rates or {"public": RL_PUBLIC_RPS, "private": RL_PRIVATE_RPS, "order": RL_ORDER_RPS}
+        self.buckets = {name: _Bucket(r) for name, r in rates.items()}
+        self.glob = _Bucket(global_rps) if global_rps > 0 else None
+        self._cond = threading.Condition()
+        self._waiting = []  # heap (priorité, seq, bucket, poids)
+        self._seq = itertools.count()
+        self.waited_sec = {name: 0.0 for name in self.buckets}
+
+    def _yield_to_higher(self, me) -> bool:
+        """Un appel plus prioritaire n'attend-il que le bucket global ?"""
+        for w in self._waiting:
+            if w[0] >= me[0]:
+                continue
+            b = self.buckets[w[2]]
+            if b.blocked_until <= time.monotonic() and b.tokens >= w[3]:
+                return True
+        return False
+
+    def acquire(self, bucket: str, weight: float = 1.0, priority: int = PRIO_DATA):
+        b = self.buckets[bucket]
+        t0 = time.monotonic()
+        with self._cond:
+            me = (priority, next(self._seq), bucket, weight)
+            heapq.heappush(self._waiting, me)
+            try:
+                while True:
+                    now = time.monotonic()
+                    b.refill(now)
+                    delay = b.wait_for(weight, now)
+                    if self.glob is not None:
+                        self.glob.refill(now)
+                        delay = max(delay, self.glob.wait_for(weight, now))
+                    if delay <= 0 and not self._yield_to_higher(me):
+                        b.tokens -= weight
+                        if self.glob is not None:
+                            self.glob.tokens -= weight
+                        break
+                    self._cond.wait(timeout=min(max(delay, 0.001), 0.25))
+            finally:
+                self._waiting.remove(me)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+        self.waited_sec[bucket] += time.monotonic() - t0
+
+    def block(self, bucket: str, seconds: float):
+        with self._cond:
+            b = self.buckets[bucket]
+            b.blocked_until = max(b.blocked_until, time.monotonic() + seconds)
+            b.tokens = min(b.tokens, 0.0)
+
+    def observe_headers(self, bucket: str, headers):
+        """Aligne le bucket sur le quota restant annoncé par l'exchange."""
+        if not headers:
+            return
+        h = {str(k).lower(): v for k, v in dict(headers).items()}
+        retry_after = h.get("retry-after")
+        if retry_after is not None:
+            try:
+                self.block(bucket, float(retry_after))
+            except ValueError:
+                pass
+        for key in _REMAINING_HEADERS:
+            if key in h:
+                try:
+                    remaining = float(h[key])
+                except ValueError:
+                    continue
+                with self._cond:
+                    b = self.buckets[bucket]
+                    b.tokens = min(b.tokens, remaining)
+                if remaining <= 0:
+                    self.block(bucket, 1.0)  # fenêtres Bitget d'1 s
+                break
+
+    def on_rate_limited(self, bucket: str, headers=None) -> float:
+        """429 : bloque le bucket (Retry-After sinon pénalité doublée, max 8 s)."""
+        b = self.buckets[bucket]
+        wait = None
+        if headers:
+            h = {str(k).lower(): v for k, v in dict(headers).items()}
+            try:
+                wait = float(h["retry-after"]) if "retry-after" in h else None
+            except ValueError:
+                wait = None
+        if wait is None:
+            b.penalty = min(8.0, max(0.5, b.penalty * 2))
+            wait = b.penalty
+        self.block(bucket, wait)
+        return wait
+
+    def on_success(self, bucket: str):
+        self.buckets[bucket].penalty = 0.0
+
+
+def install_scheduler(exchange, scheduler: RateScheduler = None, retries: int = 3):
+    """Enveloppe les méthodes ccxt de `exchange` (idempotent) et désactive le throttle ccxt."""
+    if getattr(exchange, "_rate_scheduler", None) is not None:
+        return exchange
+    scheduler = scheduler or RateScheduler()
+
+    def wrap(name, fn):
+        bucket, weight, prio = ENDPOINTS[name]
+
+        def call(*a, **kw):
+            if name == "load_markets" and exchange.markets and not (a[:1] and a[0]) and not kw.get("reload"):
+                return fn(*a, **kw)  # déjà chargés : aucun appel réseau
+            for i in range(retries + 1):
+                scheduler.acquire(bucket, weight, prio)
+                try:
+                    out = fn(*a, **kw)
+                except RATE_LIMIT_EXCEPTIONS as e:
+                    wait = scheduler.on_rate_limited(bucket, getattr(exchange, "last_response_headers", None))
+                    if i >= retries:
+                        e.rate_scheduled = True
+                        raise
+                    log.warning(f"[RATE] {name}: limite atteinte, bucket '{bucket}' bloqué {wait:.1f}s")
+                    continue
+                scheduler.on_success(bucket)
+                scheduler.observe_headers(bucket, getattr(exchange, "last_response_headers", None))
+                return out
+
+        return call
+
+    for name in ENDPOINTS:
+        fn = getattr(exchange, name, None)
+        if fn is not None:
+            setattr(exchange, name, wrap(name, fn))
+    exchange.enableRateLimit = False  # le rythme est imposé par l'ordonnanceur
+    exchange._rate_scheduler = scheduler
+    return exchange
@@ -0,0 +1,101 @@
+# resample.py
+# -*- coding: utf-8 -*-
+"""
+Rééchantillonnage multi-TF à partir d'une série de base par symbole.
+
+- plan_fetches() : pour chaque symbole, les TF multiples du plus petit TF configuré sont
+  construits localement (1 seule requête OHLCV) ; les TF absents de l'exchange (ex: 2m)
+  sont synthétisés depuis le plus grand TF natif qui les divise.
+- Buckets alignés sur l'epoch UTC, comme utils.floor_dt_to_tf (journalier = minuit UTC).
+- Une série de base trop courte pour `limit` bougies cibles (> max_base_bars) → fetch natif.
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import OHLCV_CACHE_MAX_BARS
+from utils import tf_to_minutes
+
+log = logging.getLogger("bot")
+
+# Semaines : l'exchange aligne sur le lundi, pas sur l'epoch (jeudi) → toujours natif
+_MAX_RESAMPLE_MIN = 24 * 60
+
+
+def resample_ohlcv(rows: List[list], base_tf: str, target_tf: str) -> List[list]:
+    """Agrège des bougies ccxt [ts, o, h, l, c, v] de base_tf vers target_tf.
+    Le premier bucket incomplet est ignoré ; le dernier (en formation) est conservé."""
+    tgt_ms = tf_to_minutes(target_tf) * 60_000
+    out: List[list] = []
+    for ts, o, h, l, c, v in rows:
+        b = int(ts) // tgt_ms * tgt_ms
+        if out and out[-1][0] == b:
+            cur = out[-1]
+            cur[2] = max(cur[2], h)
+            cur[3] = min(cur[3], l)
+            cur[4] = c
+            cur[5] += v
+        else:
+            out.append([b, o, h, l, c, v])
+    if out and rows and int(rows[0][0]) != out[0][0]:
+        out.pop(0)  # début du premier bucket absent de la série de base
+    return out
+
+
+def plan_fetches(keys: Iterable[Tuple[str, str, int]], native_tfs: Optional[Iterable[str]] = None,
+                 max_base_bars: int = OHLCV_CACHE_MAX_BARS):
+    """
+    keys : [(symbol, tf, limit)] demandés.
+    Retourne (fetch_keys, derived) avec derived = {(symbol, tf): (base_tf, limit)}.
+    """
+    native = set(native_tfs) if native_tfs else None
+    by_sym: Dict[str, Dict[str, int]] = {}
+    for sym, tf, limit in keys:
+        tfs = by_sym.setdefault(sym, {})
+        tfs[tf] = max(limit, tfs.get(tf, 0))
+
+    fetch: Dict[tuple, int] = {}
+    derived: Dict[tuple, tuple] = {}
+    for sym, tfs in by_sym.items():
+        bases: List[str] = []  # TF réellement téléchargés pour ce symbole
+        for tf in sorted(tfs, key=tf_to_minutes):
+            limit, mins = tfs[tf], tf_to_minutes(tf)
+            base = None
+            if mins <= _MAX_RESAMPLE_MIN:
+                for b in sorted(bases, key=tf_to_minutes, reverse=True):
+                    if mins % tf_to_minutes(b) == 0 and (limit + 1) * (mins // tf_to_minutes(b)) <= max_base_bars:
+                        base = b
+                        break
+                if base is None and native is not None and tf not in native:
+                    # TF non servi par l'exchange → plus grand TF natif diviseur
+                    for b in sorted(native, key=lambda x: -_safe_minutes(x)):
+                        bm = _safe_minutes(b)
+                        if 0 < bm < mins and mins % bm == 0 and (limit + 1) * (mins // bm) <= max_base_bars:
+                            base = b
+                            bases.append(b)
+                            break
+            if base is None:
+                fetch[(sym, tf)] = max(limit, fetch.get((sym, tf), 0))
+                bases.append(tf)
+                continue
+            need = (limit + 1) * (mins // tf_to_minutes(base))
+            fetch[(sym, base)] = max(need, fetch.get((sym, base), 0))
+            derived[(sym, tf)] = (base, limit)
+    return [(s, tf, n) for (s, tf), n in fetch.items()], derived
+
+
+def _safe_minutes(tf: str) -> int:
+    try:
+        return tf_to_minutes(tf) if tf[-1] != "M" else 0  # '1M' (mois) ≠ minutes
+    except Exception:
+        return 0
+
+
+def apply_derived(market_data: Dict[tuple, object], derived: Dict[tuple, tuple]) -> Dict[tuple, object]:
+    """Complète market_data ({(symbol, tf): bougies | Exception}) avec les TF dérivés."""
+    for (sym, tf), (base, limit) in derived.items():
+        src = market_data.get((sym, base))
+        if src is None or isinstance(src, Exception):
+            market_data[(sym, tf)] = src if src is not None else KeyError(f"{sym}@{base}")
+            continue
+        market_data[(sym, tf)] = resample_ohlcv(src, base, tf)[-limit:]
+    return market_data
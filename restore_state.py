@@ -1,10 +1,35 @@
 # restore_state.py
-import os, glob, shutil
+import os, sys, glob, json, datetime as dt
 from config import STATE_FILE
+from state import JOURNAL_FILE, read_journal, apply_journal, read_snapshot, empty_raw, backup_state_file
 
 BACKUP_DIR = os.getenv("STATE_BACKUP_DIR", "state_backups")
 
-def restore_last():
+def _journals(base: str):
+    return sorted(glob.glob(os.path.join(BACKUP_DIR, f"{base}_*.journal"))) + [JOURNAL_FILE]
+
+def _write_restored(raw: dict, base: str):
+    """Écrit l'état restauré dans STATE_FILE, puis l'archive avec le journal courant (backup_state_file).
+    seq = max des seq connus : les entrées journalisées ensuite ne réutilisent pas les numéros
+    de l'ancienne chronologie (apply_journal les ignorerait au profit des anciennes)."""
+    seqs = [raw["seq"]] + [e.get("seq", 0) for path in _journals(base) for e in read_journal(path)]
+    try:
+        seqs.append(read_snapshot(STATE_FILE)["seq"])
+    except Exception:
+        pass
+    payload = {k: raw[k] for k in raw if k != "saved_at"}
+    payload["seq"] = max(seqs)
+    payload["saved_at"] = dt.datetime.utcnow().isoformat()
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, STATE_FILE)
+    backup_state_file()  # snapshot restauré daté + journal courant archivé (le journal repart vide)
+    return payload["seq"]
+
+def restore_last(with_journal: bool = False):
+    """Dernier backup tel quel (les mutations journalisées depuis sont écartées).
+    with_journal=True : rejoue en plus le journal courant (mutations postérieures à la dernière compaction)."""
     base = os.path.splitext(os.path.basename(STATE_FILE))[0]  # ex: 'state'
     pattern = os.path.join(BACKUP_DIR, f"{base}_*.json")
     files = sorted(glob.glob(pattern))
@@ -12,8 +37,50 @@ def restore_last():
         print("[RESTORE] Aucun backup trouvé.")
         return
     last = files[-1]
-    shutil.copy2(last, STATE_FILE)
-    print(f"[RESTORE] {last} -> {STATE_FILE}")
+    raw = read_snapshot(last)
+    if with_journal:
+        apply_journal(raw, read_journal(JOURNAL_FILE))
+    restored = raw["seq"]
+    seq = _write_restored(raw, base)
+    print(f"[RESTORE] {last}{' + journal courant' if with_journal else ''} (seq={restored}) -> {STATE_FILE} (seq={seq})")
+
+def restore_at(when: dt.datetime):
+    """Restauration à un instant donné : dernier snapshot <= when + rejeu des journaux jusqu'à when."""
+    base = os.path.splitext(os.path.basename(STATE_FILE))[0]
+    until_ts = when.replace(tzinfo=when.tzinfo or dt.timezone.utc).timestamp()
+
+    snaps = []
+    for path in glob.glob(os.path.join(BACKUP_DIR, f"{base}_*.json")) + [STATE_FILE]:
+        try:
+            raw = read_snapshot(path)
+            saved = dt.datetime.fromisoformat(raw["saved_at"]).replace(tzinfo=dt.timezone.utc).timestamp()
+        except Exception:
+            continue
+        if saved <= until_ts:
+            snaps.append((saved, raw["seq"], path, raw))
+    entries = []
+    for path in _journals(base):
+        entries.extend(read_journal(path))
+
+    if snaps:
+        _, _, src, raw = max(snaps, key=lambda s: (s[0], s[1]))
+    elif entries and min(e.get("seq", 0) for e in entries) == 1:
+        # Journal complet depuis l'origine → rejeu depuis un état vide
+        src, raw = "(état vide)", empty_raw()
+    else:
+        print(f"[RESTORE] Aucun snapshot antérieur à {when.isoformat()}.")
+        return
+    apply_journal(raw, entries, until_ts=until_ts)
+    restored = raw["seq"]
+    seq = _write_restored(raw, base)
+    print(f"[RESTORE] {src} + journal (seq={restored}) @ {when.isoformat()} -> {STATE_FILE} (seq={seq})")
 
 if __name__ == "__main__":
-    restore_last()
+    # python restore_state.py                       -> dernier backup
+    # python restore_state.py --with-journal        -> dernier backup + journal courant
+    # python restore_state.py 2025-01-31T14:05:00   -> état à cet instant (UTC)
+    args = sys.argv[1:]
+    if args and args[0] != "--with-journal":
+        restore_at(dt.datetime.fromisoformat(args[0]))
+    else:
+        restore_last(with_journal="--with-journal" in args)
@@ -0,0 +1,173 @@
+# scanner.py
+# -*- coding: utf-8 -*-
+"""
+Scanner de tout le marché spot (hors PAIRS_CFG) : candidats classés selon les règles hybrid_signal.
+
+1. Un seul appel fetch_tickers → préfiltre volume 24h (SCAN_MIN_QUOTE_VOL) et spread
+   (SCAN_MAX_SPREAD_PCT) sur les marchés spot actifs en SCAN_QUOTE (bases exclues : stablecoins).
+2. OHLCV des seuls survivants (SCAN_MAX_CANDIDATES max, volume décroissant) via le préchargement
+   parallèle borné (OHLCVCache) et l'ordonnanceur de requêtes (ratelimit.py) → ~25 s pour
+   500 marchés à 20 req/s, soit largement dans une bougie 5m.
+3. Évaluation en lot (signals.hybrid_signal_batch) des séries complètes ; les séries plus courtes
+   (listings récents) passent par hybrid_signal_array.
+4. Classement : BUY d'abord, puis momentum RSI − RSI lissé, puis volume 24h.
+
+Usage :
+    python scanner.py --tf 5m --top 20
+    python scanner.py --tf 15m --top 10 --alloc 2% --emit-pairs pairs_scan.txt   # PAIRS_CFG="$(cat pairs_scan.txt)"
+"""
+import argparse
+import csv
+import json
+import logging
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from config import (
+    OHLCV_CACHE_MAX_SERIES, SCAN_QUOTE, SCAN_TF, SCAN_MIN_QUOTE_VOL, SCAN_MAX_SPREAD_PCT, SCAN_MAX_CANDIDATES, SCAN_EXCLUDE_BASES
+)
+from execution import with_retry
+from ohlcv_cache import OHLCVCache
+from signals import hybrid_signal_batch, hybrid_signal_array, pick_conf_for_tf
+from utils import tf_to_minutes, format_pair_cfg
+
+log = logging.getLogger("bot")
+
+ACTION_NAMES = {1: "buy", -1: "sell", 0: None}
+
+
+def prefilter(markets: Dict[str, dict], tickers: Dict[str, dict], quote: str = SCAN_QUOTE,
+              min_quote_vol: float = SCAN_MIN_QUOTE_VOL, max_spread_pct: float = SCAN_MAX_SPREAD_PCT,
+              max_candidates: int = SCAN_MAX_CANDIDATES, exclude_bases=SCAN_EXCLUDE_BASES) -> List[dict]:
+    """Marchés spot actifs en `quote` passant les filtres volume 24h / spread, volume décroissant."""
+    out = []
+    for sym, m in markets.items():
+        if not m.get("spot", True) or m.get("active") is False or m.get("quote") != quote:
+            continue
+        if str(m.get("base", "")).upper() in exclude_bases:
+            continue
+        t = tickers.get(sym)
+        if not t:
+            continue
+        last = float(t.get("last") or t.get("close") or 0.0)
+        qv = t.get("quoteVolume")
+        qv = float(qv) if qv is not None else float(t.get("baseVolume") or 0.0) * last
+        bid, ask = t.get("bid"), t.get("ask")
+        if not (bid and ask and last > 0) or qv < min_quote_vol:
+            continue
+        spread_pct = (float(ask) - float(bid)) / ((float(ask) + float(bid)) / 2.0) * 100.0
+        if spread_pct > max_spread_pct:
+            continue
+        out.append({"symbol": sym, "quote_vol": qv, "spread_pct": spread_pct, "last": last})
+    out.sort(key=lambda r: -r["quote_vol"])
+    return out[:max(0, int(max_candidates))]
+
+
+def scan(exchange, tf: str = SCAN_TF, *, avg_type: str = "ema", avg_period: int = 21, rsi_period: int = 21,
+         signal_mode: str = "closed", limit: int = 300, ohlcv_cache: OHLCVCache = None, **filters) -> List[dict]:
+    """Scan complet ; renvoie les candidats classés (1 dict par marché évalué)."""
+    t0 = time.perf_counter()
+    tickers = with_retry(exchange.fetch_tickers, 3, 1)
+    survivors = prefilter(exchange.markets, tickers, **filters)
+    t_tick = time.perf_counter()
+
+    cache = ohlcv_cache or OHLCVCache(max_series=max(len(survivors), OHLCV_CACHE_MAX_SERIES))
+    data = cache.prefetch(exchange, [(r["symbol"], tf, limit) for r in survivors])
+    t_ohlcv = time.perf_counter()
+
+    conf = pick_conf_for_tf(tf)
+    kw = dict(avg_type=avg_type, avg_period=avg_period, rsi_period=rsi_period)
+    full, short, errors = [], [], 0
+    for r in survivors:
+        rows = data.get((r["symbol"], tf))
+        if isinstance(rows, Exception) or not rows:
+            errors += 1
+            continue
+        (full if len(rows) >= limit else short).append((r, rows[-limit:]))
+
+    results = []
+    if full:
+        stack = np.asarray([rows for _, rows in full], dtype=np.float64)
+        b = hybrid_signal_batch(stack, tf, conf, signal_mode, **kw)
+        for j, (r, _) in enumerate(full):
+            results.append({**r, "close": float(b["close"][j]), "rsi": float(b["rsi"][j]),
+                            "rsi_avg": float(b["rsi_avg"][j]),
+                            "st_trend": "bull" if b["close"][j] >= b["st"][j] else "bear",
+                            "vol_ok": bool(b["vol_ok"][j]), "action": ACTION_NAMES[int(b["action"][j])]})
+    for r, rows in short:
+        rsi, rsi_avg, st_trend, _, _, vol_ok, action = hybrid_signal_array(rows, tf, conf, signal_mode, **kw)
+        results.append({**r, "close": float(rows[-1][4]), "rsi": rsi, "rsi_avg": rsi_avg,
+                        "st_trend": st_trend, "vol_ok": vol_ok, "action": action})
+    for res in results:
+        res["score"] = res["rsi"] - res["rsi_avg"]
+    rank = {"buy": 0, None: 1, "sell": 2}
+    results.sort(key=lambda x: (rank[x["action"]], -x["score"], -x["quote_vol"]))
+
+    el = time.perf_counter() - t0
+    log.info(f"[SCAN] {len(tickers)} tickers → {len(survivors)} survivants → {len(results)} évalués "
+             f"({errors} erreurs) en {el:.1f}s (tickers {t_tick - t0:.1f}s, OHLCV {t_ohlcv - t_tick:.1f}s) | "
+             f"BUY={sum(1 for x in results if x['action'] == 'buy')}")
+    if el > tf_to_minutes(tf) * 60:
+        log.warning(f"[SCAN] Scan ({el:.0f}s) plus long qu'une bougie {tf} : réduire SCAN_MAX_CANDIDATES")
+    return results
+
+
+def to_pairs_cfg(results: List[dict], tf: str, top: int, alloc: str, signal_mode: str = "closed",
+                 avg_type: str = "ema", avg_period: int = 21, rsi_period: int = 21) -> str:
+    """Ligne PAIRS_CFG pour les `top` meilleurs candidats BUY."""
+    buys = [r for r in results if r["action"] == "buy"][:max(0, top)]
+    return "".join(format_pair_cfg({"symbol": r["symbol"], "tf": tf, "alloc": alloc, "avg": avg_type,
+                                    "avg_period": avg_period, "rsi_period": rsi_period,
+                                    "signal": signal_mode}) for r in buys)
+
+
+def main():
+    from execution import build_exchange
+    from markets_cache import MarketsCache
+
+    ap = argparse.ArgumentParser(description="Scanner de marché (tickers en masse + signaux en lot)")
+    ap.add_argument("--tf", default=SCAN_TF)
+    ap.add_argument("--top", type=int, default=20, help="candidats affichés / exportés en PAIRS_CFG")
+    ap.add_argument("--min-quote-vol", type=float, default=SCAN_MIN_QUOTE_VOL)
+    ap.add_argument("--max-spread-pct", type=float, default=SCAN_MAX_SPREAD_PCT)
+    ap.add_argument("--max-candidates", type=int, default=SCAN_MAX_CANDIDATES)
+    ap.add_argument("--avg", default="ema")
+    ap.add_argument("--avg-period", type=int, default=21)
+    ap.add_argument("--rsi", type=int, default=21)
+    ap.add_argument("--signal", default="closed", choices=["closed", "live"])
+    ap.add_argument("--out", help="export complet (.csv ou .json)")
+    ap.add_argument("--alloc", default="2%", help="allocation des lignes PAIRS_CFG émises")
+    ap.add_argument("--emit-pairs", help="fichier recevant la ligne PAIRS_CFG des meilleurs BUY")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+    exchange = build_exchange()
+    MarketsCache().load(exchange)
+    sig = dict(avg_type=args.avg, avg_period=args.avg_period, rsi_period=args.rsi)
+    results = scan(exchange, args.tf, signal_mode=args.signal, min_quote_vol=args.min_quote_vol,
+                   max_spread_pct=args.max_spread_pct, max_candidates=args.max_candidates, **sig)
+
+    for r in results[:args.top]:
+        print(f"{r['symbol']:<16} {str(r['action']):<5} score={r['score']:+6.2f} RSI={r['rsi']:.1f}/{r['rsi_avg']:.1f} "
+              f"ST={r['st_trend']:<4} VolOK={r['vol_ok']!s:<5} vol24h={r['quote_vol']:,.0f} spread={r['spread_pct']:.3f}%")
+    if args.out:
+        if args.out.endswith(".json"):
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=1)
+        else:
+            with open(args.out, "w", newline="", encoding="utf-8") as f:
+                w = csv.DictWriter(f, fieldnames=list(results[0]) if results else ["symbol"])
+                w.writeheader()
+                w.writerows(results)
+        print(f"[SCAN] {len(results)} lignes -> {args.out}")
+    if args.emit_pairs:
+        line = to_pairs_cfg(results, args.tf, args.top, args.alloc, args.signal, **sig)
+        with open(args.emit_pairs, "w", encoding="utf-8") as f:
+            f.write(line + "\n")
+        print(f"[SCAN] PAIRS_CFG ({line.count(';')} paires) -> {args.emit_pairs}")
+
+
+if __name__ == "__main__":
+    main()
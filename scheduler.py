@@ -0,0 +1,107 @@
+# scheduler.py
+# -*- coding: utf-8 -*-
+"""
+Ordonnanceur événementiel (tas de priorité) pour la boucle principale.
+
+- Jobs "candle" : un par paire configurée, réveil exactement à la frontière du TF
+  (alignée sur l'epoch UTC, cf. utils.floor_dt_to_tf) + délai de stabilisation.
+  La frontière suivante est calculée depuis la frontière courante (pas depuis l'heure de
+  fin du cycle) → aucune dérive ; les frontières sautées (cycle trop long) sont détectées.
+- Jobs périodiques (heartbeat, watchdog) dans le même tas.
+- next_batch() dort jusqu'au prochain job et renvoie tous les jobs échus à cet instant
+  (les paires d'une même frontière sont traitées ensemble : préchargement et solde partagés).
+"""
+import heapq
+import itertools
+import logging
+import time
+from typing import List
+
+from utils import tf_to_minutes
+
+log = logging.getLogger("bot")
+
+
+class CandleScheduler:
+    def __init__(self, settle_sec: float = 0.0, clock=None, sleep=None):
+        self.settle_sec = float(settle_sec)
+        self._clock = clock or time.time    # résolus à la construction (horloge virtuelle du rejeu)
+        self._sleep = sleep or time.sleep
+        self._heap = []
+        self._seq = itertools.count()
+        self.missed = 0
+
+    def _push(self, when: float, job: dict):
+        heapq.heappush(self._heap, (when, next(self._seq), job))
+
+    def add_candle(self, key, tf: str, label: str = None, now: float = None):
+        """Job par (paire, TF) : première exécution à la prochaine frontière du TF."""
+        period = tf_to_minutes(tf) * 60
+        now = self._clock() if now is None else now
+        boundary = (int(now) // period + 1) * period
+        self._push(boundary + self.settle_sec, {"kind": "candle", "key": key, "tf": tf, "label": label or str(key),
+                                                "period": period, "boundary": boundary})
+
+    def add_periodic(self, kind: str, interval_sec: float, now: float = None):
+        now = self._clock() if now is None else now
+        self._push(now + interval_sec, {"kind": kind, "interval": float(interval_sec)})
+
+    def next_wake(self) -> float:
+        return self._heap[0][0] if self._heap else float("inf")
+
+    def next_candle_wake(self) -> float:
+        return min((w for w, _, j in self._heap if j["kind"] == "candle"), default=float("inf"))
+
+    def export(self) -> dict:
+        """{(label, tf): prochaine frontière à traiter} des jobs candle (snapshot de redémarrage)."""
+        return {(j["label"], j["tf"]): j["boundary"] for _, _, j in self._heap if j["kind"] == "candle"}
+
+    def restore(self, boundaries: dict) -> int:
+        """Après redémarrage : un job dont la frontière attendue (snapshot) est passée sans être
+        traitée est recalé sur la dernière frontière échue → traité immédiatement (une seule fois).
+        Renvoie le nombre de jobs rattrapés."""
+        caught = 0
+        for i, (_, seq, job) in enumerate(self._heap):
+            prev = boundaries.get((job.get("label"), job.get("tf")))
+            if job["kind"] == "candle" and prev is not None and prev < job["boundary"]:
+                job["boundary"] -= job["period"]
+                self._heap[i] = (job["boundary"] + self.settle_sec, seq, job)
+                caught += 1
+        heapq.heapify(self._heap)
+        return caught
+
+    def _reschedule(self, job: dict, now: float) -> int:
+        """Replanifie le job ; renvoie le nombre de frontières sautées."""
+        if job["kind"] != "candle":
+            self._push(now + job["interval"], job)
+            return 0
+        period = job["period"]
+        nxt = job["boundary"] + period
+        if now >= nxt + self.settle_sec:
+            # Frontières passées pendant un cycle long : on se recale sur la prochaine
+            skipped = int((now - self.settle_sec - nxt) // period) + 1
+            self.missed += skipped
+            log.warning(f"[SCHED] {job['label']}@{job['tf']} : {skipped} frontière(s) manquée(s)")
+            nxt += skipped * period
+        else:
+            skipped = 0
+        job["boundary"] = nxt
+        self._push(nxt + self.settle_sec, job)
+        return skipped
+
+    def next_batch(self) -> List[dict]:
+        """Dort jusqu'au prochain job puis renvoie tous les jobs échus (copies)."""
+        if not self._heap:
+            return []
+        delay = self._heap[0][0] - self._clock()
+        if delay > 0:
+            self._sleep(delay)
+        now = self._clock()
+        batch = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, job = heapq.heappop(self._heap)
+            out = dict(job)
+            out["late_sec"] = now - job["boundary"] - self.settle_sec if job["kind"] == "candle" else 0.0
+            out["missed"] = self._reschedule(job, now)
+            batch.append(out)
+        return batch
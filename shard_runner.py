@@ -0,0 +1,299 @@
+# shard_runner.py
+# -*- coding: utf-8 -*-
+"""
+Exécution multi-process : superviseur + coordinateur de budget + N workers bot.py.
+
+- Superviseur : répartit PAIRS_CFG en N shards (regroupement par symbole → les TF dérivés
+  d'un symbole restent dans le même process ; équilibrage par charge ≈ Σ 1/TF), lance un
+  bot.py par shard (PAIRS_CFG, STATE_FILE, LOG_FILE, METRICS_PORT, WARM_SNAPSHOT_FILE propres ; quotas RL_* divisés
+  par N) et relance un worker sorti (watchdog exit 42, crash).
+- Coordinateur (thread du superviseur, BaseManager sur socket Unix) : seul propriétaire du
+  budget USDT, des plafonds BUY/24h et du circuit breaker. Un worker réserve un montant avant
+  un BUY (reserve), puis le solde (settle) : disponible = dernier solde remonté − réservations
+  en cours − achats soldés depuis ce relevé.
+- Fichiers partagés : OHLCV_STORE_DIR n'a qu'un écrivain par série (symboles répartis par shard ;
+  la série CB_SYMBOL, préchargée par tous, n'est archivée que par le shard qui la porte, sinon
+  le shard 0) ; MARKETS_CACHE_FILE est réécrit via un fichier temporaire propre au pid.
+- Affectation symbole → shard persistée ({STATE_FILE}.shards.json) et stable entre redémarrages
+  (l'état d'une position reste dans le STATE_FILE de son shard).
+
+Usage :
+    SHARD_WORKERS=4 python shard_runner.py
+"""
+import itertools
+import json
+import logging
+import os
+import secrets
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from multiprocessing.managers import BaseManager
+from typing import Dict, List, Optional
+
+from config import (
+    CB_SYMBOL, MAX_BUYS_PER_24H, SHARD_WORKERS, SHARD_COORDINATOR, SHARD_AUTHKEY, SHARD_RESERVE_TTL_SEC,
+    STATE_FILE, LOG_FILE, METRICS_PORT, WARM_SNAPSHOT_FILE, RL_PUBLIC_RPS, RL_PRIVATE_RPS, RL_ORDER_RPS, RL_GLOBAL_RPS,
+)
+from utils import tf_to_minutes, get_env_clean, parse_pairs_cfg, format_pair_cfg
+
+log = logging.getLogger("bot")
+
+
+# ---------- Coordinateur ----------
+class BudgetCoordinator:
+    """État partagé entre workers ; toutes les méthodes sont atomiques (lock)."""
+
+    def __init__(self, max_buys_24h: int = MAX_BUYS_PER_24H, reserve_ttl_sec: float = SHARD_RESERVE_TTL_SEC,
+                 clock=time.time):
+        self.max_buys_24h = int(max_buys_24h)
+        self.reserve_ttl_sec = float(reserve_ttl_sec)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rid = itertools.count(1)
+        self.free: Optional[float] = None   # dernier solde USDT remonté par un worker
+        self.free_ts = 0.0
+        self.reserved: Dict[int, tuple] = {}  # rid -> (montant, ts, worker, clé)
+        self.spent: List[tuple] = []          # (ts, montant) achats soldés après free_ts
+        self.buys: Dict[str, List[float]] = defaultdict(list)
+        self.cb_until = 0.0
+
+    def _available(self) -> float:
+        return (self.free or 0.0) - sum(r[0] for r in self.reserved.values()) - sum(a for _, a in self.spent)
+
+    def _purge(self, now: float):
+        for rid, r in list(self.reserved.items()):
+            if now - r[1] > self.reserve_ttl_sec:
+                log.warning(f"[COORD] Réservation {rid} ({r[3]}, w{r[2]}) expirée : {r[0]:.2f} USDT libérés")
+                del self.reserved[rid]
+
+    def report_balance(self, usdt_free: float, ts: float):
+        """Solde USDT relevé à `ts` (début du fetch) : les achats soldés avant sont déjà inclus."""
+        with self._lock:
+            if ts < self.free_ts:
+                return
+            self.free, self.free_ts = float(usdt_free), float(ts)
+            self.spent = [(t, a) for t, a in self.spent if t >= ts]
+
+    def reserve(self, worker: int, key: str, amount: float) -> dict:
+        """Réserve jusqu'à `amount` USDT pour un BUY sur `key` ("SYM@TF").
+        Renvoie {"rid", "amount", "reason"} ; amount=0 et reason renseignée si refus."""
+        now = self._clock()
+        with self._lock:
+            self._purge(now)
+            reason = None
+            if now < self.cb_until:
+                reason = "circuit_breaker"
+            elif self.max_buys_24h > 0:
+                self.buys[key] = [t for t in self.buys[key] if now - t < 24 * 3600]
+                if len(self.buys[key]) >= self.max_buys_24h:
+                    reason = "cap_24h"
+            if reason is None and self.free is None:
+                reason = "no_balance"
+            grant = 0.0 if reason else max(0.0, min(float(amount), self._available()))
+            if reason is None and grant <= 0:
+                reason = "budget"
+            if reason:
+                return {"rid": None, "amount": 0.0, "reason": reason}
+            rid = next(self._rid)
+            self.reserved[rid] = (grant, now, worker, key)
+            return {"rid": rid, "amount": grant, "reason": None}
+
+    def settle(self, rid: int, spent: float):
+        """Solde une réservation : spent > 0 = achat exécuté (compté jusqu'au prochain relevé)."""
+        now = self._clock()
+        with self._lock:
+            r = self.reserved.pop(rid, None)
+            if r is None or spent <= 0:
+                return
+            self.spent.append((now, float(spent)))
+            self.buys[r[3]].append(now)
+
+    def trip_circuit_breaker(self, until_ts: float):
+        with self._lock:
+            self.cb_until = max(self.cb_until, float(until_ts))
+
+    def circuit_breaker_until(self) -> float:
+        return self.cb_until
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"free": self.free, "available": self._available(), "reserved": len(self.reserved),
+                    "cb_until": self.cb_until}
+
+
+class _CoordinatorManager(BaseManager):
+    pass
+
+
+def serve_coordinator(coord: BudgetCoordinator, address, authkey: bytes):
+    """Expose `coord` dans un thread daemon ; renvoie l'adresse effective."""
+    _CoordinatorManager.register("coordinator", callable=lambda: coord)
+    server = _CoordinatorManager(address=address, authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, name="coordinator", daemon=True).start()
+    return server.address
+
+
+def _parse_address(raw: str):
+    if ":" in raw and not raw.startswith("/"):
+        host, port = raw.rsplit(":", 1)
+        return host, int(port)
+    return raw
+
+
+def connect_coordinator(address: str = SHARD_COORDINATOR, authkey: str = SHARD_AUTHKEY):
+    """Proxy vers le coordinateur (None hors mode multi-process)."""
+    if not address:
+        return None
+    _CoordinatorManager.register("coordinator")
+    mgr = _CoordinatorManager(address=_parse_address(address), authkey=authkey.encode())
+    mgr.connect()
+    return mgr.coordinator()
+
+
+# ---------- Répartition ----------
+def plan_shards(cfg_list: List[dict], n: int, previous: Optional[Dict[str, int]] = None) -> List[List[dict]]:
+    """Répartit les entrées par symbole sur n shards (équilibrage glouton de Σ 1/TF minutes).
+    `previous` ({symbole: shard}) : affectations conservées si le shard existe encore."""
+    groups: Dict[str, List[dict]] = defaultdict(list)
+    for c in cfg_list:
+        groups[c["symbol"]].append(c)
+    weight = {s: sum(1.0 / max(tf_to_minutes(c["tf"]), 1) for c in cs) for s, cs in groups.items()}
+    shards: List[List[dict]] = [[] for _ in range(max(1, n))]
+    load = [0.0] * len(shards)
+    previous = previous or {}
+    fresh = []
+    for sym in groups:
+        i = previous.get(sym)
+        if i is not None and 0 <= i < len(shards):
+            shards[i].extend(groups[sym])
+            load[i] += weight[sym]
+        else:
+            if i is not None:
+                log.warning(f"[SHARD] {sym} quitte le shard {i} (N réduit) : son état reste dans l'ancien STATE_FILE")
+            fresh.append(sym)
+    for sym in sorted(fresh, key=lambda s: -weight[s]):
+        i = min(range(len(shards)), key=lambda k: load[k])
+        shards[i].extend(groups[sym])
+        load[i] += weight[sym]
+    return shards
+
+
+def _shard_path(path: str, i: int) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{i}{ext}"
+
+
+def _cb_owner(shards: List[List[dict]]) -> int:
+    """Shard qui archive CB_SYMBOL : celui qui le trade, sinon le 0."""
+    return next((i for i, shard in enumerate(shards) if any(c["symbol"] == CB_SYMBOL for c in shard)), 0)
+
+
+def _worker_env(i: int, n: int, shard: List[dict], address: str, authkey: str, cb_owner: int = 0) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PAIRS_CFG": "".join(format_pair_cfg(c) for c in shard),
+        "SHARD_ID": str(i),
+        "SHARD_COORDINATOR": address,
+        "SHARD_AUTHKEY": authkey,
+        "SHARD_ARCHIVE_CB": "true" if i == cb_owner else "false",
+        "STATE_FILE": _shard_path(STATE_FILE, i),
+        "LOG_FILE": _shard_path(LOG_FILE, i) if LOG_FILE else "",
+        "WARM_SNAPSHOT_FILE": _shard_path(WARM_SNAPSHOT_FILE, i) if WARM_SNAPSHOT_FILE else "",
+        "METRICS_PORT": str(METRICS_PORT + 1 + i) if METRICS_PORT else "0",
+        # Quotas d'API partagés (même IP / même UID) : répartis entre workers
+        "RL_PUBLIC_RPS": str(RL_PUBLIC_RPS / n),
+        "RL_PRIVATE_RPS": str(RL_PRIVATE_RPS / n),
+        "RL_ORDER_RPS": str(RL_ORDER_RPS / n),
+        "RL_GLOBAL_RPS": str(RL_GLOBAL_RPS / n),
+    })
+    return env
+
+
+def _seed_state(i: int):
+    """Migration depuis un run mono-process : le shard part d'une copie de l'état global."""
+    dst = _shard_path(STATE_FILE, i)
+    if os.path.exists(dst) or not os.path.exists(STATE_FILE):
+        return
+    shutil.copyfile(STATE_FILE, dst)
+    if os.path.exists(STATE_FILE + ".journal"):
+        shutil.copyfile(STATE_FILE + ".journal", dst + ".journal")
+    log.info(f"[SHARD] {dst} initialisé depuis {STATE_FILE}")
+
+
+# ---------- Superviseur ----------
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+    cfg_list = parse_pairs_cfg(get_env_clean("PAIRS_CFG"))
+    if not cfg_list:
+        raise ValueError("[ERROR] Aucune paire dans PAIRS_CFG")
+    n = SHARD_WORKERS or os.cpu_count() or 1
+    n = max(1, min(n, len({c["symbol"] for c in cfg_list})))
+
+    plan_file = STATE_FILE + ".shards.json"
+    try:
+        with open(plan_file, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    except (FileNotFoundError, ValueError):
+        previous = {}
+    shards = plan_shards(cfg_list, n, previous)
+    with open(plan_file, "w", encoding="utf-8") as f:
+        json.dump({c["symbol"]: i for i, shard in enumerate(shards) for c in shard}, f, indent=1)
+
+    authkey = secrets.token_hex(16)
+    sock = os.path.join(tempfile.gettempdir(), f"bot_coord_{os.getpid()}.sock")
+    address = serve_coordinator(BudgetCoordinator(), sock, authkey.encode())
+    log.info(f"[SHARD] Coordinateur sur {address} | {n} workers")
+
+    bot_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+    cb_owner = _cb_owner(shards)
+    procs: Dict[int, subprocess.Popen] = {}
+
+    def spawn(i: int):
+        _seed_state(i)
+        procs[i] = subprocess.Popen([sys.executable, bot_py], env=_worker_env(i, n, shards[i], address, authkey, cb_owner))
+        log.info(f"[SHARD] Worker {i} (pid {procs[i].pid}) : {len(shards[i])} paires")
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for i, shard in enumerate(shards):
+        if shard:
+            spawn(i)
+
+    restart_at: Dict[int, float] = {}
+    while not stopping:
+        time.sleep(1)
+        for i, p in list(procs.items()):
+            if i in restart_at:
+                if time.time() >= restart_at[i]:
+                    del restart_at[i]
+                    spawn(i)
+                continue
+            code = p.poll()
+            if code is not None:
+                log.warning(f"[SHARD] Worker {i} sorti (code {code}) → relance dans 10s")
+                restart_at[i] = time.time() + 10
+
+    for p in procs.values():
+        if p.poll() is None:
+            p.send_signal(signal.SIGINT)  # KeyboardInterrupt → flush des logs / webhooks (atexit)
+    for p in procs.values():
+        try:
+            p.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+if __name__ == "__main__":
+    main()
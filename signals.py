@@ -4,7 +4,12 @@ from typing import Tuple
 import numpy as np
 import pandas as pd
 
-from config import SHORT_TF_CONF, LONG_TF_CONF
+from config import (
+    SHORT_TF_CONF, LONG_TF_CONF, STOP_LOSS_BY_TF, TP_TRIGGER_BY_TF, TP_TRAIL_BY_TF,
+    STOP_LOSS_PCT_FALLBACK, TP_TRIGGER_FALLBACK, TP_TRAIL_FALLBACK
+)
+
+NAN = float("nan")
 
 # ---------- Indicateurs ----------
 def compute_atr_series(df: pd.DataFrame, period: int = 14) -> pd.Series:
@@ -46,6 +51,36 @@ def compute_atr(df: pd.DataFrame, period: int = 14) -> float:
     atr = tr.ewm(alpha=1/period, adjust=False, min_periods=period).mean()
     return float(atr.iloc[-1]) if pd.notna(atr.iloc[-1]) else 0.0
 
+def supertrend_kernel(close: np.ndarray, upper: np.ndarray, lower: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Récursion Supertrend (report des bandes) sur tableaux float64.
+    Retourne (ligne ST, direction) avec direction 1 bull / -1 bear."""
+    n = len(close)
+    st = np.empty(n, dtype=np.float64)
+    dirn = np.empty(n, dtype=np.int64)
+    if n == 0:
+        return st, dirn
+    # Boucle serrée sur listes Python (pas d'accès scalaire pandas)
+    c, up, lo = close.tolist(), upper.tolist(), lower.tolist()
+    out_st = [0.0] * n
+    out_dir = [0] * n
+    prev_st = up[0]
+    prev_dir = 1 if c[0] >= prev_st else -1
+    out_st[0], out_dir[0] = prev_st, prev_dir
+    for i in range(1, n):
+        ci = c[i]
+        if prev_dir == 1:
+            lo_i = lo[i]
+            st_i = lo_i if ci < lo_i else max(lo_i, prev_st)
+        else:
+            up_i = up[i]
+            st_i = up_i if ci > up_i else min(up_i, prev_st)
+        prev_dir = 1 if ci >= st_i else -1
+        prev_st = st_i
+        out_st[i], out_dir[i] = st_i, prev_dir
+    st[:] = out_st
+    dirn[:] = out_dir
+    return st, dirn
+
 def compute_supertrend(df: pd.DataFrame, atr_period: int = 14, mult: float = 3.0) -> Tuple[pd.Series, pd.Series, pd.Series]:
     """Retourne (ligne ST, upper, lower)."""
     atr = compute_atr_series(df, atr_period)
@@ -53,25 +88,12 @@ def compute_supertrend(df: pd.DataFrame, atr_period: int = 14, mult: float = 3.0
     upper = hl2 + mult * atr
     lower = hl2 - mult * atr
 
-    st = pd.Series(index=df.index, dtype=float)
-    dirn = pd.Series(index=df.index, dtype=int)  # 1 bull, -1 bear
-
-    for i in range(len(df)):
-        if i == 0:
-            st.iloc[i] = upper.iloc[i]
-            dirn.iloc[i] = 1 if df["close"].iloc[i] >= st.iloc[i] else -1
-            continue
-
-        up_i = max(upper.iloc[i], st.iloc[i-1]) if dirn.iloc[i-1] == 1 else upper.iloc[i]
-        lo_i = min(lower.iloc[i], st.iloc[i-1]) if dirn.iloc[i-1] == -1 else lower.iloc[i]
-
-        if dirn.iloc[i-1] == 1:
-            st_i = lo_i if df["close"].iloc[i] < lo_i else max(lo_i, st.iloc[i-1])
-        else:
-            st_i = up_i if df["close"].iloc[i] > up_i else min(up_i, st.iloc[i-1])
-
-        dirn.iloc[i] = 1 if df["close"].iloc[i] >= st_i else -1
-        st.iloc[i] = st_i
+    st_arr, _ = supertrend_kernel(
+        df["close"].to_numpy(dtype=np.float64),
+        upper.to_numpy(dtype=np.float64),
+        lower.to_numpy(dtype=np.float64),
+    )
+    st = pd.Series(st_arr, index=df.index, dtype=float)
 
     return (
         st.fillna(method="bfill").fillna(method="ffill"),
@@ -91,6 +113,51 @@ def avg_dollar_volume(df: pd.DataFrame, lookback: int) -> float:
         return 0.0
 
 # ---------- Signal Hybride ----------
+def _signal_rules(conf: dict, rsi_last: float, rsi_avg_last: float, last_close: float, st_last: float,
+                  don_high_last, don_low_last, avg_vol_usd: float, cur_vol_usd: float):
+    """Règles BUY/SELL communes (batch pandas ou moteur incrémental)."""
+    st_trend = "bull" if last_close >= st_last else "bear"
+
+    vol_ok = (avg_vol_usd > 0) and \
+             (cur_vol_usd > avg_vol_usd * conf["volume"]["mult"]) and \
+             (cur_vol_usd > conf["volume"]["min_abs"])
+
+    # Donchian : cassure obligatoire ou non selon la conf
+    require_breakout = bool(conf.get("donchian", {}).get("require_breakout", True))
+    if don_high_last is None:
+        don_ok = True
+    else:
+        don_ok = (last_close > don_high_last) if require_breakout else True
+
+    buy_cond  = (rsi_last > rsi_avg_last) and (st_trend == "bull") and don_ok and vol_ok
+    sell_cond = (rsi_last < rsi_avg_last) and (st_trend == "bear") and \
+                (don_low_last is not None and last_close < don_low_last)
+
+    action = "buy" if buy_cond else ("sell" if sell_cond else None)
+    return rsi_last, rsi_avg_last, st_trend, don_high_last, don_low_last, bool(vol_ok), action
+
+def signal_rules_arrays(conf: dict, rsi: np.ndarray, rsi_avg: np.ndarray, close: np.ndarray, st: np.ndarray,
+                        don_high: np.ndarray, don_low: np.ndarray, avg_vol_usd: np.ndarray,
+                        cur_vol_usd: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Version vectorisée de _signal_rules (Donchian absent = NaN).
+    Retourne (action, vol_ok) avec action ∈ {1 buy, -1 sell, 0}."""
+    bull = close >= st
+    vol_ok = (avg_vol_usd > 0) & \
+             (cur_vol_usd > avg_vol_usd * conf["volume"]["mult"]) & \
+             (cur_vol_usd > conf["volume"]["min_abs"])
+
+    require_breakout = bool(conf.get("donchian", {}).get("require_breakout", True))
+    if require_breakout:
+        don_ok = np.isnan(don_high) | (close > np.nan_to_num(don_high, nan=np.inf))
+    else:
+        don_ok = np.ones(len(close), dtype=bool)
+
+    buy_cond  = (rsi > rsi_avg) & bull & don_ok & vol_ok
+    sell_cond = (rsi < rsi_avg) & ~bull & ~np.isnan(don_low) & (close < np.nan_to_num(don_low, nan=-np.inf))
+
+    action = np.where(buy_cond, 1, np.where(sell_cond, -1, 0)).astype(np.int8)
+    return action, vol_ok
+
 def hybrid_signal(
     df: pd.DataFrame,
     tf: str,
@@ -99,12 +166,19 @@ def hybrid_signal(
     *,
     avg_type: str = None,     # 'ema' | 'sma' (si None => conf par défaut)
     avg_period: int = None,   # si None => conf["rsi"]["smooth"]
-    rsi_period: int = None    # si None => conf["rsi"]["period"]
+    rsi_period: int = None,   # si None => conf["rsi"]["period"]
+    engine=None               # IndicatorEngine (indicators.py) déjà alimenté, sinon calcul complet
 ):
     """
     Retourne: (rsi_last, rsi_avg_last, st_trend, don_high_last, don_low_last, vol_ok, action)
     action ∈ {"buy", "sell", None}
     """
+    # Moteur incrémental prêt → O(1), pas de recalcul sur tout l'historique
+    if engine is not None and engine.ready:
+        v = engine.values(signal_mode)
+        return _signal_rules(conf, v["rsi"], v["rsi_avg"], v["close"], v["st"],
+                             v["don_high"], v["don_low"], v["avg_vol_usd"], v["cur_vol_usd"])
+
     # Périodes finales (fallback sur conf)
     rsi_per   = int(rsi_period or conf["rsi"]["period"])
     smooth_per = int(avg_period or conf["rsi"]["smooth"])
@@ -122,7 +196,6 @@ def hybrid_signal(
 
     # Supertrend
     st_line, _, _ = compute_supertrend(df, conf["supertrend"]["atr_period"], conf["supertrend"]["mult"])
-    st_trend = "bull" if df["close"].iloc[idx] >= st_line.iloc[idx] else "bear"
 
     # Donchian
     don_len = int(conf["donchian"]["length"])
@@ -138,27 +211,243 @@ def hybrid_signal(
     v_look = int(conf["volume"]["lookback"])
     avg_vol_usd = avg_dollar_volume(df, v_look)
     cur_vol_usd = float(df["close"].iloc[-1] * df["vol"].iloc[-1]) if len(df) else 0.0
-    vol_ok = (avg_vol_usd > 0) and \
-             (cur_vol_usd > avg_vol_usd * conf["volume"]["mult"]) and \
-             (cur_vol_usd > conf["volume"]["min_abs"])
 
     # ---- Règles ----
     last_close = float(df["close"].iloc[idx])
+    return _signal_rules(conf, rsi_last, rsi_avg_last, last_close, float(st_line.iloc[idx]),
+                         don_high_last, don_low_last, avg_vol_usd, cur_vol_usd)
 
-    # Donchian : cassure obligatoire ou non selon la conf
-    require_breakout = bool(conf.get("donchian", {}).get("require_breakout", True))
-    if don_high_last is None:
-        don_ok = True
+# ---------- Chemin NumPy (payload ccxt brut, sans DataFrame) ----------
+# Mêmes formules que les versions pandas ci-dessus (EWM adjust=False, bfill puis ffill),
+# sur un tableau float64 (n, 6) [ts, open, high, low, close, vol] : utilisé par la boucle live.
+def _ewm_array(x: np.ndarray, alpha: float, min_periods: int = 0) -> np.ndarray:
+    """EWM adjust=False (même arithmétique que pandas), NaN de tête ignorés."""
+    out = [NAN] * len(x)
+    w, cnt, old_wt = NAN, 0, 1.0 - alpha
+    for i, xi in enumerate(x.tolist()):
+        if xi == xi:
+            cnt += 1
+            if w != w:
+                w = xi
+            elif w != xi:
+                w = (old_wt * w + alpha * xi) / (old_wt + alpha)
+        if cnt >= min_periods:
+            out[i] = w
+    return np.array(out, dtype=np.float64)
+
+def _fill_array(x: np.ndarray) -> np.ndarray:
+    """Equivalent de .fillna(method="bfill").fillna(method="ffill")."""
+    valid = np.flatnonzero(~np.isnan(x))
+    if len(valid) == 0 or len(valid) == len(x):
+        return x
+    pos = np.minimum(np.searchsorted(valid, np.arange(len(x))), len(valid) - 1)
+    return x[valid[pos]]
+
+def rsi_array(close: np.ndarray, period: int = 14) -> np.ndarray:
+    if len(close) < max(2, period + 1):
+        return np.full(len(close), 50.0)
+    delta = np.diff(close, prepend=NAN)
+    avg_gain = _ewm_array(np.clip(delta, 0, None), 1 / period, period)
+    avg_loss = _ewm_array(-np.clip(delta, None, 0), 1 / period, period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100 - (100 / (1 + avg_gain / np.where(avg_loss == 0, NAN, avg_loss)))
+    return _fill_array(np.clip(rsi, 0, 100))
+
+def atr_array(ohlcv: np.ndarray, period: int = 14, fill: bool = True) -> np.ndarray:
+    n = len(ohlcv)
+    if n < max(2, period + 1):
+        return np.zeros(n)
+    h, l = ohlcv[:, 2], ohlcv[:, 3]
+    c1 = np.concatenate(([NAN], ohlcv[:-1, 4]))
+    tr = np.fmax(np.fmax(np.abs(h - l), np.abs(h - c1)), np.abs(l - c1))
+    atr = _ewm_array(tr, 1 / period, period)
+    return _fill_array(atr) if fill else atr
+
+def compute_atr_array(ohlcv: np.ndarray, period: int = 14) -> float:
+    """compute_atr sur tableau brut."""
+    if len(ohlcv) < max(2, period + 1):
+        return 0.0
+    last = float(atr_array(ohlcv, period, fill=False)[-1])
+    return last if last == last else 0.0
+
+def avg_dollar_volume_array(ohlcv: np.ndarray, lookback: int) -> float:
+    if len(ohlcv) == 0:
+        return 0.0
+    sub = ohlcv[-max(lookback, 1):]
+    return float(np.mean(sub[:, 4] * sub[:, 5]))
+
+def hybrid_signal_array(
+    ohlcv,
+    tf: str,
+    conf: dict,
+    signal_mode: str = "closed",
+    *,
+    avg_type: str = None,
+    avg_period: int = None,
+    rsi_period: int = None,
+    engine=None
+):
+    """hybrid_signal sur le payload ccxt (liste ou ndarray (n, 6)) : même 7-uplet, sans pandas."""
+    if engine is not None and engine.ready:
+        v = engine.values(signal_mode)
+        return _signal_rules(conf, v["rsi"], v["rsi_avg"], v["close"], v["st"],
+                             v["don_high"], v["don_low"], v["avg_vol_usd"], v["cur_vol_usd"])
+
+    a = np.asarray(ohlcv, dtype=np.float64).reshape(-1, 6)
+    n = len(a)
+    close = a[:, 4]
+    rsi_per   = int(rsi_period or conf["rsi"]["period"])
+    smooth_per = int(avg_period or conf["rsi"]["smooth"])
+    avg_kind   = (avg_type or "ema").lower()
+
+    idx = -2 if signal_mode == "closed" else -1
+    if abs(idx) > n:
+        idx = -1
+    i = n + idx
+
+    # RSI + lissage (seule la valeur à idx est nécessaire pour la SMA)
+    rsi = rsi_array(close, rsi_per)
+    if avg_kind == "sma":
+        j = max(i, smooth_per - 1)  # bfill : première fenêtre complète
+        rsi_avg_last = float(np.mean(rsi[j - smooth_per + 1:j + 1])) if n >= smooth_per else NAN
     else:
-        don_ok = (last_close > don_high_last) if require_breakout else True
+        rsi_avg_last = float(_fill_array(_ewm_array(rsi, 2.0 / (smooth_per + 1.0)))[i])
 
-    buy_cond  = (rsi_last > rsi_avg_last) and (st_trend == "bull") and don_ok and vol_ok
-    sell_cond = (rsi_last < rsi_avg_last) and (st_trend == "bear") and \
-                (don_low_last is not None and last_close < don_low_last)
+    # Supertrend
+    atr = atr_array(a, conf["supertrend"]["atr_period"])
+    hl2 = (a[:, 2] + a[:, 3]) / 2.0
+    mult = conf["supertrend"]["mult"]
+    st_line, _ = supertrend_kernel(close, hl2 + mult * atr, hl2 - mult * atr)
 
-    action = "buy" if buy_cond else ("sell" if sell_cond else None)
-    return rsi_last, rsi_avg_last, st_trend, don_high_last, don_low_last, bool(vol_ok), action
+    # Donchian (fenêtre incluant la bougie du signal, comme le rolling pandas)
+    don_len = int(conf["donchian"]["length"])
+    if n < max(2, don_len) or i < don_len - 1:
+        don_high_last = don_low_last = None
+    else:
+        don_high_last = float(a[i - don_len + 1:i + 1, 2].max())
+        don_low_last  = float(a[i - don_len + 1:i + 1, 3].min())
+
+    avg_vol_usd = avg_dollar_volume_array(a, int(conf["volume"]["lookback"]))
+    cur_vol_usd = float(close[-1] * a[-1, 5]) if n else 0.0
+
+    return _signal_rules(conf, float(rsi[i]), rsi_avg_last, float(close[i]), float(st_line[i]),
+                         don_high_last, don_low_last, avg_vol_usd, cur_vol_usd)
+
+# ---------- Lot de séries (scanner) ----------
+# Mêmes formules que hybrid_signal_array, vectorisées sur k séries de même longueur (k, n, 6) :
+# les récursions (EWM, Supertrend) bouclent sur le temps, chaque pas traite les k séries.
+def _ewm_batch(x: np.ndarray, alpha: float, min_periods: int = 0) -> np.ndarray:
+    out = np.full(x.shape, NAN)
+    w = np.full(x.shape[0], NAN)
+    cnt = np.zeros(x.shape[0], dtype=np.int64)
+    old_wt = 1.0 - alpha
+    with np.errstate(invalid="ignore"):
+        for i in range(x.shape[1]):
+            xi = x[:, i]
+            ok = ~np.isnan(xi)
+            cnt += ok
+            upd = np.where(np.isnan(w), xi, np.where(w != xi, (old_wt * w + alpha * xi) / (old_wt + alpha), w))
+            w = np.where(ok, upd, w)
+            out[:, i] = np.where(cnt >= min_periods, w, NAN)
+    return out
+
+def _fill_batch(x: np.ndarray) -> np.ndarray:
+    return np.vstack([_fill_array(r) for r in x]) if len(x) else x
+
+def hybrid_signal_batch(stack: np.ndarray, tf: str, conf: dict, signal_mode: str = "closed", *,
+                        avg_type: str = None, avg_period: int = None, rsi_period: int = None) -> dict:
+    """Règles hybrid_signal sur un lot (k, n, 6). Renvoie des tableaux de longueur k :
+    rsi, rsi_avg, close, st, don_high, don_low (NaN = absent), avg_vol_usd, cur_vol_usd,
+    action (1 buy / -1 sell / 0) et vol_ok."""
+    k, n = stack.shape[0], stack.shape[1]
+    high, low, close, vol = stack[:, :, 2], stack[:, :, 3], stack[:, :, 4], stack[:, :, 5]
+    rsi_per   = int(rsi_period or conf["rsi"]["period"])
+    smooth_per = int(avg_period or conf["rsi"]["smooth"])
+    avg_kind   = (avg_type or "ema").lower()
+    idx = -2 if signal_mode == "closed" else -1
+    if abs(idx) > n:
+        idx = -1
+    i = n + idx
+
+    # RSI
+    if n < max(2, rsi_per + 1):
+        rsi = np.full((k, n), 50.0)
+    else:
+        delta = np.diff(close, axis=1, prepend=NAN)
+        avg_gain = _ewm_batch(np.clip(delta, 0, None), 1 / rsi_per, rsi_per)
+        avg_loss = _ewm_batch(-np.clip(delta, None, 0), 1 / rsi_per, rsi_per)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = _fill_batch(np.clip(100 - (100 / (1 + avg_gain / np.where(avg_loss == 0, NAN, avg_loss))), 0, 100))
+    if avg_kind == "sma":
+        j = max(i, smooth_per - 1)
+        rsi_avg = rsi[:, j - smooth_per + 1:j + 1].mean(axis=1) if n >= smooth_per else np.full(k, NAN)
+    else:
+        rsi_avg = _fill_batch(_ewm_batch(rsi, 2.0 / (smooth_per + 1.0)))[:, i]
+
+    # Supertrend (ATR EWM + report des bandes)
+    atr_per = int(conf["supertrend"]["atr_period"])
+    if n < max(2, atr_per + 1):
+        atr = np.zeros((k, n))
+    else:
+        c1 = np.concatenate((np.full((k, 1), NAN), close[:, :-1]), axis=1)
+        tr = np.fmax(np.fmax(np.abs(high - low), np.abs(high - c1)), np.abs(low - c1))
+        atr = _fill_batch(_ewm_batch(tr, 1 / atr_per, atr_per))
+    hl2 = (high + low) / 2.0
+    upper = hl2 + conf["supertrend"]["mult"] * atr
+    lower = hl2 - conf["supertrend"]["mult"] * atr
+    st = upper[:, 0]
+    dirn = np.where(close[:, 0] >= st, 1, -1)
+    for t in range(1, i + 1):  # ligne ST à l'index du signal
+        c, up, lo = close[:, t], upper[:, t], lower[:, t]
+        st = np.where(dirn == 1, np.where(c < lo, lo, np.maximum(lo, st)), np.where(c > up, up, np.minimum(up, st)))
+        dirn = np.where(c >= st, 1, -1)
+
+    # Donchian
+    don_len = int(conf["donchian"]["length"])
+    if n < max(2, don_len) or i < don_len - 1:
+        don_high = don_low = np.full(k, NAN)
+    else:
+        don_high = high[:, i - don_len + 1:i + 1].max(axis=1)
+        don_low = low[:, i - don_len + 1:i + 1].min(axis=1)
+
+    v_look = max(int(conf["volume"]["lookback"]), 1)
+    avg_vol_usd = (close[:, -v_look:] * vol[:, -v_look:]).mean(axis=1) if n else np.zeros(k)
+    cur_vol_usd = close[:, -1] * vol[:, -1] if n else np.zeros(k)
+
+    rsi_i, close_i = rsi[:, i], close[:, i]
+    action, vol_ok = signal_rules_arrays(conf, rsi_i, rsi_avg, close_i, st, don_high, don_low,
+                                         avg_vol_usd, cur_vol_usd)
+    return {"rsi": rsi_i, "rsi_avg": rsi_avg, "close": close_i, "st": st, "don_high": don_high,
+            "don_low": don_low, "avg_vol_usd": avg_vol_usd, "cur_vol_usd": cur_vol_usd,
+            "action": action, "vol_ok": vol_ok}
 
 def pick_conf_for_tf(tf: str):
     """Profil d’indicateurs selon TF (court vs long)."""
     return SHORT_TF_CONF if tf in ["1m", "2m", "5m", "15m"] else LONG_TF_CONF
+
+# ---------- SL / TP ----------
+def sl_tp_params(tf: str) -> Tuple[float, float, float]:
+    """(sl_pct, tp_trigger, tp_trail) du TF avec garde-fous (lock mini, R/R mini)."""
+    sl_pct = STOP_LOSS_BY_TF.get(tf, STOP_LOSS_PCT_FALLBACK)
+    tp_trigger = TP_TRIGGER_BY_TF.get(tf, TP_TRIGGER_FALLBACK)
+    tp_trail = TP_TRAIL_BY_TF.get(tf, TP_TRAIL_FALLBACK)
+
+    if tp_trigger <= tp_trail:
+        tp_trigger = tp_trail + 0.01
+    MIN_LOCK = 0.02
+    if (tp_trigger - tp_trail) < MIN_LOCK:
+        tp_trigger = tp_trail + MIN_LOCK
+    MIN_RR = 1.5
+    if sl_pct > 0 and (tp_trigger / sl_pct) < MIN_RR:
+        tp_trigger = sl_pct * MIN_RR
+    return sl_pct, tp_trigger, tp_trail
+
+def position_pnl(entry: float, peak: float, close: float, fee: float) -> Tuple[float, float]:
+    """(pnl_net, drawdown_net depuis le pic), frais taker inclus à l'entrée et à la sortie."""
+    fee = max(0.0, fee)
+    entry_eff = entry * (1.0 + fee)
+    close_eff = close * (1.0 - fee)
+    pnl_net = (close_eff - entry_eff) / entry_eff
+    peak_eff = peak * (1.0 - fee)
+    drawdown_net = (close_eff - peak_eff) / peak_eff
+    return pnl_net, drawdown_net
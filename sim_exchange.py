@@ -0,0 +1,333 @@
+# sim_exchange.py
+# -*- coding: utf-8 -*-
+"""
+Exchange Bitget simulé (in-process) pour paper trading et tests de charge sans réseau.
+
+Surface ccxt utilisée par bot.py / execution.py :
+load_markets, market, fetch_ohlcv, fetch_ticker(s), fetch_balance, create_order,
+amount_to_precision, fetch_my_trades (+ milliseconds / throttle / rateLimit).
+
+- Bougies synthétiques (courbe de prix déterministe par symbole, commune à tous les TF et au
+  ticker, alignée sur l'horloge UTC réelle)
+  ou enregistrées (CSV rejoué : la bougie `warmup` se clôture au démarrage, les suivantes
+  apparaissent au fil du temps).
+- Ordres market appariés contre un carnet simulé (niveaux autour du dernier prix, spread + profondeur).
+- Latence et taux d'erreur injectables (ccxt.NetworkError / RequestTimeout → with_retry).
+
+Activation : SIM_EXCHANGE=true (build_exchange renvoie alors un SimExchange).
+Test de charge :
+    python sim_exchange.py --pairs 300 --tf 1m --latency-ms 40 --error-rate 0.01
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import ccxt
+import numpy as np
+
+from config import (
+    CB_SYMBOL, CB_TF, FEE_TAKER_PCT, SIM_LATENCY_MS, SIM_JITTER_MS, SIM_ERROR_RATE, SIM_USDT,
+    SIM_SPREAD_BPS, SIM_CSV_DIR, SIM_UNIVERSE,
+)
+from utils import tf_to_minutes, get_env_clean, parse_pairs_cfg
+
+SIM_HISTORY_BARS = 1000  # bougies synthétiques servies par série
+
+
+class SimExchange:
+    id = "bitget-sim"
+
+    def __init__(self, symbols: List[str], *, usdt: float = SIM_USDT, latency_ms: float = SIM_LATENCY_MS,
+                 jitter_ms: float = SIM_JITTER_MS, error_rate: float = SIM_ERROR_RATE,
+                 spread_bps: float = SIM_SPREAD_BPS, book_levels: int = 20, level_usdt: float = 5_000.0,
+                 fee_pct: float = FEE_TAKER_PCT, seed: int = 7):
+        self.symbols = sorted(set(symbols))
+        self.latency_ms, self.jitter_ms, self.error_rate = latency_ms, jitter_ms, error_rate
+        self.spread_bps, self.book_levels, self.level_usdt = spread_bps, book_levels, level_usdt
+        self.fee_pct = fee_pct
+        self.rateLimit = 0
+        self.enableRateLimit = False
+        self.lastRestRequestTimestamp = 0
+        self.markets: Dict[str, dict] = {}
+        self.balances: Dict[str, float] = defaultdict(float, {"USDT": float(usdt)})
+        self.trades: List[dict] = []
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._curves: Dict[str, dict] = {}
+        self._recorded: Dict[tuple, dict] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self._order_id = 0
+
+    # ---------- Infra ccxt ----------
+    def milliseconds(self) -> int:
+        return int(time.time() * 1000)
+
+    def throttle(self, cost=None):
+        pass
+
+    def _io(self, name: str):
+        """Compteur + latence + erreur injectées pour chaque appel 'réseau'."""
+        with self._lock:
+            self.calls[name] += 1
+            fail = self._rng.random() < self.error_rate
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms))
+        if delay:
+            time.sleep(delay / 1000.0)
+        if fail:
+            exc = ccxt.RequestTimeout if self._rng.random() < 0.5 else ccxt.NetworkError
+            raise exc(f"[SIM] erreur injectée sur {name}")
+
+    # ---------- Marchés ----------
+    def load_markets(self, reload: bool = False):
+        self._io("load_markets")
+        with self._lock:
+            for sym in self.symbols:
+                base, quote = sym.split("/")
+                self.markets[sym] = {
+                    "id": sym.replace("/", ""), "symbol": sym, "base": base, "quote": quote,
+                    "spot": True, "active": True, "type": "spot",
+                    "precision": {"amount": 6, "price": 8},
+                    "limits": {"amount": {"min": 1e-6}, "cost": {"min": 1.0}},
+                }
+        return self.markets
+
+    def set_markets(self, markets: dict, currencies: dict = None):
+        with self._lock:
+            self.markets = dict(markets)
+            self.symbols = sorted(set(self.symbols) | set(markets))
+        return self.markets
+
+    def market(self, symbol: str) -> dict:
+        if symbol not in self.markets:
+            raise ccxt.BadSymbol(f"[SIM] symbole inconnu {symbol}")
+        return self.markets[symbol]
+
+    def amount_to_precision(self, symbol: str, amount: float) -> str:
+        digits = int(self.market(symbol)["precision"]["amount"])
+        q = 10 ** digits
+        return f"{math.floor(float(amount) * q) / q:.{digits}f}"
+
+    # ---------- Bougies ----------
+    def add_recorded(self, symbol: str, tf: str, rows: List[list], warmup: int = 300):
+        """Rejoue des bougies enregistrées décalées dans le temps (la bougie `warmup` se clôture maintenant)."""
+        tf_ms = tf_to_minutes(tf) * 60_000
+        now_floor = self.milliseconds() // tf_ms * tf_ms
+        shift = now_floor - int(rows[min(warmup, len(rows) - 1)][0])
+        self._recorded[(symbol, tf)] = {"rows": [[int(r[0]) + shift, *map(float, r[1:6])] for r in rows]}
+        if symbol not in self.symbols:
+            self.symbols.append(symbol)
+
+    def _curve(self, symbol: str) -> dict:
+        """Paramètres de prix déterministes du symbole (somme de sinusoïdes de périodes 3 min → 30 j)."""
+        c = self._curves.get(symbol)
+        if c is None:
+            rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+            periods = np.geomspace(3.0, 43_200.0, 12) * 60_000.0
+            c = self._curves[symbol] = {
+                "base": float(rng.uniform(0.5, 500.0)),
+                "omega": 2.0 * np.pi / periods,
+                "amp": 0.004 * np.sqrt(periods / 60_000.0) / np.sqrt(len(periods)) * rng.uniform(0.5, 1.5, len(periods)),
+                "phase": rng.uniform(0.0, 2.0 * np.pi, len(periods)),
+                "vol": float(rng.uniform(5e4, 5e6)),  # volume USD moyen par minute
+            }
+        return c
+
+    def _price(self, symbol: str, t_ms) -> np.ndarray:
+        c = self._curve(symbol)
+        t = np.asarray(t_ms, dtype=np.float64)[..., None]
+        return c["base"] * np.exp((c["amp"] * np.sin(t * c["omega"] + c["phase"])).sum(axis=-1))
+
+    def _synthetic(self, symbol: str, tf: str, upto_ms: int) -> List[list]:
+        """Bougies synthétiques jusqu'à upto_ms : même courbe de prix pour tous les TF et le ticker."""
+        tf_ms = tf_to_minutes(tf) * 60_000
+        last_open = upto_ms // tf_ms * tf_ms
+        ts = last_open - np.arange(SIM_HISTORY_BARS - 1, -1, -1, dtype=np.int64) * tf_ms
+        # 9 points par bougie (bornée à upto_ms pour la bougie en formation)
+        pts = np.minimum(ts[:, None] + np.linspace(0.0, tf_ms, 9)[None, :], upto_ms)
+        px = self._price(symbol, pts)
+        noise = ((ts.astype(np.uint64) * np.uint64(2654435761)) % np.uint64(1 << 32)).astype(np.float64) / 2**32
+        frac = (pts[:, -1] - ts) / tf_ms
+        vol = self._curve(symbol)["vol"] * (tf_ms / 60_000.0) * frac * (0.25 + 1.5 * noise) / px[:, -1]
+        return np.column_stack([ts, px[:, 0], px.max(axis=1), px.min(axis=1), px[:, -1], vol]).tolist()
+
+    def _bars(self, symbol: str, tf: str) -> List[list]:
+        now = self.milliseconds()
+        with self._lock:
+            rec = self._recorded.get((symbol, tf))
+            if rec is not None:
+                return [r for r in rec["rows"] if r[0] <= now]
+            rows = self._synthetic(symbol, tf, now)
+        for r in rows:
+            r[0] = int(r[0])
+        return rows
+
+    def fetch_ohlcv(self, symbol: str, timeframe: str = "1m", since: Optional[int] = None,
+                    limit: Optional[int] = None, params: dict = None):
+        self._io("fetch_ohlcv")
+        self.market(symbol)
+        rows = self._bars(symbol, timeframe)
+        if since is not None:
+            rows = [r for r in rows if r[0] >= since]
+            return [list(r) for r in rows[:limit or len(rows)]]
+        return [list(r) for r in rows[-(limit or 100):]]
+
+    # ---------- Ticker / carnet ----------
+    def _last_price(self, symbol: str) -> float:
+        tf = next((k[1] for k in self._recorded if k[0] == symbol), None)
+        if tf is not None:
+            return float(self._bars(symbol, tf)[-1][4])
+        with self._lock:
+            return float(self._price(symbol, self.milliseconds()))
+
+    def _ticker(self, symbol: str) -> dict:
+        last = self._last_price(symbol)
+        half = last * self.spread_bps / 20_000.0
+        quote_vol = self._curve(symbol)["vol"] * 1440.0
+        return {"symbol": symbol, "last": last, "close": last, "bid": last - half, "ask": last + half,
+                "quoteVolume": quote_vol, "baseVolume": quote_vol / last, "timestamp": self.milliseconds()}
+
+    def fetch_ticker(self, symbol: str, params: dict = None) -> dict:
+        self._io("fetch_ticker")
+        self.market(symbol)
+        return self._ticker(symbol)
+
+    def fetch_tickers(self, symbols: Optional[List[str]] = None, params: dict = None) -> Dict[str, dict]:
+        """Tous les tickers en un appel (comme l'endpoint spot Bitget)."""
+        self._io("fetch_tickers")
+        return {s: self._ticker(s) for s in (symbols or list(self.markets))}
+
+    def _book_side(self, symbol: str, side: str):
+        """Niveaux (prix, quantité) côté ask (buy) ou bid (sell), profondeur croissante."""
+        last = self._last_price(symbol)
+        half = last * self.spread_bps / 20_000.0
+        step = last * 0.0005
+        levels = []
+        for i in range(self.book_levels):
+            px = (last + half + i * step) if side == "buy" else (last - half - i * step)
+            levels.append((px, self.level_usdt * (1 + i * 0.5) / max(px, 1e-12)))
+        return levels
+
+    # ---------- Comptes / ordres ----------
+    def fetch_balance(self, params: dict = None) -> dict:
+        self._io("fetch_balance")
+        with self._lock:
+            out = {ccy: {"free": amt, "used": 0.0, "total": amt} for ccy, amt in self.balances.items()}
+        out["free"] = {ccy: v["free"] for ccy, v in out.items() if isinstance(v, dict)}
+        return out
+
+    def create_order(self, symbol: str, type: str, side: str, amount: float, price: float = None, params: dict = None):
+        self._io("create_order")
+        if type != "market":
+            raise ccxt.NotSupported("[SIM] seuls les ordres market sont simulés")
+        mkt = self.market(symbol)
+        amount = float(amount)
+        remaining, cost = amount, 0.0
+        for px, qty in self._book_side(symbol, side):
+            take = min(remaining, qty)
+            cost += take * px
+            remaining -= take
+            if remaining <= 0:
+                break
+        filled = amount - max(remaining, 0.0)
+        avg = cost / filled if filled > 0 else 0.0
+        fee = cost * self.fee_pct
+        with self._lock:
+            if side == "buy":
+                if self.balances["USDT"] < cost + fee:
+                    raise ccxt.InsufficientFunds(f"[SIM] USDT insuffisant ({self.balances['USDT']:.2f} < {cost + fee:.2f})")
+                self.balances["USDT"] -= cost + fee
+                self.balances[mkt["base"]] += filled
+            else:
+                if self.balances[mkt["base"]] + 1e-12 < filled:
+                    raise ccxt.InsufficientFunds(f"[SIM] {mkt['base']} insuffisant")
+                self.balances[mkt["base"]] -= filled
+                self.balances["USDT"] += cost - fee
+            self._order_id += 1
+            oid = str(self._order_id)
+            ts = self.milliseconds()
+            trade = {"id": oid, "order": oid, "symbol": symbol, "side": side, "type": "market",
+                     "amount": filled, "price": avg, "cost": cost, "timestamp": ts,
+                     "fee": {"cost": fee, "currency": "USDT"}}
+            self.trades.append(trade)
+        return {"id": oid, "symbol": symbol, "type": "market", "side": side, "status": "closed",
+                "amount": amount, "filled": filled, "remaining": amount - filled, "average": avg,
+                "cost": cost, "fee": {"cost": fee, "currency": "USDT"}, "timestamp": ts, "trades": [trade]}
+
+    def fetch_my_trades(self, symbol: str = None, since: int = None, limit: int = None, params: dict = None):
+        self._io("fetch_my_trades")
+        with self._lock:
+            out = [t for t in self.trades
+                   if (symbol is None or t["symbol"] == symbol) and (since is None or t["timestamp"] >= since)]
+        return out[-limit:] if limit else out
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": dict(self.calls), "orders": len(self.trades),
+                    "usdt": round(self.balances["USDT"], 4)}
+
+
+def build_sim_exchange() -> SimExchange:
+    """SimExchange pour les symboles de PAIRS_CFG (+ CB_SYMBOL, + SIM_UNIVERSE marchés synthétiques),
+    CSV optionnels via SIM_CSV_DIR."""
+    cfg = parse_pairs_cfg(get_env_clean("PAIRS_CFG"))
+    ex = SimExchange([c["symbol"] for c in cfg] + [CB_SYMBOL] + [f"SIM{i:03d}/USDT" for i in range(SIM_UNIVERSE)])
+    if SIM_CSV_DIR:
+        import pandas as pd
+        for c in cfg + [{"symbol": CB_SYMBOL, "tf": CB_TF}]:
+            path = os.path.join(SIM_CSV_DIR, f"{c['symbol'].replace('/', '_')}_{c['tf']}.csv")
+            if os.path.exists(path):
+                rows = pd.read_csv(path)[["ts", "open", "high", "low", "close", "vol"]].values.tolist()
+                ex.add_recorded(c["symbol"], c["tf"], rows)
+    return ex
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Test de charge du bot contre l'exchange simulé")
+    ap.add_argument("--pairs", type=int, default=100)
+    ap.add_argument("--tf", default="1m")
+    ap.add_argument("--latency-ms", type=float, default=30.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--live", action="store_true", help="DRY_RUN=false (ordres appariés par le simulateur)")
+    args = ap.parse_args()
+
+    # La config est lue à l'import : on relance bot.py dans un process avec l'environnement du test
+    env = dict(os.environ)
+    env.update({
+        "SIM_EXCHANGE": "true",
+        "SIM_LATENCY_MS": str(args.latency_ms),
+        "SIM_JITTER_MS": str(args.jitter_ms),
+        "SIM_ERROR_RATE": str(args.error_rate),
+        "DRY_RUN": "false" if args.live else "true",
+        "PAIRS_CFG": ";".join(f"SIM{i:03d}/USDT@{args.tf}=20,signal=live" for i in range(args.pairs)),
+    })
+    # Jamais les fichiers / services de production (état, backups, snapshot, logs, heartbeat,
+    # webhooks, port métriques) : un répertoire temporaire par test de charge
+    work = tempfile.mkdtemp(prefix="sim_")
+    state_file = os.path.join(work, "state.json")
+    env.update({
+        "STATE_FILE": state_file,
+        "STATE_BACKUP_DIR": os.path.join(work, "backups"),
+        "WARM_SNAPSHOT_FILE": state_file + ".warm",
+        "MARKETS_CACHE_FILE": os.path.join(work, "markets.json"),
+        "HEARTBEAT_FILE": os.path.join(work, "heartbeat.txt"),
+        "LOG_FILE": os.path.join(work, "bot.log"),
+        "OHLCV_STORE_DIR": "",
+        "SHARD_COORDINATOR": "",
+        "METRICS_PORT": "0",
+        "WEBHOOK_URL": "",
+    })
+    print(f"[SIM] Test de charge dans {work}", flush=True)  # avant execvpe (tampons perdus)
+    bot_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+    os.execvpe(sys.executable, [sys.executable, bot_py], env)
+
+if __name__ == "__main__":
+    main()
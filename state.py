@@ -1,96 +1,260 @@
 # state.py
 # -*- coding: utf-8 -*-
-import os, json, logging, datetime as dt, glob
+"""
+Persistance d'état : snapshot JSON (STATE_FILE) + journal append-only des mutations.
+
+- load_state() : snapshot + rejeu du journal (entrées seq > seq du snapshot).
+  Les dicts renvoyés (TrackedDict) notent les clés modifiées.
+- save_state() : ajoute au journal UNIQUEMENT les clés modifiées (1 ligne JSON, fsync).
+  Aucune écriture si rien n'a changé.
+- Compaction (journal > STATE_JOURNAL_MAX_BYTES) : snapshot atomique, backup daté du snapshot
+  et archivage du segment de journal dans BACKUP_DIR (restauration à un instant donné).
+"""
+import os, json, logging, datetime as dt, glob, time, threading
 from typing import Dict, Tuple
 from config import STATE_FILE
+import metrics
 
 log = logging.getLogger("bot")
 
-# --------- Paramètres de backup ---------
+# --------- Paramètres de backup / journal ---------
 BACKUP_DIR = os.getenv("STATE_BACKUP_DIR", "state_backups")
 BACKUP_RETENTION = int(os.getenv("STATE_BACKUP_RETENTION", "50"))  # nb de fichiers à conserver
+JOURNAL_FILE = STATE_FILE + ".journal"
+JOURNAL_MAX_BYTES = int(os.getenv("STATE_JOURNAL_MAX_BYTES", "262144"))  # seuil de compaction
+
+SECTIONS = ("last_side", "entry_price", "peak_price", "tp_armed",
+            "base_qty_at_entry", "last_trade_ts", "buy_timestamps")
+
+_seq = 0                 # numéro de la dernière entrée journalisée
+_cb_saved = None         # dernier cb_block_until_ts persisté
+_lock = threading.RLock()
+
+
+class TrackedDict(dict):
+    """dict qui mémorise les clés modifiées/supprimées depuis la dernière sauvegarde."""
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self.dirty = set()
+
+    def __setitem__(self, k, v):
+        # Valeur scalaire inchangée → pas de mutation (ex: peak_price recalculé à chaque bougie)
+        if isinstance(v, (list, dict)) or k not in self or dict.__getitem__(self, k) != v:
+            self.dirty.add(k)
+        super().__setitem__(k, v)
+
+    def __delitem__(self, k):
+        super().__delitem__(k)
+        self.dirty.add(k)
+
+    def pop(self, k, *default):
+        if k in self:
+            self.dirty.add(k)
+        return super().pop(k, *default)
+
+    def setdefault(self, k, default=None):
+        if k not in self:
+            self[k] = default
+        return dict.__getitem__(self, k)
+
+    def update(self, *a, **kw):
+        for k, v in dict(*a, **kw).items():
+            self[k] = v
+
+    def clear(self):
+        self.dirty.update(self.keys())
+        super().clear()
 
 def _ser(dct: Dict[Tuple[str, str], float]):
     return {f"{k[0]}|{k[1]}": v for k, v in dct.items()}
 
+def _key(k: Tuple[str, str]) -> str:
+    return f"{k[0]}|{k[1]}"
+
+def empty_raw():
+    raw = {s: {} for s in SECTIONS}
+    raw["cb_block_until_ts"] = 0.0
+    raw["seq"] = 0
+    return raw
+
+def read_snapshot(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    raw = empty_raw()
+    for s in SECTIONS:
+        raw[s] = dict(data.get(s, {}))
+    raw["cb_block_until_ts"] = float(data.get("cb_block_until_ts", 0.0))
+    raw["seq"] = int(data.get("seq", 0))
+    raw["saved_at"] = data.get("saved_at")
+    return raw
+
+def read_journal(path: str):
+    """Entrées valides du journal (une ligne tronquée par un crash est ignorée)."""
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except Exception:
+                log.warning(f"[STATE] Ligne de journal illisible ignorée ({path})")
+    return entries
+
+def _truncate_partial_tail(path: str):
+    """Coupe une dernière ligne incomplète (crash pendant l'append) pour ne pas corrompre la suivante."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b"\n":
+            return
+        data = f.seek(0) or f.read()
+        f.truncate(data.rfind(b"\n") + 1)
+    log.warning(f"[STATE] Fin de journal incomplète tronquée ({path})")
+
+def apply_journal(raw: dict, entries, until_ts: float = None) -> dict:
+    """Rejoue les entrées seq > raw['seq'] (et ts <= until_ts si fourni) sur l'état brut."""
+    for e in sorted(entries, key=lambda x: x.get("seq", 0)):
+        if e.get("seq", 0) <= raw["seq"]:
+            continue
+        if until_ts is not None and float(e.get("ts", 0)) > until_ts:
+            break
+        for section, k, v, deleted in e.get("ops", []):
+            if section == "cb_block_until_ts":
+                raw["cb_block_until_ts"] = float(v)
+            elif deleted:
+                raw[section].pop(k, None)
+            else:
+                raw[section][k] = v
+        raw["seq"] = e["seq"]
+    return raw
+
 def load_state():
-    try:
-        with open(STATE_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        log.info(f"[STATE] Etat chargé depuis {STATE_FILE}")
-        return {
-            "last_side":         {tuple(k.split("|")): v for k, v in data.get("last_side", {}).items()},
-            "entry_price":       {tuple(k.split("|")): v for k, v in data.get("entry_price", {}).items()},
-            "peak_price":        {tuple(k.split("|")): v for k, v in data.get("peak_price", {}).items()},
-            "tp_armed":          {tuple(k.split("|")): v for k, v in data.get("tp_armed", {}).items()},
-            "base_qty_at_entry": {tuple(k.split("|")): v for k, v in data.get("base_qty_at_entry", {}).items()},
-            "last_trade_ts":     {tuple(k.split("|")): v for k, v in data.get("last_trade_ts", {}).items()},
-            "buy_timestamps":    {tuple(k.split("|")): v for k, v in data.get("buy_timestamps", {}).items()},
-            "cb_block_until_ts": float(data.get("cb_block_until_ts", 0.0)),
-        }
-    except Exception:
-        log.info(f"[STATE] Aucun état existant (nouveau run)")
-        return {
-            "last_side": {}, "entry_price": {}, "peak_price": {}, "tp_armed": {},
-            "base_qty_at_entry": {}, "last_trade_ts": {}, "buy_timestamps": {},
-            "cb_block_until_ts": 0.0,
-        }
+    global _seq, _cb_saved
+    with _lock:
+        try:
+            raw = read_snapshot(STATE_FILE) if os.path.exists(STATE_FILE) else empty_raw()
+            _truncate_partial_tail(JOURNAL_FILE)
+            journal = read_journal(JOURNAL_FILE)
+            apply_journal(raw, journal)
+            if not os.path.exists(STATE_FILE) and not journal:
+                raise FileNotFoundError(STATE_FILE)
+            log.info(f"[STATE] Etat chargé depuis {STATE_FILE} (+{len(journal)} entrées journal)")
+        except Exception:
+            log.info(f"[STATE] Aucun état existant (nouveau run)")
+            raw = empty_raw()
+        _seq = raw["seq"]
+        _cb_saved = float(raw["cb_block_until_ts"])
+        out = {s: TrackedDict({tuple(k.split("|")): v for k, v in raw[s].items()}) for s in SECTIONS}
+        out["cb_block_until_ts"] = float(raw["cb_block_until_ts"])
+        return out
 
 def _ensure_parent_dir(path: str):
     parent = os.path.dirname(path)
     if parent:
         os.makedirs(parent, exist_ok=True)
 
-def _backup_state_file():
-    """Copie STATE_FILE vers BACKUP_DIR avec un nom horodaté. Applique la rétention."""
+def _apply_retention(pattern: str):
+    files = sorted(glob.glob(pattern))
+    if BACKUP_RETENTION > 0 and len(files) > BACKUP_RETENTION:
+        for old in files[:-BACKUP_RETENTION]:
+            try:
+                os.remove(old)
+            except Exception:
+                pass
+
+def backup_state_file():
+    """Copie STATE_FILE (et le segment de journal compacté) vers BACKUP_DIR. Applique la rétention."""
     try:
         if not os.path.exists(STATE_FILE):
             return
         os.makedirs(BACKUP_DIR, exist_ok=True)
-        ts = dt.datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%SZ")
+        ts = dt.datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S.%fZ")
         base = os.path.splitext(os.path.basename(STATE_FILE))[0]  # ex: 'state'
         backup_path = os.path.join(BACKUP_DIR, f"{base}_{ts}.json")
         # Lire puis réécrire pour éviter les liens durs/soft et garder l’atomicité logique
         with open(STATE_FILE, "r", encoding="utf-8") as src, open(backup_path, "w", encoding="utf-8") as dst:
             dst.write(src.read())
+        if os.path.exists(JOURNAL_FILE) and os.path.getsize(JOURNAL_FILE) > 0:
+            os.replace(JOURNAL_FILE, os.path.join(BACKUP_DIR, f"{base}_{ts}.journal"))
         # Rétention
-        files = sorted(glob.glob(os.path.join(BACKUP_DIR, f"{base}_*.json")))
-        if BACKUP_RETENTION > 0 and len(files) > BACKUP_RETENTION:
-            for old in files[:-BACKUP_RETENTION]:
-                try:
-                    os.remove(old)
-                except Exception:
-                    pass
+        _apply_retention(os.path.join(BACKUP_DIR, f"{base}_*.json"))
+        _apply_retention(os.path.join(BACKUP_DIR, f"{base}_*.journal"))
         log.info(f"[STATE] Backup écrit -> {backup_path}")
     except Exception as e:
         log.warning(f"[STATE] Echec backup: {e}")
 
+def write_snapshot(sections: dict, cb_block_until_ts: float, seq: int):
+    """Snapshot complet atomique (tmp + replace + fsync)."""
+    payload = {s: _ser(sections[s]) for s in SECTIONS}
+    payload["cb_block_until_ts"] = float(cb_block_until_ts)
+    payload["seq"] = int(seq)
+    payload["saved_at"] = dt.datetime.utcnow().isoformat()
+    _ensure_parent_dir(STATE_FILE)
+    tmp_file = STATE_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, STATE_FILE)  # remplace l’ancien fichier
+
+def _compact(sections: dict, cb_block_until_ts: float):
+    write_snapshot(sections, cb_block_until_ts, _seq)
+    # Backup daté du snapshot + archivage du segment de journal (déjà couvert par le snapshot)
+    backup_state_file()
+    if os.path.exists(JOURNAL_FILE):
+        open(JOURNAL_FILE, "w").close()
+    log.info(f"[STATE] Compaction -> {STATE_FILE} (seq={_seq})")
+
 def save_state(last_side, entry_price, peak_price, tp_armed,
-               base_qty_at_entry, last_trade_ts, buy_timestamps, cb_block_until_ts: float):
+               base_qty_at_entry, last_trade_ts, buy_timestamps, cb_block_until_ts: float,
+               compact: bool = False):
+    """Journalise les clés modifiées depuis la dernière sauvegarde (O(clés modifiées))."""
+    global _seq, _cb_saved
+    sections = dict(zip(SECTIONS, (last_side, entry_price, peak_price, tp_armed,
+                                   base_qty_at_entry, last_trade_ts, buy_timestamps)))
+    t0 = time.perf_counter()
     try:
-        payload = {
-            "last_side":         _ser(last_side),
-            "entry_price":       _ser(entry_price),
-            "peak_price":        _ser(peak_price),
-            "tp_armed":          _ser(tp_armed),
-            "base_qty_at_entry": _ser(base_qty_at_entry),
-            "last_trade_ts":     _ser(last_trade_ts),
-            "buy_timestamps":    {f"{k[0]}|{k[1]}": v for k, v in buy_timestamps.items()},
-            "cb_block_until_ts": float(cb_block_until_ts),
-            "saved_at":          dt.datetime.utcnow().isoformat(),
-        }
-
-        _ensure_parent_dir(STATE_FILE)
-
-        # 1) Écrire de façon atomique
-        tmp_file = STATE_FILE + ".tmp"
-        with open(tmp_file, "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
-        os.replace(tmp_file, STATE_FILE)  # remplace l’ancien fichier
-
-        # 2) Faire un backup daté et appliquer la rétention
-        _backup_state_file()
-
-        log.info(f"[STATE] Etat sauvegardé -> {STATE_FILE}")
+        with _lock:
+            # dict non suivi (appel externe) → snapshot complet
+            if not all(isinstance(d, TrackedDict) for d in sections.values()):
+                compact = True
+
+            ops = []
+            for name, d in sections.items():
+                if not isinstance(d, TrackedDict):
+                    continue
+                for k in d.dirty:
+                    if k in d:
+                        ops.append([name, _key(k), dict.__getitem__(d, k), False])
+                    else:
+                        ops.append([name, _key(k), None, True])
+            if _cb_saved is None or float(cb_block_until_ts) != _cb_saved:
+                ops.append(["cb_block_until_ts", "", float(cb_block_until_ts), False])
+
+            if ops:
+                _seq += 1
+                line = json.dumps({"seq": _seq, "ts": time.time(), "ops": ops}, ensure_ascii=False)
+                _ensure_parent_dir(JOURNAL_FILE)
+                with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                log.info(f"[STATE] Journal +{len(ops)} mutation(s) (seq={_seq})")
+            for d in sections.values():
+                if isinstance(d, TrackedDict):
+                    d.dirty.clear()
+            _cb_saved = float(cb_block_until_ts)
+
+            size = os.path.getsize(JOURNAL_FILE) if os.path.exists(JOURNAL_FILE) else 0
+            if compact or size > JOURNAL_MAX_BYTES:
+                _compact(sections, cb_block_until_ts)
     except Exception as e:
         log.warning(f"[STATE] Echec sauvegarde: {e}")
+    finally:
+        metrics.observe("bot_state_save_seconds", time.perf_counter() - t0)
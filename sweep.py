@@ -0,0 +1,198 @@
+# sweep.py
+# -*- coding: utf-8 -*-
+"""
+Grid search parallèle des réglages PAIRS_CFG (et des profils SHORT_TF_CONF / LONG_TF_CONF)
+via le backtest vectorisé.
+
+- Les OHLCV de chaque symbole sont chargés une fois dans un bloc de mémoire partagée
+  (multiprocessing.shared_memory) ; les workers s'y attachent sans copie par tâche.
+- Chaque tâche = (série, lot de combinaisons) sur un pool de processus.
+- Sortie : tableau classé + colonne `pairs_cfg` collable telle quelle dans PAIRS_CFG
+  (st_atr / st_mult / don_len relèvent des profils de config.py, pas de PAIRS_CFG).
+- signal=closed dans les lignes émises : le backtest décide sur la bougie close (pas de données
+  intra-bougie pour simuler signal=live), ce n'est donc pas une clé de grille.
+
+Clés de grille : avg, avg_period, rsi, st_atr, st_mult, don_len.
+Exemple :
+    python sweep.py --pair "BTC/USDT@5m=100" --pair "ETH/USDT@5m=100" --days 60 \\
+        --grid '{"avg": ["ema", "sma"], "avg_period": [7, 14, 21], "rsi": [7, 14, 21], "st_mult": [2, 3]}'
+"""
+import argparse
+import copy
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from backtest import OHLCV_COLS, run_backtest, load_ohlcv_csv, load_history
+from config import OHLCV_STORE_DIR
+from ohlcv_store import OHLCVStore
+from signals import pick_conf_for_tf
+from utils import parse_pairs_cfg, format_pair_cfg
+
+log = logging.getLogger("bot")
+
+GRID_DEFAULTS = {"avg": "ema", "avg_period": 21, "rsi": 21, "st_atr": None, "st_mult": None, "don_len": None}
+
+# Séries attachées dans chaque worker : key -> (SharedMemory, ndarray (n, 6))
+_SERIES: Dict[str, tuple] = {}
+
+
+def expand_grid(grid: dict) -> List[dict]:
+    """Produit cartésien de la grille (valeurs scalaires acceptées)."""
+    unknown = set(grid) - set(GRID_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Clés de grille inconnues: {sorted(unknown)}")
+    keys = list(GRID_DEFAULTS)
+    values = [grid.get(k, GRID_DEFAULTS[k]) for k in keys]
+    values = [v if isinstance(v, (list, tuple)) else [v] for v in values]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+def conf_for_combo(tf: str, combo: dict) -> dict:
+    conf = copy.deepcopy(pick_conf_for_tf(tf))
+    if combo.get("st_atr") is not None:
+        conf["supertrend"]["atr_period"] = int(combo["st_atr"])
+    if combo.get("st_mult") is not None:
+        conf["supertrend"]["mult"] = float(combo["st_mult"])
+    if combo.get("don_len") is not None:
+        conf["donchian"]["length"] = int(combo["don_len"])
+    return conf
+
+
+# ---------- Mémoire partagée ----------
+def _to_shared(df: pd.DataFrame):
+    arr = df[OHLCV_COLS].to_numpy(np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    view = np.ndarray(arr.shape, dtype=np.float64, buffer=shm.buf)
+    view[:] = arr
+    return shm, {"name": shm.name, "shape": arr.shape}
+
+def _worker_init(metas: Dict[str, dict]):
+    for key, meta in metas.items():
+        # Les workers partagent le resource_tracker du parent, seul propriétaire (unlink en fin de sweep)
+        shm = shared_memory.SharedMemory(name=meta["name"])
+        _SERIES[key] = (shm, np.ndarray(meta["shape"], dtype=np.float64, buffer=shm.buf))
+
+def _frame(key: str) -> pd.DataFrame:
+    arr = _SERIES[key][1]
+    df = pd.DataFrame(arr, columns=OHLCV_COLS, copy=False)
+    df["ts"] = arr[:, 0].astype(np.int64)
+    return df
+
+def _eval_chunk(task) -> List[dict]:
+    key, symbol, tf, alloc, initial, combos = task
+    df = _frame(key)
+    rows = []
+    for combo in combos:
+        res = run_backtest(df, tf, alloc=alloc, avg_type=combo["avg"], avg_period=int(combo["avg_period"]),
+                           rsi_period=int(combo["rsi"]), conf=conf_for_combo(tf, combo), initial_usdt=initial)
+        rows.append({"symbol": symbol, "tf": tf, "alloc": alloc, **combo, **res["stats"]})
+    return rows
+
+
+# ---------- Orchestration ----------
+def run_sweep(series: Dict[tuple, pd.DataFrame], grid: dict, *, alloc: str = "100", initial_usdt: float = 1000.0,
+              workers: int = None, rank_by: str = "pnl_pct", allocs: Dict[tuple, str] = None) -> pd.DataFrame:
+    """
+    series : {(symbol, tf): DataFrame OHLCV}. Retourne le tableau classé (meilleur en tête par symbole).
+    allocs : {(symbol, tf): alloc} propre à chaque série (défaut : `alloc`).
+    """
+    allocs = allocs or {}
+    combos = expand_grid(grid)
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    shms, metas, tasks = [], {}, []
+    try:
+        for i, ((symbol, tf), df) in enumerate(series.items()):
+            shm, meta = _to_shared(df)
+            shms.append(shm)
+            key = f"s{i}"
+            metas[key] = meta
+            chunk = max(1, len(combos) // (workers * 4) or 1)
+            for j in range(0, len(combos), chunk):
+                tasks.append((key, symbol, tf, allocs.get((symbol, tf), alloc), initial_usdt, combos[j:j + chunk]))
+
+        rows: List[dict] = []
+        if workers == 1:
+            _worker_init(metas)
+            for t in tasks:
+                rows.extend(_eval_chunk(t))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init, initargs=(metas,)) as pool:
+                for chunk_rows in pool.map(_eval_chunk, tasks):
+                    rows.extend(chunk_rows)
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    table = pd.DataFrame(rows)
+    if table.empty:
+        return table
+    table["pairs_cfg"] = [
+        format_pair_cfg({"symbol": r.symbol, "tf": r.tf, "alloc": r.alloc, "avg": r.avg,
+                         "avg_period": r.avg_period, "rsi_period": r.rsi, "signal": "closed"})
+        for r in table.itertuples()
+    ]
+    table = table.sort_values(["symbol", "tf", rank_by], ascending=[True, True, False]).reset_index(drop=True)
+    table["rank"] = table.groupby(["symbol", "tf"]).cumcount() + 1
+    return table
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Grid search PAIRS_CFG (backtest parallèle)")
+    ap.add_argument("--pair", action="append", required=True, help='ex: "BTC/USDT@5m=100" (répétable)')
+    ap.add_argument("--csv", action="append", default=[], help="SYMBOL@TF=chemin.csv (répétable)")
+    ap.add_argument("--days", type=float, default=30.0)
+    ap.add_argument("--store", default=OHLCV_STORE_DIR, help="dossier OHLCVStore (historique réutilisé entre runs)")
+    ap.add_argument("--grid", required=True, help="JSON inline ou chemin d'un fichier JSON")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--initial", type=float, default=1000.0)
+    ap.add_argument("--rank-by", default="pnl_pct")
+    ap.add_argument("--top", type=int, default=5)
+    ap.add_argument("--out", help="export CSV du tableau complet")
+    args = ap.parse_args()
+
+    grid = json.load(open(args.grid)) if os.path.exists(args.grid) else json.loads(args.grid)
+    pairs = [parse_pairs_cfg(p)[0] for p in args.pair]
+    csv_map = dict(s.split("=", 1) for s in args.csv)
+
+    series, ex = {}, None
+    store = OHLCVStore(args.store) if args.store else None
+    for c in pairs:
+        path = csv_map.get(f"{c['symbol']}@{c['tf']}")
+        if path:
+            series[(c["symbol"], c["tf"])] = load_ohlcv_csv(path)
+            continue
+        if ex is None:
+            import ccxt
+            ex = ccxt.bitget({"enableRateLimit": True, "options": {"defaultType": "spot"}})
+        since = ex.milliseconds() - int(args.days * 86_400_000)
+        series[(c["symbol"], c["tf"])] = load_history(ex, c["symbol"], c["tf"], since, store)
+
+    t0 = time.perf_counter()
+    table = run_sweep(series, grid, initial_usdt=args.initial, workers=args.workers, rank_by=args.rank_by,
+                      allocs={(c["symbol"], c["tf"]): c["alloc"] for c in pairs})
+    el = time.perf_counter() - t0
+    n_combos = len(expand_grid(grid))
+    print(f"[SWEEP] {n_combos} combinaisons x {len(series)} séries en {el:.1f}s")
+    cols = ["rank", "symbol", "tf", "avg", "avg_period", "rsi", "st_atr", "st_mult", "don_len",
+            "pnl_pct", "max_drawdown_pct", "win_rate", "sells"]
+    if not table.empty:
+        print(table[table["rank"] <= args.top][cols].to_string(index=False))
+        print("\n# PAIRS_CFG (meilleure combinaison par série)")
+        for line in table[table["rank"] == 1]["pairs_cfg"]:
+            print(line)
+    if args.out:
+        table.to_csv(args.out, index=False)
+        print(f"[SWEEP] Tableau -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 # utils.py
 # -*- coding: utf-8 -*-
-import os, time, datetime as dt, json, logging, urllib.request as _req, urllib.parse
-from config import HEARTBEAT_FILE, HEARTBEAT_INTERVAL_SEC, WEBHOOK_URL
+import os, re, time, datetime as dt, json, logging, urllib.parse, threading, queue, atexit, http.client
+from config import (
+    HEARTBEAT_FILE, HEARTBEAT_INTERVAL_SEC, WEBHOOK_URL, WEBHOOK_QUEUE_MAX, WEBHOOK_COALESCE_SEC, WEBHOOK_RETRIES
+)
+
+import metrics
 
 log = logging.getLogger("bot")
 
@@ -10,7 +14,7 @@ _last_progress = time.time()  # suivi watchdog
 
 
 def utcnow() -> dt.datetime:
-    return dt.datetime.now(dt.timezone.utc)
+    return dt.datetime.fromtimestamp(time.time(), dt.timezone.utc)  # via time.time : horloge du rejeu
 
 def floor_dt_to_tf(now: dt.datetime, tf_minutes: int) -> dt.datetime:
     epoch = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
@@ -64,9 +68,81 @@ def tf_to_minutes(tf: str) -> int:
     if tf.endswith("w"): return int(tf[:-1]) * 60 * 24 * 7
     raise ValueError(f"Timeframe non supporté: {tf}")
 
+ALLOC_RE = re.compile(r"^\d+(\.\d+)?%?$")
+
+def parse_pairs_cfg(raw: str):
+    """PAIRE@TF=ALLOC,avg=(sma|ema),avg_period=<int>,rsi=<int>,signal=(live|closed)[,slip=<pct>]; ..."""
+    out = []
+    if not raw:
+        return out
+    entries = [e.strip() for e in raw.split(";") if e.strip()]
+    for entry in entries:
+        left, *attrs = [frag.strip() for frag in entry.split(",")]
+        pair_tf, alloc = [frag.strip() for frag in left.split("=", 1)]
+        pair, tf = [frag.strip() for frag in pair_tf.split("@", 1)]
+
+        if not ALLOC_RE.match(alloc):
+            raise ValueError(f"Allocation invalide '{alloc}'")
+        _ = tf_to_minutes(tf)  # validation TF
+
+        avg, avg_period, rsi_per, signal, slip = "ema", 21, 21, "closed", None
+        for frag in attrs:
+            if "=" not in frag:
+                continue
+            k, v = frag.split("=", 1)
+            k = k.strip().lower()
+            v = v.strip().lower()
+
+            if k == "avg":
+                if v not in ("ema", "sma"):
+                    raise ValueError("avg doit être 'ema' ou 'sma'")
+                avg = v
+            elif k == "avg_period":
+                ap = int(v)
+                if ap <= 0:
+                    raise ValueError("avg_period doit être > 0")
+                avg_period = ap
+            elif k == "rsi":
+                rp = int(v)
+                if rp <= 0:
+                    raise ValueError("rsi doit être > 0")
+                rsi_per = rp
+            elif k == "signal":
+                if v not in ("live", "closed"):
+                    raise ValueError("signal doit être 'live' ou 'closed'")
+                signal = v
+            elif k == "slip":
+                try:
+                    sv = float(v)
+                except Exception:
+                    raise ValueError("slip doit être un nombre (en %)")
+                slip = sv
+
+        out.append({
+            "symbol": pair,
+            "tf": tf.lower(),
+            "alloc": alloc,
+            "avg": avg,
+            "avg_period": avg_period,
+            "rsi_period": rsi_per,
+            "signal": signal,
+            "slip": slip,
+        })
+    return out
+
+def format_pair_cfg(c: dict) -> str:
+    """Inverse de parse_pairs_cfg pour une entrée (ligne collable dans PAIRS_CFG)."""
+    line = (f"{c['symbol']}@{c['tf']}={c.get('alloc', '100')},avg={c.get('avg', 'ema')},"
+            f"avg_period={c.get('avg_period', 21)},rsi={c.get('rsi_period', 21)},signal={c.get('signal', 'closed')}")
+    if c.get("slip") is not None:
+        line += f",slip={c['slip']}"
+    return line + ";"
+
 # -----------------------------------------------------------
-# ✅ Envoi Webhook/Telegram ergonomique
+# ✅ Envoi Webhook/Telegram ergonomique (dispatcher non bloquant)
 # -----------------------------------------------------------
+COALESCE_EVENTS = ("buy_dry", "sell_dry")  # regroupés en un seul message "digest"
+
 def format_message(event: str, payload: dict) -> str:
     """Construit un message texte ergonomique pour Telegram."""
     emoji = payload.get("emoji", "ℹ️")
@@ -84,35 +160,163 @@ def format_message(event: str, payload: dict) -> str:
         return f"💥 Crash imprévu:\n{payload.get('error','?')}"
     elif event == "bot_autorestart":
         return f"🔁 Redémarrage auto dans {payload.get('delay_sec',10)}s"
+    elif event == "digest":
+        lines = [format_message(e["event"], e) for e in payload.get("events", [])]
+        return f"🧾 {len(lines)} événements\n" + "\n".join(lines)
     else:
         return f"{emoji} {msg}"
 
+class _HttpPool:
+    """Connexions HTTP(S) keep-alive réutilisées par hôte (thread dispatcher uniquement)."""
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+        self._conns = {}
+
+    def request(self, method: str, url: str, body: bytes = None, headers: dict = None) -> int:
+        u = urllib.parse.urlsplit(url)
+        key = (u.scheme, u.netloc)
+        path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        for attempt in range(2):  # 2e essai si la connexion gardée a été fermée côté serveur
+            conn = self._conns.get(key)
+            if conn is None:
+                cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+                conn = self._conns[key] = cls(u.netloc, timeout=self.timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._conns.pop(key, None)
+                if attempt == 1:
+                    raise
+                continue
+            if resp.status >= 400:
+                raise IOError(f"HTTP {resp.status}")
+            return resp.status
+
+class _WebhookDispatcher:
+    """File bornée + thread de fond : le trading n'attend jamais les notifications."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.q = queue.Queue(maxsize=max(WEBHOOK_QUEUE_MAX, 1))
+        self.http = _HttpPool()
+        self._pending = []          # événements *_dry en attente de digest
+        self._pending_since = 0.0
+        self._flush_now = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._state_lock = threading.Lock()  # cohérence file / drapeau idle
+        self._thread = threading.Thread(target=self._run, name="webhook", daemon=True)
+        self._thread.start()
+
+    def submit(self, event: str, payload: dict):
+        try:
+            with self._state_lock:
+                self._idle.clear()
+                self.q.put_nowait((event, payload))
+            metrics.inc("bot_webhook_events_total", event=event, status="queued")
+        except queue.Full:
+            metrics.inc("bot_webhook_events_total", event=event, status="dropped")
+            log.warning(f"[WEBHOOK] File pleine, événement {event} abandonné")
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Envoie tout ce qui est en attente (digest compris) ; attend au plus `timeout`."""
+        self._flush_now.set()
+        ok = self._idle.wait(timeout)
+        if not ok:
+            log.warning(f"[WEBHOOK] Flush incomplet après {timeout}s")
+        return ok
+
+    def _run(self):
+        while True:
+            wait = WEBHOOK_COALESCE_SEC if self._pending else 0.5
+            try:
+                event, payload = self.q.get(timeout=wait)
+                if event in COALESCE_EVENTS:
+                    if not self._pending:
+                        self._pending_since = time.time()
+                    self._pending.append({"event": event, **payload})
+                else:
+                    self._deliver(event, payload)
+            except queue.Empty:
+                pass
+            expired = self._pending and (time.time() - self._pending_since) >= WEBHOOK_COALESCE_SEC
+            if self._pending and (expired or (self._flush_now.is_set() and self.q.empty())):
+                self._send_pending()
+            with self._state_lock:
+                if self.q.empty() and not self._pending:
+                    self._flush_now.clear()
+                    self._idle.set()
+
+    def _send_pending(self):
+        events, self._pending = self._pending, []
+        if len(events) == 1:
+            e = dict(events[0])
+            self._deliver(e.pop("event"), e)
+        else:
+            self._deliver("digest", {"emoji": "🧾", "count": len(events), "events": events,
+                                     "ts": int(time.time())})
+
+    def _deliver(self, event: str, payload: dict):
+        for i in range(max(WEBHOOK_RETRIES, 1)):
+            try:
+                with metrics.timed("bot_webhook_seconds", event=event):
+                    _post_webhook(self.http, self.url, event, payload)
+                metrics.inc("bot_webhook_events_total", event=event, status="sent")
+                return
+            except Exception as e:
+                wait = 0.5 * (2 ** i)
+                log.warning(f"[WEBHOOK] Echec envoi {event} ({i+1}/{WEBHOOK_RETRIES}): {e} (pause {wait}s)")
+                time.sleep(wait)
+        metrics.inc("bot_webhook_events_total", event=event, status="failed")
+        log.warning(f"[WEBHOOK] Abandon {event}")
+
+def _post_webhook(http_pool: _HttpPool, url: str, event: str, payload: dict):
+    """Envoi JSON brut + message texte formaté (Telegram si URL Bot API)."""
+    # Envoi JSON brut (API webhook type REST/Zapier/Render logs)
+    data = json.dumps({"event": event, **payload}).encode("utf-8")
+    http_pool.request("POST", url, body=data, headers={"Content-Type": "application/json"})
+    log.info(f"[WEBHOOK] {event} JSON envoyé")
+
+    # Envoi texte formaté (Telegram Bot API si URL correspond)
+    text_msg = format_message(event, payload)
+    if "api.telegram.org" in url:  # cas Telegram direct
+        send_telegram_message(url, text_msg, http_pool)
+    else:
+        log.info(f"[WEBHOOK] Message formaté: {text_msg}")
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def _get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = _WebhookDispatcher(WEBHOOK_URL)
+        return _dispatcher
+
 def send_webhook(event: str, payload: dict):
-    """Envoie un webhook JSON et aussi un message texte ergonomique (Telegram-ready)."""
+    """Met en file un webhook JSON + message texte (Telegram-ready). Ne bloque jamais."""
     if not WEBHOOK_URL:
         return
-    try:
-        # Envoi JSON brut (API webhook type REST/Zapier/Render logs)
-        data = json.dumps({"event": event, **payload}).encode("utf-8")
-        req = _req.Request(WEBHOOK_URL, data=data, headers={"Content-Type": "application/json"})
-        _req.urlopen(req, timeout=5).read()
-        log.info(f"[WEBHOOK] {event} JSON envoyé")
-
-        # Envoi texte formaté (Telegram Bot API si URL correspond)
-        text_msg = format_message(event, payload)
-        if "api.telegram.org" in WEBHOOK_URL:  # cas Telegram direct
-            send_telegram_message(WEBHOOK_URL, text_msg)
-        else:
-            log.info(f"[WEBHOOK] Message formaté: {text_msg}")
+    _get_dispatcher().submit(event, payload)
 
-    except Exception as e:
-        log.warning(f"[WEBHOOK] Echec envoi: {e}")
+def flush_webhooks(timeout: float = 5.0) -> bool:
+    """Vide la file de notifications (à appeler avant une sortie : watchdog, crash)."""
+    if _dispatcher is None:
+        return True
+    return _dispatcher.flush(timeout)
+
+atexit.register(flush_webhooks)
 
-def send_telegram_message(base_url: str, text: str):
+def send_telegram_message(base_url: str, text: str, http_pool: _HttpPool = None):
     """Envoi direct Telegram si WEBHOOK_URL est déjà un endpoint Bot API."""
     try:
         url = f"{base_url}?{urllib.parse.urlencode({'text': text, 'parse_mode': 'Markdown'})}"
-        _req.urlopen(url, timeout=5).read()
+        (http_pool or _HttpPool()).request("GET", url)
         log.info("[TELEGRAM] Message envoyé")
     except Exception as e:
         log.warning(f"[TELEGRAM] Echec: {e}")
@@ -0,0 +1,131 @@
+# warm_state.py
+# -*- coding: utf-8 -*-
+"""
+Snapshot binaire de l'état runtime pour un redémarrage à chaud (crash, watchdog, déploiement).
+
+- Contenu : queues OHLCV du cache (ts int64 + OHLCV float64 en tableaux NumPy), moteurs
+  d'indicateurs amorcés (indicators._ENGINES), prochaines frontières de l'ordonnanceur et
+  compteurs trades_per_candle. Les positions restent dans STATE_FILE (state.py), les marchés
+  dans MARKETS_CACHE_FILE (markets_cache.py).
+- Écriture pickle atomique (tmp + os.replace) au plus une fois par WARM_SNAPSHOT_SEC, en fin de cycle.
+- Fichier lié au process : STATE_FILE + ".warm" par défaut (un par shard), identifiant de
+  l'exchange et empreinte de PAIRS_CFG stockés dans le snapshot.
+- Au démarrage : snapshot plus vieux que WARM_SNAPSHOT_MAX_AGE_SEC, illisible, de version
+  différente, d'un autre exchange (ex. run simulé) ou d'un autre PAIRS_CFG → démarrage à froid.
+  Sinon le cache est réhydraté : le premier cycle ne télécharge que le delta (fetch `since`,
+  cf. OHLCVCache.get) et les moteurs se recalent en O(1) ; une frontière échue pendant l'arrêt
+  est traitée immédiatement (CandleScheduler.restore).
+"""
+import hashlib
+import logging
+import os
+import pickle
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from config import WARM_SNAPSHOT_FILE, WARM_SNAPSHOT_SEC, WARM_SNAPSHOT_MAX_AGE_SEC
+from utils import format_pair_cfg
+import indicators
+
+log = logging.getLogger("bot")
+
+VERSION = 1
+
+
+def _pack_rows(rows) -> tuple:
+    arr = np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+    return arr[:, 0].astype(np.int64), np.ascontiguousarray(arr[:, 1:])
+
+
+def _unpack_rows(packed: tuple) -> list:
+    ts, vals = packed
+    return [[t, *v] for t, v in zip(ts.tolist(), vals.tolist())]
+
+
+def pairs_fingerprint(cfg_list) -> str:
+    return hashlib.sha1("".join(format_pair_cfg(c) for c in cfg_list).encode()).hexdigest()
+
+
+class WarmSnapshot:
+    def __init__(self, exchange_id: str, cfg_list, path: str = WARM_SNAPSHOT_FILE,
+                 every_sec: float = WARM_SNAPSHOT_SEC, max_age_sec: float = WARM_SNAPSHOT_MAX_AGE_SEC):
+        self.exchange_id = str(exchange_id)
+        self.pairs = pairs_fingerprint(cfg_list)
+        self.path = path
+        self.every_sec = float(every_sec)
+        self.max_age_sec = float(max_age_sec)
+        self.saved_at = 0.0
+
+    # ---------- Écriture ----------
+    def save(self, ohlcv_cache, sched, trades_per_candle: dict):
+        if not self.path:
+            return
+        t0 = time.perf_counter()
+        payload = {
+            "version": VERSION,
+            "created": time.time(),
+            "exchange": self.exchange_id,
+            "pairs": self.pairs,
+            "ohlcv": {k: _pack_rows(rows) for k, rows in ohlcv_cache.export().items() if rows},
+            "engines": indicators.export_engines(),
+            "sched": sched.export(),
+            "trades_per_candle": dict(trades_per_candle),
+        }
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self.saved_at = payload["created"]
+        log.debug("[WARM] Snapshot %d séries / %d moteurs en %.1fms", len(payload["ohlcv"]),
+                  len(payload["engines"]), (time.perf_counter() - t0) * 1000)
+
+    def maybe_save(self, ohlcv_cache, sched, trades_per_candle: dict):
+        """Écrit le snapshot si WARM_SNAPSHOT_SEC est écoulé (appelé en fin de cycle)."""
+        if not self.path or time.time() - self.saved_at < self.every_sec:
+            return
+        try:
+            self.save(ohlcv_cache, sched, trades_per_candle)
+        except Exception as e:
+            self.saved_at = time.time()  # pas de nouvel essai avant la période suivante
+            log.warning(f"[WARM] Snapshot KO ({self.path}): {e}")
+
+    # ---------- Lecture ----------
+    def _read(self) -> Optional[dict]:
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning(f"[WARM] Snapshot illisible ({self.path}): {e}")
+            return None
+        if not isinstance(data, dict) or data.get("version") != VERSION:
+            return None
+        if data.get("exchange") != self.exchange_id or data.get("pairs") != self.pairs:
+            log.info(f"[WARM] Snapshot d'un autre exchange ({data.get('exchange')}) ou PAIRS_CFG : démarrage à froid")
+            return None
+        age = time.time() - float(data.get("created", 0))
+        if age > self.max_age_sec:
+            log.info(f"[WARM] Snapshot trop ancien ({age:.0f}s > {self.max_age_sec:.0f}s) : démarrage à froid")
+            return None
+        return data
+
+    def restore(self, ohlcv_cache, sched) -> Dict[tuple, int]:
+        """Réhydrate cache OHLCV, moteurs et ordonnanceur ; renvoie trades_per_candle ({} si à froid)."""
+        if not self.path:
+            return {}
+        data = self._read()
+        if data is None:
+            return {}
+        ohlcv_cache.load({k: _unpack_rows(p) for k, p in data["ohlcv"].items()})
+        indicators.load_engines(data["engines"])
+        caught = sched.restore(data["sched"])
+        self.saved_at = float(data["created"])
+        log.info(f"[WARM] Redémarrage à chaud : {len(data['ohlcv'])} séries OHLCV, {len(data['engines'])} moteurs, "
+                 f"{caught} bougie(s) échue(s) à rattraper (snapshot de {time.time() - self.saved_at:.0f}s)")
+        return dict(data["trades_per_candle"])